@@ -4,8 +4,13 @@ import os
 from werkzeug.utils import secure_filename
 from dog2 import DogClassifier  # 导入封装好的分类器
 from food import FeedingSystem  # 导入喂食系统
+from dog_index import DogEmbeddingIndex, IVFDogEmbeddingIndex  # 狗狗个体识别索引
+from frame_stream import FrameSampler, read_length_prefixed_frames, smooth_probabilities  # 视频帧流处理
 import datetime
 import json
+import io
+import numpy as np
+from PIL import Image
 
 # 初始化Flask应用
 app = Flask(__name__)
@@ -17,6 +22,16 @@ classifier = DogClassifier.get_instance()
 # 初始化喂食系统 - 使用SQLite数据库存储数据
 feeding_system = FeedingSystem(num_breeds=100, db_path="data/dog_data.db")
 
+# 已注册狗狗照片的特征索引（用于识别具体是哪只狗）
+DOG_INDEX_PATH = "data/dog_embeddings.npz"
+DOG_INDEX_CLASS = IVFDogEmbeddingIndex if os.environ.get("DOG_INDEX_IVF", "0") == "1" else DogEmbeddingIndex
+DOG_MATCH_THRESHOLD = 0.85  # 余弦相似度达到该值才认为是同一只狗
+dog_index = DOG_INDEX_CLASS.load(DOG_INDEX_PATH)
+
+# 多帧识别配置
+STREAM_BATCH_SIZE = 16  # 每次连拍最多送入模型的帧数（一次批量推理）
+STREAM_SMOOTHING_ALPHA = 0.5  # 时间平滑系数，越大越偏向最近的帧
+
 # 配置文件上传
 UPLOAD_FOLDER = 'temp_uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
@@ -62,6 +77,23 @@ def get_breed_id_from_prediction(breed_name):
     return BREED_NAME_TO_ID.get(breed_name, 1)
 
 
+def enroll_dog_photo(dog_id, embedding):
+    """登记狗狗照片特征并持久化索引"""
+    dog_index.add(dog_id, embedding)
+    dog_index.save(DOG_INDEX_PATH)
+
+
+def match_registered_dog(embedding):
+    """在已注册狗狗中查找最相似的一只，返回 (dog_id, 相似度)，未找到返回 (None, 相似度或None)"""
+    matches = dog_index.search(embedding, k=1)
+    if not matches:
+        return None, None
+    best = matches[0]
+    if best["score"] < DOG_MATCH_THRESHOLD:
+        return None, best["score"]
+    return best["dog_id"], best["score"]
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -112,8 +144,8 @@ def predict():
         # 保存文件
         file.save(save_path)
 
-        # 执行预测
-        result = classifier.predict(save_path)
+        # 执行预测（同时获取前3个品种和特征向量）
+        result = classifier.predict(save_path, top_k=3, return_embedding=True)
 
         # 清理临时文件
         if os.path.exists(save_path):
@@ -130,14 +162,19 @@ def predict():
         # 获取品种ID
         breed_id = get_breed_id_from_prediction(result['class'])
         
-        # 查找是否有已注册的该品种的狗狗
-        dog_id = None
-        dogs_info = feeding_system.get_all_dogs()
-        if dogs_info['status'] == 'success':
-            for dog in dogs_info['dogs']:
-                if dog['breed'] == breed_id:
-                    dog_id = dog['dog_id']
-                    break
+        # 优先通过照片特征识别具体是哪只已注册的狗狗
+        dog_id, match_score = match_registered_dog(result['embedding'])
+        identified_by = "embedding" if dog_id is not None else None
+
+        # 特征未匹配时，退化为查找已注册的该品种的狗狗
+        if dog_id is None:
+            dogs_info = feeding_system.get_all_dogs()
+            if dogs_info['status'] == 'success':
+                for dog in dogs_info['dogs']:
+                    if dog['breed'] == breed_id:
+                        dog_id = dog['dog_id']
+                        identified_by = "breed"
+                        break
                 
         # 更新当前识别的狗狗信息
         update_current_dog(
@@ -153,8 +190,11 @@ def predict():
                 "prediction": result['class'],
                 "confidence": result['confidence'],
                 "breed_id": breed_id,
+                "top_k": result['top_k'],
                 "current_dog": CURRENT_DOG,
-                "has_registered_dog": dog_id is not None
+                "has_registered_dog": dog_id is not None,
+                "identified_by": identified_by,
+                "match_score": match_score
             }
         })
 
@@ -170,6 +210,107 @@ def predict():
         }), 500
 
 
+@app.route('/predict/stream', methods=['POST'])
+def predict_stream():
+    """多帧识别接口
+
+    支持两种上传方式：
+    1. multipart/form-data，多个名为 frames 的JPEG文件
+    2. chunked二进制流，每帧为 4字节大端长度 + JPEG字节
+    可选查询参数 stride（采样步长）
+    """
+    try:
+        stride = request.args.get('stride', 1, type=int)
+        sampler = FrameSampler(stride=stride)
+
+        uploaded = request.files.getlist('frames')
+        if uploaded:
+            for file in uploaded:
+                sampler.add(file.read())
+        else:
+            for frame in read_length_prefixed_frames(request.stream):
+                sampler.add(frame)
+
+        if not sampler.frames:
+            return jsonify({
+                "code": 400,
+                "status": "error",
+                "error": "未收到有效的图片帧"
+            }), 400
+
+        selected = sampler.select(STREAM_BATCH_SIZE)
+        images = [Image.open(io.BytesIO(frame)) for frame in selected]
+        probs, embeddings = classifier.predict_frames(images)
+
+        # 时间平滑后的品种判断
+        smoothed = smooth_probabilities(probs, STREAM_SMOOTHING_ALPHA)
+        best = int(np.argmax(smoothed))
+        prediction = classifier.class_names[best]
+        confidence = round(float(smoothed[best]), 4)
+        votes = np.bincount(np.argmax(probs, axis=1), minlength=len(classifier.class_names))
+
+        top_idx = np.argsort(-smoothed)[:3]
+        top_k = [
+            {"class": classifier.class_names[i], "confidence": round(float(smoothed[i]), 4)}
+            for i in top_idx
+        ]
+
+        breed_id = get_breed_id_from_prediction(prediction)
+
+        # 用多帧平均特征识别具体是哪只狗
+        dog_id, match_score = match_registered_dog(embeddings.mean(axis=0))
+        identified_by = "embedding" if dog_id is not None else None
+        if dog_id is None:
+            dogs_info = feeding_system.get_all_dogs()
+            if dogs_info['status'] == 'success':
+                for dog in dogs_info['dogs']:
+                    if dog['breed'] == breed_id:
+                        dog_id = dog['dog_id']
+                        identified_by = "breed"
+                        break
+
+        classifier.db.save_prediction(f"stream:{sampler.received}frames", prediction, confidence)
+
+        update_current_dog(
+            dog_id=dog_id,
+            breed_id=breed_id,
+            breed_name=prediction
+        )
+
+        return jsonify({
+            "code": 200,
+            "status": "success",
+            "data": {
+                "prediction": prediction,
+                "confidence": confidence,
+                "vote_ratio": round(float(votes[best]) / len(selected), 4),
+                "breed_id": breed_id,
+                "top_k": top_k,
+                "frames_received": sampler.received,
+                "frames_duplicate": sampler.duplicates,
+                "frames_invalid": sampler.invalid,
+                "frames_used": len(selected),
+                "current_dog": CURRENT_DOG,
+                "has_registered_dog": dog_id is not None,
+                "identified_by": identified_by,
+                "match_score": match_score
+            }
+        })
+
+    except ValueError as e:
+        return jsonify({
+            "code": 400,
+            "status": "error",
+            "error": f"帧数据格式错误: {str(e)}"
+        }), 400
+    except Exception as e:
+        return jsonify({
+            "code": 500,
+            "status": "error",
+            "error": f"服务器内部错误: {str(e)}"
+        }), 500
+
+
 @app.route('/predict_and_register', methods=['POST'])
 def predict_and_register():
     """识别狗品种并直接注册"""
@@ -228,7 +369,7 @@ def predict_and_register():
         file.save(save_path)
 
         # 执行预测
-        result = classifier.predict(save_path)
+        result = classifier.predict(save_path, return_embedding=True)
 
         # 清理临时文件
         if os.path.exists(save_path):
@@ -254,6 +395,10 @@ def predict_and_register():
             # 注册狗狗
             register_result = feeding_system.register_dog(dog_id, breed_id, age, weight)
             
+            # 登记照片特征，之后可以通过照片识别这只狗
+            if register_result['status'] == 'success':
+                enroll_dog_photo(dog_id, result['embedding'])
+            
             # 更新当前识别的狗狗信息
             update_current_dog(
                 dog_id=dog_id,
@@ -294,6 +439,79 @@ def predict_and_register():
         }), 500
 
 
+@app.route('/dog/photo', methods=['POST'])
+def register_dog_photo():
+    """为已注册的狗狗登记照片，用于个体识别"""
+    try:
+        if 'dog_id' not in request.form:
+            return jsonify({
+                "code": 400,
+                "status": "error",
+                "message": "缺少必要字段: dog_id"
+            }), 400
+
+        if 'image' not in request.files or request.files['image'].filename == '':
+            return jsonify({
+                "code": 400,
+                "status": "error",
+                "message": "未上传图片文件"
+            }), 400
+
+        file = request.files['image']
+        if not allowed_file(file.filename):
+            return jsonify({
+                "code": 415,
+                "status": "error",
+                "message": f"不支持的文件类型，仅支持 {ALLOWED_EXTENSIONS}"
+            }), 415
+
+        dog_id = request.form['dog_id']
+        profile = feeding_system.get_dog_profile(dog_id)
+        if profile['status'] != 'success':
+            return jsonify({
+                "code": 404,
+                "status": "error",
+                "message": f"未找到狗狗ID: {dog_id}"
+            }), 404
+
+        filename = secure_filename(file.filename)
+        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(save_path)
+
+        result = classifier.predict(save_path, return_embedding=True)
+
+        if os.path.exists(save_path):
+            os.remove(save_path)
+
+        if result['status'] == 'error':
+            return jsonify({
+                "code": 500,
+                "status": "error",
+                "message": result['error']
+            }), 500
+
+        enroll_dog_photo(dog_id, result['embedding'])
+
+        return jsonify({
+            "code": 200,
+            "status": "success",
+            "data": {
+                "dog_id": dog_id,
+                "photo_count": dog_index.ids.count(dog_id)
+            }
+        })
+
+    except Exception as e:
+        if 'save_path' in locals() and os.path.exists(save_path):
+            os.remove(save_path)
+
+        return jsonify({
+            "code": 500,
+            "status": "error",
+            "message": f"服务器内部错误: {str(e)}"
+        }), 500
+
+
 @app.route('/dog/register', methods=['POST'])
 def register_dog():
     """注册新狗狗"""
@@ -0,0 +1,262 @@
+"""
+狗狗识别推理性能基准测试
+
+对各分类器后端在固定图片集上测量不同批大小、线程数下的
+p50/p95/p99延迟、吞吐量和进程峰值内存，输出JSON和Markdown报告。
+
+示例:
+    # 使用合成图片和随机权重（适合CI），检查p95延迟SLO
+    python benchmark.py --synthetic 32 --batch-sizes 1 8 --threads 1 4 --slo-p95-ms 200
+
+    # 使用真实模型和图片目录
+    python benchmark.py --backends dog2 breed --images data/bench --output reports/bench
+
+在pytest-benchmark中使用（见 test_benchmark.py）:
+    pip install pytest-benchmark
+    python -m pytest test_benchmark.py --benchmark-json reports/bench.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+
+BASE_DIR = Path(__file__).resolve().parent
+DJANGO_PROJECT_DIR = BASE_DIR.parent / "end"
+SYNTHETIC_CLASSES = [f"breed_{i}" for i in range(12)]
+
+
+# --------------- 测试图片集 ---------------
+def synthetic_corpus(directory, count, size=(640, 480), seed=0):
+    """生成确定性的合成JPEG图片（噪声背景+色块），同样的参数总是生成同样的图片"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        x, y = rng.integers(0, size[0] // 2), rng.integers(0, size[1] // 2)
+        pixels[y:y + size[1] // 3, x:x + size[0] // 3] = rng.integers(0, 256, size=3, dtype=np.uint8)
+        path = directory / f"synthetic_{i:04d}.jpg"
+        Image.fromarray(pixels).save(path, "JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def image_corpus(directory):
+    """读取目录中的图片（按文件名排序保证顺序固定）"""
+    return sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+
+
+def write_synthetic_model(models_dir):
+    """写入随机权重的模型文件和类别名称，结构与训练产物一致"""
+    from dog2 import DogClassifierModel
+    models_dir = Path(models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+    torch.manual_seed(0)
+    model = DogClassifierModel(len(SYNTHETIC_CLASSES), pretrained=False)
+    torch.save(model.state_dict(), models_dir / "resnet18_dog_classifier.pth")
+    (models_dir / "class_names.txt").write_text("\n".join(SYNTHETIC_CLASSES), encoding="utf-8")
+
+
+# --------------- 分类器后端 ---------------
+class Backend:
+    """基准测试后端：predict_batch接收图片路径列表"""
+    name = None
+    supports_batch = False
+
+    def predict_batch(self, paths):
+        raise NotImplementedError
+
+
+class Dog2Backend(Backend):
+    """dog2.DogClassifier（Flask服务使用）"""
+    name = "dog2"
+    supports_batch = True
+
+    def __init__(self):
+        from dog2 import DogClassifier
+        self.classifier = DogClassifier()
+
+    def predict_batch(self, paths):
+        # 所有批大小都走同一条只做推理的路径；predict()还会把识别记录写入SQLite，结果不可比
+        self.classifier.predict_frames([Image.open(p) for p in paths])
+
+
+class BreedBackend(Backend):
+    """dogs.breed_classifier.DogBreedClassifier（Django服务使用）"""
+    name = "breed"
+
+    def __init__(self, workdir):
+        from django.conf import settings
+        if not settings.configured:
+            settings.configure(BASE_DIR=Path(workdir))
+        sys.path.insert(0, str(DJANGO_PROJECT_DIR))
+        from dogs.breed_classifier import DogBreedClassifier
+        self.classifier = DogBreedClassifier()
+
+    def predict_batch(self, paths):
+        for path in paths:
+            self.classifier.predict(str(path))
+
+
+BACKENDS = {
+    "dog2": lambda workdir: Dog2Backend(),
+    "breed": lambda workdir: BreedBackend(workdir),
+}
+
+
+def load_backend(name, workdir, synthetic=False):
+    """在workdir下加载后端（两个分类器都按相对/项目目录下的models/读取模型）"""
+    workdir = Path(workdir)
+    if synthetic and not (workdir / "models" / "resnet18_dog_classifier.pth").exists():
+        write_synthetic_model(workdir / "models")
+    os.chdir(workdir)
+    return BACKENDS[name](workdir)
+
+
+# --------------- 测量 ---------------
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(backend, images, batch_size, threads, iterations, warmup):
+    """测量单个(后端, 批大小, 线程数)组合，返回结果字典"""
+    torch.set_num_threads(threads)
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    batches = [b for b in batches if len(b) == batch_size] or [images[:batch_size]]
+
+    for i in range(warmup):
+        backend.predict_batch(batches[i % len(batches)])
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        backend.predict_batch(batches[i % len(batches)])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "backend": backend.name,
+        "batch_size": batch_size,
+        "threads": threads,
+        "iterations": iterations,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "throughput_ips": round(iterations * batch_size / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def pytest_benchmark_case(benchmark, backend, images, batch_size=1):
+    """供pytest-benchmark使用：由benchmark夹具负责计时和统计"""
+    batch = list(images[:batch_size])
+    benchmark.extra_info.update({"backend": backend.name, "batch_size": batch_size})
+    benchmark(backend.predict_batch, batch)
+
+
+# --------------- 报告 ---------------
+def check_slo(results, slo_p95_ms):
+    for result in results:
+        result["slo_p95_ms"] = slo_p95_ms
+        result["slo_ok"] = slo_p95_ms is None or result["p95_ms"] <= slo_p95_ms
+    return all(r["slo_ok"] for r in results)
+
+
+def to_markdown(report):
+    lines = [
+        "# 推理性能基准报告",
+        "",
+        f"- 时间: {report['timestamp']}",
+        f"- 图片数: {report['images']} ({report['corpus']})",
+        f"- torch: {report['torch']} | 设备: {report['device']}",
+        "",
+        "| 后端 | 批大小 | 线程 | p50 (ms) | p95 (ms) | p99 (ms) | 吞吐 (张/秒) | 峰值内存 (MB) | SLO |",
+        "|---|---|---|---|---|---|---|---|---|",
+    ]
+    for r in report["results"]:
+        slo = "-" if r["slo_p95_ms"] is None else ("✅" if r["slo_ok"] else "❌")
+        lines.append(
+            f"| {r['backend']} | {r['batch_size']} | {r['threads']} | {r['p50_ms']} | {r['p95_ms']} "
+            f"| {r['p99_ms']} | {r['throughput_ips']} | {r['peak_rss_mb']} | {slo} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="狗狗识别推理性能基准测试")
+    parser.add_argument("--backends", nargs="+", default=["dog2"], choices=sorted(BACKENDS))
+    parser.add_argument("--images", help="图片目录（固定测试集）")
+    parser.add_argument("--synthetic", type=int, default=0, help="生成N张合成图片并使用随机权重模型")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, torch.get_num_threads()])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--slo-p95-ms", type=float, help="p95延迟上限，超出时返回非零退出码")
+    parser.add_argument("--output", default="benchmark_report", help="报告文件前缀（生成.json和.md）")
+    args = parser.parse_args(argv)
+
+    if not args.images and not args.synthetic:
+        parser.error("需要指定 --images 或 --synthetic")
+
+    output = Path(args.output).resolve()
+    sys.path.insert(0, str(BASE_DIR))
+    workdir = Path(tempfile.mkdtemp(prefix="dog_bench_")) if args.synthetic else Path.cwd()
+    if args.synthetic:
+        images = synthetic_corpus(workdir / "images", args.synthetic)
+        corpus = f"synthetic:{args.synthetic}"
+    else:
+        images = [p.resolve() for p in image_corpus(args.images)]
+        corpus = str(args.images)
+    if not images:
+        parser.error("图片集为空")
+
+    results = []
+    for name in args.backends:
+        backend = load_backend(name, workdir, synthetic=bool(args.synthetic))
+        for threads in args.threads:
+            for batch_size in args.batch_sizes:
+                if batch_size > 1 and not backend.supports_batch:
+                    print(f"跳过 {name} batch={batch_size}（后端不支持批量推理）")
+                    continue
+                result = run_case(backend, images, batch_size, threads, args.iterations, args.warmup)
+                print(f"{name} batch={batch_size} threads={threads}: "
+                      f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms "
+                      f"{result['throughput_ips']}张/秒")
+                results.append(result)
+
+    slo_ok = check_slo(results, args.slo_p95_ms)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "corpus": corpus,
+        "images": len(images),
+        "torch": torch.__version__,
+        "device": str(__import__("dog2").device),
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.with_suffix(".json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    output.with_suffix(".md").write_text(to_markdown(report), encoding="utf-8")
+    print(f"报告已保存: {output.with_suffix('.json')} / {output.with_suffix('.md')}")
+    return 0 if slo_ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,15 +3,30 @@ import torch
 import multiprocessing
 import sqlite3
 import datetime
+import threading
+import atexit
+import time
 from pathlib import Path
 from torch import nn
 from PIL import Image
 from torchvision import datasets, transforms, models
 from torch.utils.data import DataLoader
 from timeit import default_timer as timer
+from contextlib import nullcontext
 # 设备自动选择
 device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
 
+# 可选的推理/训练加速模式（通过环境变量开启）
+USE_BF16 = os.environ.get("DOG_BF16", "0") == "1"
+CHANNELS_LAST = os.environ.get("DOG_CHANNELS_LAST", "0") == "1"
+
+
+def bf16_autocast(enabled):
+    """CPU上的bfloat16混合精度上下文（仅在CPU设备且启用时生效）"""
+    if enabled and device.type == "cpu":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
 
 # --------------- SQLite数据库管理 ---------------
 class DogDB:
@@ -22,6 +37,7 @@ class DogDB:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(exist_ok=True)
         self.conn = None
+        self.version = 0  # 模型元数据版本号，模型信息变更时自增
         self.connect()
         self.create_tables()
     
@@ -91,11 +107,24 @@ class DogDB:
                 train_loss REAL NOT NULL,
                 train_accuracy REAL NOT NULL,
                 test_accuracy REAL NOT NULL,
+                precision TEXT DEFAULT 'fp32',
+                fp32_test_accuracy REAL,
+                accuracy_delta REAL,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (model_id) REFERENCES models (id)
             )
             ''')
             
+            # 兼容旧数据库：补充混合精度相关字段
+            existing_columns = {row['name'] for row in cursor.execute("PRAGMA table_info(training_records)")}
+            for column, definition in (
+                ("precision", "TEXT DEFAULT 'fp32'"),
+                ("fp32_test_accuracy", "REAL"),
+                ("accuracy_delta", "REAL"),
+            ):
+                if column not in existing_columns:
+                    cursor.execute(f"ALTER TABLE training_records ADD COLUMN {column} {definition}")
+            
             self.conn.commit()
             print("数据库表结构创建成功")
             return True
@@ -139,6 +168,7 @@ class DogDB:
                     "INSERT INTO class_names (model_id, class_id, class_name) VALUES (?, ?, ?)",
                     (model_id, i, class_name)
                 )
+            self.version += 1
             
             print(f"模型信息已保存到数据库, ID: {model_id}")
             return model_id
@@ -158,12 +188,15 @@ class DogDB:
             print(f"保存预测记录失败: {e}")
             return False
     
-    def save_training_record(self, model_id, epoch, train_loss, train_accuracy, test_accuracy):
-        """保存训练记录"""
+    def save_training_record(self, model_id, epoch, train_loss, train_accuracy, test_accuracy,
+                             precision="fp32", fp32_test_accuracy=None, accuracy_delta=None):
+        """保存训练记录（混合精度训练时同时记录与FP32评估的准确率差值）"""
         try:
             self.execute(
-                "INSERT INTO training_records (model_id, epoch, train_loss, train_accuracy, test_accuracy) VALUES (?, ?, ?, ?, ?)",
-                (model_id, epoch, train_loss, train_accuracy, test_accuracy)
+                "INSERT INTO training_records (model_id, epoch, train_loss, train_accuracy, test_accuracy, "
+                "precision, fp32_test_accuracy, accuracy_delta) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (model_id, epoch, train_loss, train_accuracy, test_accuracy,
+                 precision, fp32_test_accuracy, accuracy_delta)
             )
             return True
         except Exception as e:
@@ -204,6 +237,21 @@ class DogDB:
             print(f"获取最新模型ID失败: {e}")
             return None
     
+    def update_models_usage(self, usage):
+        """批量更新模型最后使用时间，usage为 {model_id: 使用时间}"""
+        if not usage:
+            return True
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE models SET last_used = ? WHERE id = ?",
+                    [(used_at, model_id) for model_id, used_at in usage.items()]
+                )
+            return True
+        except sqlite3.Error as e:
+            print(f"批量更新模型使用时间失败: {e}")
+            return False
+
     def update_model_usage(self, model_id):
         """更新模型最后使用时间"""
         try:
@@ -223,12 +271,79 @@ class DogDB:
             self.conn = None
 
 
+# --------------- 模型元数据缓存 ---------------
+class ModelRegistry:
+    """进程内缓存最新模型ID和类别名称，DogDB.version变化时重新加载；
+    last_used的更新累积在内存中，由后台线程批量写回数据库"""
+    _instance = None
+    FLUSH_INTERVAL = 5.0  # 秒
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._latest_model_id = None
+        self._class_names = {}
+        self._pending_usage = {}
+        self._flush_thread = None
+        atexit.register(self.flush)
+
+    @classmethod
+    def get_instance(cls, db=None):
+        """单例模式获取注册表实例"""
+        if cls._instance is None:
+            cls._instance = cls(db or DogDB.get_instance())
+        return cls._instance
+
+    def _check_version(self):
+        if self._loaded_version != self.db.version:
+            self._latest_model_id = self.db.get_latest_model_id()
+            self._class_names.clear()
+            self._loaded_version = self.db.version
+
+    def get_latest_model_id(self):
+        """获取最新的模型ID（缓存）"""
+        with self._lock:
+            self._check_version()
+            return self._latest_model_id
+
+    def get_class_names(self, model_id):
+        """获取指定模型的类别名称（缓存）"""
+        with self._lock:
+            self._check_version()
+            if model_id not in self._class_names:
+                self._class_names[model_id] = self.db.get_class_names(model_id)
+            return list(self._class_names[model_id])
+
+    def touch(self, model_id):
+        """记录模型使用，稍后批量写回数据库"""
+        if model_id is None:
+            return
+        with self._lock:
+            self._pending_usage[model_id] = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flush_thread.start()
+
+    def flush(self):
+        """写回累积的模型使用时间"""
+        with self._lock:
+            pending, self._pending_usage = self._pending_usage, {}
+        if pending and self.db.conn:
+            self.db.update_models_usage(pending)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            self.flush()
+
+
 # --------------- 模型定义 ---------------
 class DogClassifierModel(nn.Module):
-    def __init__(self, num_classes):
+    def __init__(self, num_classes, pretrained=True):
         super().__init__()
-        # 加载预训练的ResNet18
-        self.resnet = models.resnet18(pretrained=True)
+        # 加载预训练的ResNet18（从已训练的权重文件加载时无需下载预训练权重）
+        self.resnet = models.resnet18(weights=models.ResNet18_Weights.DEFAULT if pretrained else None)
         
         # 冻结大部分层
         for param in list(self.resnet.parameters())[:-4]:
@@ -246,22 +361,35 @@ class DogClassifierModel(nn.Module):
     def forward(self, x):
         return self.resnet(x)
 
+    def forward_with_embedding(self, x):
+        """返回 (logits, 512维特征向量)，特征向量取自ResNet18全局池化层"""
+        r = self.resnet
+        x = r.maxpool(r.relu(r.bn1(r.conv1(x))))
+        x = r.layer4(r.layer3(r.layer2(r.layer1(x))))
+        embedding = torch.flatten(r.avgpool(x), 1)
+        return r.fc(embedding), embedding
+
 # --------------- 训练功能 ---------------
-def calculate_accuracy(model, data_loader, device):
+def calculate_accuracy(model, data_loader, device, use_bf16=False, channels_last=False):
     model.eval()
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
     correct = 0
     total = 0
-    with torch.no_grad():
+    with torch.no_grad(), bf16_autocast(use_bf16):
         for images, labels in data_loader:
-            images, labels = images.to(device), labels.to(device)
+            images, labels = images.to(device, memory_format=memory_format), labels.to(device)
             outputs = model(images)
             _, predicted = torch.max(outputs.data, 1)
             total += labels.size(0)
             correct += (predicted == labels).sum().item()
     return correct / total
 
-def train():
-    """训练入口函数"""
+def train(use_bf16=USE_BF16, channels_last=CHANNELS_LAST):
+    """训练入口函数
+
+    use_bf16: 在CPU上使用torch.autocast(bfloat16)混合精度训练和评估
+    channels_last: 将ResNet18骨干网络和输入转换为channels_last内存布局
+    """
     data_path = Path("data/god")
     model_path = Path("models/resnet18_dog_classifier.pth")
 
@@ -311,6 +439,9 @@ def train():
 
     # 初始化模型
     model = DogClassifierModel(len(train_data.classes)).to(device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
     
     # 使用不同的学习率
     params_to_update = []
@@ -330,6 +461,7 @@ def train():
 
     # 初始化数据库
     db = DogDB.get_instance()
+    registry = ModelRegistry.get_instance(db)
     
     # 训练循环
     best_test_acc = 0.0
@@ -337,6 +469,10 @@ def train():
     patience_counter = 0
     
     print("🚀 开始训练...")
+    if use_bf16:
+        print(f"混合精度: bfloat16 ({'已启用' if device.type == 'cpu' else '仅支持CPU，当前设备忽略'})")
+    if channels_last:
+        print("内存布局: channels_last")
     print(f"训练集样本数: {len(train_data)} | 测试集样本数: {len(test_data)}")
     print("-" * 60)
 
@@ -348,11 +484,13 @@ def train():
 
         # 训练阶段
         for images, labels in train_loader:
-            images, labels = images.to(device), labels.to(device)
+            images = images.to(device, memory_format=memory_format)
+            labels = labels.to(device)
 
             optimizer.zero_grad()
-            outputs = model(images)
-            loss = loss_fn(outputs, labels)
+            with bf16_autocast(use_bf16):
+                outputs = model(images)
+                loss = loss_fn(outputs, labels)
             loss.backward()
             
             # 梯度裁剪
@@ -370,13 +508,21 @@ def train():
         train_acc = correct / total
 
         # 评估阶段
-        test_acc = calculate_accuracy(model, test_loader, device)
+        test_acc = calculate_accuracy(model, test_loader, device, use_bf16, channels_last)
+        precision = "fp32"
+        fp32_test_acc = None
+        accuracy_delta = None
+        if use_bf16 and device.type == "cpu":
+            # 以FP32评估作为基准，记录混合精度带来的准确率差值
+            precision = "bf16"
+            fp32_test_acc = calculate_accuracy(model, test_loader, device, False, channels_last)
+            accuracy_delta = test_acc - fp32_test_acc
         
         # 学习率调整
         scheduler.step(test_acc)
         
         # 保存训练记录到数据库
-        model_id = db.get_latest_model_id()
+        model_id = registry.get_latest_model_id()
         if not model_id:
             # 首次创建模型记录
             model_id = db.save_model_info(
@@ -392,7 +538,10 @@ def train():
             epoch=epoch + 1,
             train_loss=epoch_loss,
             train_accuracy=train_acc,
-            test_accuracy=test_acc
+            test_accuracy=test_acc,
+            precision=precision,
+            fp32_test_accuracy=fp32_test_acc,
+            accuracy_delta=accuracy_delta
         )
 
         # 保存最佳模型
@@ -413,6 +562,8 @@ def train():
         print(f"Epoch {epoch + 1}/50")
         print(f"训练损失: {epoch_loss:.4f} | 训练准确率: {train_acc * 100:.2f}%")
         print(f"测试准确率: {test_acc * 100:.2f}%")
+        if accuracy_delta is not None:
+            print(f"FP32测试准确率: {fp32_test_acc * 100:.2f}% | bf16差值: {accuracy_delta * 100:+.2f}%")
         print("-" * 60)
 
         # 早停检查
@@ -427,16 +578,19 @@ def train():
 class DogClassifier:
     _instance = None
 
-    def __init__(self):
+    def __init__(self, use_bf16=USE_BF16, channels_last=CHANNELS_LAST):
         self.model = None
         self.class_names = []
+        self.use_bf16 = use_bf16
+        self.channels_last = channels_last
         self.db = DogDB.get_instance()
+        self.registry = ModelRegistry.get_instance(self.db)
         self.load_model()
 
     @classmethod
-    def get_instance(cls):
+    def get_instance(cls, use_bf16=USE_BF16, channels_last=CHANNELS_LAST):
         if cls._instance is None:
-            cls._instance = cls()
+            cls._instance = cls(use_bf16=use_bf16, channels_last=channels_last)
         return cls._instance
 
     def load_model(self):
@@ -446,31 +600,35 @@ class DogClassifier:
             raise FileNotFoundError("请先运行训练生成模型文件")
 
         # 优先从文件加载类别名称（兼容传统方式）
+        model_id = self.registry.get_latest_model_id()
         class_names_file = model_path.parent / "class_names.txt"
         if class_names_file.exists():
             with open(class_names_file, encoding='utf-8') as f:
                 self.class_names = f.read().splitlines()
         else:
             # 尝试从数据库加载
-            model_id = self.db.get_latest_model_id()
             if model_id:
-                self.class_names = self.db.get_class_names(model_id)
+                self.class_names = self.registry.get_class_names(model_id)
                 if not self.class_names:
                     raise ValueError("无法从数据库加载类别名称")
             else:
                 raise ValueError("无法找到模型信息")
 
-        self.model = DogClassifierModel(len(self.class_names)).to(device)
+        self.model = DogClassifierModel(len(self.class_names), pretrained=False).to(device)
         self.model.load_state_dict(torch.load(model_path, map_location=device))
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
         self.model.eval()
         
-        # 更新模型使用时间
-        model_id = self.db.get_latest_model_id()
-        if model_id:
-            self.db.update_model_usage(model_id)
+        # 更新模型使用时间（异步批量写回）
+        self.registry.touch(model_id)
 
-    def predict(self, image_path: str) -> dict:
-        """执行单张图片预测"""
+    def predict(self, image_path: str, top_k: int = 1, return_embedding: bool = False) -> dict:
+        """执行单张图片预测
+
+        top_k: 大于1时额外返回前k个品种及置信度（"top_k"字段）
+        return_embedding: 额外返回512维特征向量（"embedding"字段，numpy数组），用于狗狗个体识别
+        """
         try:
             image = Image.open(image_path).convert("RGB")
             transform = transforms.Compose([
@@ -479,9 +637,12 @@ class DogClassifier:
                 transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
             ])
             tensor = transform(image).unsqueeze(0).to(device)
+            if self.channels_last:
+                tensor = tensor.to(memory_format=torch.channels_last)
 
-            with torch.no_grad():
-                preds = torch.nn.functional.softmax(self.model(tensor), dim=1)
+            with torch.no_grad(), bf16_autocast(self.use_bf16):
+                logits, embedding = self.model.forward_with_embedding(tensor)
+            preds = torch.nn.functional.softmax(logits.float(), dim=1)
 
             conf, idx = torch.max(preds, dim=1)
             prediction = self.class_names[idx.item()]
@@ -490,17 +651,45 @@ class DogClassifier:
             # 保存预测结果到数据库
             self.db.save_prediction(image_path, prediction, confidence)
             
-            return {
+            result = {
                 "class": prediction,
                 "confidence": confidence,
                 "status": "success"
             }
+            if top_k > 1:
+                top_probs, top_idx = preds[0].topk(min(top_k, preds.size(1)))
+                result["top_k"] = [
+                    {"class": self.class_names[i], "confidence": round(p, 4)}
+                    for p, i in zip(top_probs.tolist(), top_idx.tolist())
+                ]
+            if return_embedding:
+                result["embedding"] = embedding[0].float().cpu().numpy()
+            return result
         except Exception as e:
             return {
                 "error": str(e),
                 "status": "error"
             }
     
+    def predict_frames(self, images):
+        """批量预测多帧图片（PIL.Image列表），只做一次前向计算
+
+        返回 (概率矩阵 [帧数, 类别数], 特征矩阵 [帧数, 512])，均为numpy数组
+        """
+        transform = transforms.Compose([
+            transforms.Resize((224, 224)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+        batch = torch.stack([transform(image.convert("RGB")) for image in images]).to(device)
+        if self.channels_last:
+            batch = batch.to(memory_format=torch.channels_last)
+
+        with torch.no_grad(), bf16_autocast(self.use_bf16):
+            logits, embeddings = self.model.forward_with_embedding(batch)
+        probs = torch.nn.functional.softmax(logits.float(), dim=1)
+        return probs.cpu().numpy(), embeddings.float().cpu().numpy()
+
     def get_prediction_history(self, limit=10):
         """获取预测历史记录"""
         return self.db.get_prediction_history(limit)
@@ -543,7 +732,8 @@ if __name__ == "__main__":
             for record in history:
                 print(f"- {record['prediction']} (置信度: {record['confidence']}) - {record['timestamp']}")
     
-    # 关闭数据库连接
+    # 写回缓存的模型使用时间并关闭数据库连接
+    ModelRegistry.get_instance(db).flush()
     db.close()
 
 
@@ -0,0 +1,148 @@
+import numpy as np
+from pathlib import Path
+
+
+# --------------- 狗狗特征向量索引 ---------------
+class DogEmbeddingIndex:
+    """暴力检索的狗狗特征索引（余弦相似度），同一只狗可以登记多张照片"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.ids = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def normalize(vectors):
+        """L2归一化，之后内积即为余弦相似度"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, dog_id, embedding):
+        """登记一张照片的特征向量"""
+        vector = self.normalize(embedding)
+        if vector.shape[1] != self.dim:
+            raise ValueError(f"特征维度不匹配: 期望{self.dim}, 实际{vector.shape[1]}")
+        self.vectors = np.vstack([self.vectors, vector])
+        self.ids.extend([dog_id] * len(vector))
+
+    def remove(self, dog_id):
+        """删除某只狗的全部特征向量"""
+        keep = [i for i, existing in enumerate(self.ids) if existing != dog_id]
+        self.vectors = self.vectors[keep]
+        self.ids = [self.ids[i] for i in keep]
+
+    def _scores(self, query):
+        """返回 (候选行号, 相似度)"""
+        return np.arange(len(self.ids)), self.vectors @ query
+
+    def search(self, embedding, k=1):
+        """查找最相似的k只狗，返回 [{"dog_id", "score"}]，按相似度降序"""
+        if not self.ids:
+            return []
+        query = self.normalize(embedding)[0]
+        rows, scores = self._scores(query)
+        if len(rows) == 0:
+            return []
+
+        # 同一只狗可能有多张照片，多取一些候选再按狗去重
+        n = min(len(rows), k * 4)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        seen = set()
+        for i in top:
+            dog_id = self.ids[rows[i]]
+            if dog_id in seen:
+                continue
+            seen.add(dog_id)
+            results.append({"dog_id": dog_id, "score": float(scores[i])})
+            if len(results) >= k:
+                break
+        return results
+
+    def save(self, path):
+        """保存索引到.npz文件"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, ids=np.array(self.ids, dtype=object), vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """从.npz文件加载索引，文件不存在时返回空索引"""
+        path = Path(path)
+        data = np.load(path, allow_pickle=True) if path.exists() else None
+        dim = kwargs.pop("dim", 512)
+        if data is not None:
+            dim = data["vectors"].shape[1]
+        index = cls(dim=dim, **kwargs)
+        if data is not None and len(data["ids"]):
+            index.ids = data["ids"].tolist()
+            index.vectors = index.normalize(data["vectors"])
+            index.rebuild()
+        return index
+
+    def rebuild(self):
+        """批量载入向量后重建辅助结构（暴力检索无需处理）"""
+
+
+class IVFDogEmbeddingIndex(DogEmbeddingIndex):
+    """倒排分区索引：用球面k-means把向量分到nlist个分区，查询时只扫描最近的nprobe个分区。
+    向量数少于分区训练所需数量时退化为暴力检索。"""
+
+    def __init__(self, dim=512, nlist=16, nprobe=4, kmeans_iters=10):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int64)
+
+    def rebuild(self):
+        self.train()
+
+    def train(self):
+        """在当前向量上训练分区中心"""
+        if len(self.ids) < self.nlist * 4:
+            self.centroids = None
+            return False
+        rng = np.random.default_rng(0)
+        centroids = self.vectors[rng.choice(len(self.vectors), self.nlist, replace=False)]
+        for _ in range(self.kmeans_iters):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = self.vectors[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = self.normalize(centroids)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        return True
+
+    def add(self, dog_id, embedding):
+        super().add(dog_id, embedding)
+        if self.centroids is None:
+            if len(self.ids) >= self.nlist * 4:
+                self.train()
+            return
+        added = self.vectors[len(self.assignments):]
+        self.assignments = np.concatenate([self.assignments, np.argmax(added @ self.centroids.T, axis=1)])
+
+    def remove(self, dog_id):
+        keep = [i for i, existing in enumerate(self.ids) if existing != dog_id]
+        if self.centroids is not None:
+            self.assignments = self.assignments[keep]
+        super().remove(dog_id)
+
+    def _scores(self, query):
+        if self.centroids is None:
+            return super()._scores(query)
+        probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        rows = np.flatnonzero(np.isin(self.assignments, probe))
+        return rows, self.vectors[rows] @ query
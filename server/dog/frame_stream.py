@@ -0,0 +1,92 @@
+import io
+import struct
+import numpy as np
+from PIL import Image
+
+
+# --------------- 视频帧流处理 ---------------
+def read_length_prefixed_frames(stream, max_frame_size=5 * 1024 * 1024):
+    """从字节流中逐帧读取JPEG数据，每帧格式为: 4字节大端长度 + JPEG字节。
+    适用于chunked上传，边接收边处理，不需要先缓存整个请求体。"""
+    while True:
+        header = _read_exact(stream, 4)
+        if not header:
+            return
+        if len(header) < 4:
+            raise ValueError("帧头不完整")
+        (size,) = struct.unpack(">I", header)
+        if size == 0:
+            return
+        if size > max_frame_size:
+            raise ValueError(f"单帧过大: {size}字节")
+        data = _read_exact(stream, size)
+        if len(data) < size:
+            raise ValueError("帧数据不完整")
+        yield data
+
+
+def _read_exact(stream, size):
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def average_hash(jpeg_bytes, hash_size=8):
+    """计算帧的均值哈希，JPEG使用draft模式按缩小尺寸解码，开销很小"""
+    image = Image.open(io.BytesIO(jpeg_bytes))
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    pixels = np.asarray(image.convert("L").resize((hash_size, hash_size), Image.BILINEAR), dtype=np.float32)
+    return (pixels > pixels.mean()).flatten()
+
+
+class FrameSampler:
+    """对帧序列按步长采样并去除与上一保留帧几乎相同的帧"""
+
+    def __init__(self, stride=1, hash_threshold=4, max_frames=300):
+        self.stride = max(1, stride)
+        self.hash_threshold = hash_threshold
+        self.max_frames = max_frames
+        self.received = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.frames = []
+        self._last_hash = None
+
+    def add(self, jpeg_bytes):
+        """处理一帧，返回是否保留；无法解码的帧（不是图片或数据不完整）跳过并计入invalid"""
+        self.received += 1
+        if (self.received - 1) % self.stride or len(self.frames) >= self.max_frames:
+            return False
+        try:
+            frame_hash = average_hash(jpeg_bytes)
+        except (OSError, Image.DecompressionBombError):
+            # PIL.UnidentifiedImageError 是 OSError 的子类
+            self.invalid += 1
+            return False
+        if self._last_hash is not None and np.count_nonzero(frame_hash != self._last_hash) <= self.hash_threshold:
+            self.duplicates += 1
+            return False
+        self._last_hash = frame_hash
+        self.frames.append(jpeg_bytes)
+        return True
+
+    def select(self, batch_size):
+        """按时间均匀选出最多batch_size帧，保持原有顺序"""
+        if len(self.frames) <= batch_size:
+            return list(self.frames)
+        picks = np.linspace(0, len(self.frames) - 1, batch_size).round().astype(int)
+        return [self.frames[i] for i in picks]
+
+
+def smooth_probabilities(probs, alpha=0.5):
+    """按时间顺序对每帧的品种概率做指数滑动平均，返回平滑后的概率向量"""
+    smoothed = probs[0].astype(np.float64)
+    for frame_probs in probs[1:]:
+        smoothed = alpha * frame_probs + (1 - alpha) * smoothed
+    return smoothed
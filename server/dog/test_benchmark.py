@@ -0,0 +1,33 @@
+"""
+pytest-benchmark集成：用合成图片和随机权重测量dog2各批大小的推理延迟（未安装pytest-benchmark时跳过）
+
+    python -m pytest test_benchmark.py --benchmark-json reports/bench.json
+    python -m pytest test_benchmark.py --benchmark-compare   # 与上一次保存的结果比较
+"""
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmark import load_backend, pytest_benchmark_case, synthetic_corpus
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    return synthetic_corpus(tmp_path_factory.mktemp("images"), 16)
+
+
+@pytest.fixture(scope="module")
+def dog2_backend(tmp_path_factory):
+    # load_backend会切换到工作目录（分类器按相对路径读取models/和data/），结束后恢复
+    cwd = os.getcwd()
+    try:
+        yield load_backend("dog2", workdir=tmp_path_factory.mktemp("dog2"), synthetic=True)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 8])
+def test_dog2_predict(benchmark, dog2_backend, corpus, batch_size):
+    pytest_benchmark_case(benchmark, dog2_backend, corpus, batch_size=batch_size)
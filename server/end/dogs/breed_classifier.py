@@ -11,6 +11,15 @@ logger = logging.getLogger(__name__)
 
 
 class DogBreedClassifier:
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        """单例模式获取分类器，避免每次请求重复加载模型"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
     def __init__(self):
         try:
             # 默认品种列表 - 如果无法从文件加载则使用
@@ -161,7 +170,24 @@ class DogBreedClassifier:
             logger.error(f"初始化DogBreedClassifier失败: {str(e)}")
             raise
             
-    def predict(self, image_path):
+    def _forward_with_embedding(self, image_tensor):
+        """返回 (logits, 512维特征向量)，特征向量取自ResNet18全局池化层；
+        无法拆分的模型对象返回的特征向量为None"""
+        m = self.model
+        if not all(hasattr(m, name) for name in ('conv1', 'layer4', 'avgpool', 'fc')):
+            return m(image_tensor), None
+        x = m.maxpool(m.relu(m.bn1(m.conv1(image_tensor))))
+        x = m.layer4(m.layer3(m.layer2(m.layer1(x))))
+        embedding = torch.flatten(m.avgpool(x), 1)
+        return m.fc(embedding), embedding
+
+    def predict(self, image_path, top_k=None, return_embedding=False):
+        """
+        预测狗狗品种，默认返回最高置信度的结果 {'breed', 'confidence'}
+
+        top_k: 指定时额外返回前k个品种（'top_k'字段）
+        return_embedding: 额外返回512维特征向量（'embedding'字段，numpy数组）
+        """
         logger.info(f"开始预测图像: {image_path}")
         
         try:
@@ -177,11 +203,11 @@ class DogBreedClassifier:
             
             # 进行预测
             with torch.no_grad():
-                outputs = self.model(image_tensor)
+                outputs, embedding = self._forward_with_embedding(image_tensor)
                 probabilities = torch.nn.functional.softmax(outputs, dim=1)
                 
-                # 获取前3个预测结果
-                top_probs, top_classes = probabilities.topk(min(3, probabilities.size(1)))
+                # 获取前k个预测结果（默认3个）
+                top_probs, top_classes = probabilities.topk(min(top_k or 3, probabilities.size(1)))
                 
                 # 转换为列表
                 top_probs = top_probs.squeeze().tolist()
@@ -212,7 +238,11 @@ class DogBreedClassifier:
                     })
                 
                 # 返回最高置信度的结果
-                best_result = max(valid_results, key=lambda x: x['confidence'])
+                best_result = dict(max(valid_results, key=lambda x: x['confidence']))
+                if top_k:
+                    best_result['top_k'] = valid_results
+                if return_embedding:
+                    best_result['embedding'] = embedding[0].cpu().numpy() if embedding is not None else None
                 
                 logger.info(f"模型预测成功，品种: {best_result['breed']}, 置信度: {best_result['confidence']:.4f}")
                 
@@ -4,17 +4,25 @@ from torch import nn
 from PIL import Image
 from torchvision import models, transforms
 from pathlib import Path
+from contextlib import nullcontext
 from django.conf import settings
 from .models import ClassifierModel, ClassNames, PredictionHistory
 
 # 设备自动选择
 device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
 
+
+def bf16_autocast(enabled):
+    """CPU上的bfloat16混合精度上下文（仅在CPU设备且启用时生效）"""
+    if enabled and device.type == "cpu":
+        return torch.autocast(device_type="cpu", dtype=torch.bfloat16)
+    return nullcontext()
+
 class DogClassifierModel(nn.Module):
-    def __init__(self, num_classes):
+    def __init__(self, num_classes, pretrained=True):
         super().__init__()
-        # 加载预训练的ResNet18
-        self.resnet = models.resnet18(pretrained=True)
+        # 加载预训练的ResNet18（从已训练的权重文件加载时无需下载预训练权重）
+        self.resnet = models.resnet18(weights=models.ResNet18_Weights.DEFAULT if pretrained else None)
         
         # 冻结大部分层
         for param in list(self.resnet.parameters())[:-4]:
@@ -38,6 +46,8 @@ class DogClassifier:
     def __init__(self):
         self.model = None
         self.class_names = []
+        self.use_bf16 = getattr(settings, 'DOG_CLASSIFIER_BF16', False)
+        self.channels_last = getattr(settings, 'DOG_CLASSIFIER_CHANNELS_LAST', False)
         self.load_model()
 
     @classmethod
@@ -75,8 +85,10 @@ class DogClassifier:
                 raise ValueError("无法加载类别名称")
         
         # 加载模型
-        self.model = DogClassifierModel(len(self.class_names)).to(device)
+        self.model = DogClassifierModel(len(self.class_names), pretrained=False).to(device)
         self.model.load_state_dict(torch.load(model_path, map_location=device))
+        if self.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
         self.model.eval()
 
     def predict(self, image_path):
@@ -94,9 +106,12 @@ class DogClassifier:
                 transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
             ])
             tensor = transform(image).unsqueeze(0).to(device)
+            if self.channels_last:
+                tensor = tensor.to(memory_format=torch.channels_last)
 
-            with torch.no_grad():
-                preds = torch.nn.functional.softmax(self.model(tensor), dim=1)
+            with torch.no_grad(), bf16_autocast(self.use_bf16):
+                logits = self.model(tensor)
+            preds = torch.nn.functional.softmax(logits.float(), dim=1)
 
             conf, idx = torch.max(preds, dim=1)
             prediction = self.class_names[idx.item()]
@@ -0,0 +1,328 @@
+import logging
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from .models import Dog
+
+# 获取日志记录器
+logger = logging.getLogger(__name__)
+
+# 余弦相似度达到该值才认为是同一只狗
+DOG_MATCH_THRESHOLD = 0.85
+
+
+# --------------- 狗狗特征向量索引 ---------------
+class DogEmbeddingIndex:
+    """暴力检索的狗狗特征索引（余弦相似度），同一只狗可以登记多张照片"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+        self.ids = []
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def normalize(vectors):
+        """L2归一化，之后内积即为余弦相似度"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add(self, dog_id, embedding):
+        """登记一张照片的特征向量"""
+        vector = self.normalize(embedding)
+        if vector.shape[1] != self.dim:
+            raise ValueError(f"特征维度不匹配: 期望{self.dim}, 实际{vector.shape[1]}")
+        self.vectors = np.vstack([self.vectors, vector])
+        self.ids.extend([dog_id] * len(vector))
+
+    def remove(self, dog_id):
+        """删除某只狗的全部特征向量"""
+        keep = [i for i, existing in enumerate(self.ids) if existing != dog_id]
+        self.vectors = self.vectors[keep]
+        self.ids = [self.ids[i] for i in keep]
+
+    def _scores(self, query):
+        """返回 (候选行号, 相似度)"""
+        return np.arange(len(self.ids)), self.vectors @ query
+
+    def search(self, embedding, k=1, dog_ids=None):
+        """查找最相似的k只狗，返回 [{"dog_id", "score"}]，按相似度降序；
+        指定dog_ids时只在这些狗的照片中精确检索（例如只查某个用户的狗）"""
+        if not self.ids:
+            return []
+        query = self.normalize(embedding)[0]
+        if dog_ids is None:
+            rows, scores = self._scores(query)
+        else:
+            rows = np.flatnonzero(np.fromiter((i in dog_ids for i in self.ids), dtype=bool, count=len(self.ids)))
+            scores = self.vectors[rows] @ query
+        if len(rows) == 0:
+            return []
+
+        # 同一只狗可能有多张照片，多取一些候选再按狗去重
+        n = min(len(rows), k * 4)
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        seen = set()
+        for i in top:
+            dog_id = self.ids[rows[i]]
+            if dog_id in seen:
+                continue
+            seen.add(dog_id)
+            results.append({"dog_id": dog_id, "score": float(scores[i])})
+            if len(results) >= k:
+                break
+        return results
+
+    def save(self, path):
+        """保存索引到.npz文件"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, ids=np.array(self.ids, dtype=object), vectors=self.vectors)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """从.npz文件加载索引，文件不存在时返回空索引"""
+        path = Path(path)
+        data = np.load(path, allow_pickle=True) if path.exists() else None
+        dim = kwargs.pop("dim", 512)
+        if data is not None:
+            dim = data["vectors"].shape[1]
+        index = cls(dim=dim, **kwargs)
+        if data is not None and len(data["ids"]):
+            index.ids = data["ids"].tolist()
+            index.vectors = index.normalize(data["vectors"])
+            index.rebuild()
+        return index
+
+    def rebuild(self):
+        """批量载入向量后重建辅助结构（暴力检索无需处理）"""
+
+
+class IVFDogEmbeddingIndex(DogEmbeddingIndex):
+    """倒排分区索引：用球面k-means把向量分到nlist个分区，查询时只扫描最近的nprobe个分区。
+    向量数少于分区训练所需数量时退化为暴力检索。"""
+
+    def __init__(self, dim=512, nlist=16, nprobe=4, kmeans_iters=10):
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int64)
+
+    def rebuild(self):
+        self.train()
+
+    def train(self):
+        """在当前向量上训练分区中心"""
+        if len(self.ids) < self.nlist * 4:
+            self.centroids = None
+            return False
+        rng = np.random.default_rng(0)
+        centroids = self.vectors[rng.choice(len(self.vectors), self.nlist, replace=False)]
+        for _ in range(self.kmeans_iters):
+            assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = self.vectors[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = self.normalize(centroids)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+        return True
+
+    def add(self, dog_id, embedding):
+        super().add(dog_id, embedding)
+        if self.centroids is None:
+            if len(self.ids) >= self.nlist * 4:
+                self.train()
+            return
+        added = self.vectors[len(self.assignments):]
+        self.assignments = np.concatenate([self.assignments, np.argmax(added @ self.centroids.T, axis=1)])
+
+    def remove(self, dog_id):
+        keep = [i for i, existing in enumerate(self.ids) if existing != dog_id]
+        if self.centroids is not None:
+            self.assignments = self.assignments[keep]
+        super().remove(dog_id)
+
+    def _scores(self, query):
+        if self.centroids is None:
+            return super()._scores(query)
+        probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        rows = np.flatnonzero(np.isin(self.assignments, probe))
+        return rows, self.vectors[rows] @ query
+
+
+# --------------- 已注册狗狗照片索引 ---------------
+class RegisteredDogIndex:
+    """
+    已上传照片（Dog.image）的狗狗特征索引
+
+    特征向量保存在 DOG_INDEX_PATH（.npz，同时记录每只狗建立索引时的图片文件名），
+    由 manage.py build_dog_index 一次性建立；请求中只读取该文件，不对全部照片做推理。
+    上传或更换照片后在事务提交时只为这一只狗计算特征并写回文件，
+    其他进程在下一次查询时发现文件修改时间变化后重新读取。
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, classifier=None, path=None, index_class=DogEmbeddingIndex):
+        self._classifier = classifier
+        self.path = Path(path or getattr(settings, 'DOG_INDEX_PATH',
+                                         Path(settings.BASE_DIR) / 'models' / 'dog_index.npz'))
+        self.index_class = index_class
+        self.index = index_class()
+        self.images = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, classifier=None):
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(classifier)
+        return cls._instance
+
+    @property
+    def classifier(self):
+        if self._classifier is None:
+            from .breed_classifier import DogBreedClassifier
+            self._classifier = DogBreedClassifier.get_instance()
+        return self._classifier
+
+    # --------------- 文件读写 ---------------
+    def _reload(self):
+        """索引文件被修改（其他进程或build_dog_index）后重新读取（调用方持有锁）"""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            if self._mtime is None:
+                self._mtime = 0
+                logger.warning(f"狗狗照片索引文件不存在: {self.path}，请运行 python manage.py build_dog_index")
+            return
+        if mtime == self._mtime:
+            return
+        with np.load(self.path, allow_pickle=True) as data:
+            ids = data['ids'].tolist()
+            images = data['images'].tolist() if 'images' in data else [''] * len(ids)
+            index = self.index_class(dim=data['vectors'].shape[1])
+            if ids:
+                index.ids = ids
+                index.vectors = index.normalize(data['vectors'])
+                index.rebuild()
+        self.index = index
+        self.images = dict(zip(ids, images))
+        self._mtime = mtime
+
+    def _save(self):
+        """写入临时文件后替换，其他进程不会读到写了一半的文件（调用方持有锁）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp = self.path.with_name(f'{self.path.stem}.{os.getpid()}.tmp.npz')
+        with open(temp, 'wb') as f:
+            np.savez(f, ids=np.array(self.index.ids, dtype=object), vectors=self.index.vectors,
+                     images=np.array([self.images.get(i, '') for i in self.index.ids], dtype=object))
+        os.replace(temp, self.path)
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def _embed(self, dog):
+        try:
+            result = self.classifier.predict(dog.image.path, return_embedding=True)
+            return result.get('embedding')
+        except Exception as e:
+            logger.error(f"为狗狗 {dog.id} 建立照片特征失败: {str(e)}")
+            return None
+
+    # --------------- 更新 ---------------
+    def build(self, dogs):
+        """为所有狗狗的照片重新建立索引并保存，返回登记的数量（build_dog_index使用）"""
+        index = self.index_class()
+        images = {}
+        for dog in dogs:
+            if not dog.image:
+                continue
+            embedding = self._embed(dog)
+            if embedding is not None:
+                index.add(dog.id, embedding)
+                images[dog.id] = dog.image.name
+        index.rebuild()
+        with self._lock:
+            self.index, self.images = index, images
+            self._save()
+        return len(images)
+
+    def is_current(self, dog):
+        """索引中该狗狗的照片与当前照片相同（都没有照片也算相同）"""
+        with self._lock:
+            self._reload()
+            return self.images.get(dog.pk, '') == (dog.image.name or '')
+
+    def update(self, dog_id):
+        """为一只狗（照片已更换）重新计算特征并写回索引文件"""
+        dog = Dog.objects.filter(id=dog_id).first()
+        if dog is None:
+            self.remove(dog_id)
+            return
+        embedding = self._embed(dog) if dog.image else None
+        with self._lock:
+            self._reload()
+            self.index.remove(dog_id)
+            self.images.pop(dog_id, None)
+            if embedding is not None:
+                self.index.add(dog_id, embedding)
+                self.images[dog_id] = dog.image.name
+            self._save()
+
+    def remove(self, dog_id):
+        with self._lock:
+            self._reload()
+            if dog_id not in self.images:
+                return
+            self.index.remove(dog_id)
+            del self.images[dog_id]
+            self._save()
+
+    # --------------- 查询 ---------------
+    def match(self, embedding, owner=None, k=1):
+        """查找最相似的已注册狗狗，返回 [{'dog_id', 'score'}]（只包含超过阈值的结果）；
+        指定owner时只在该用户的狗中检索"""
+        dog_ids = None
+        if owner is not None:
+            dog_ids = set(Dog.objects.filter(owner=owner).values_list('id', flat=True))
+            if not dog_ids:
+                return []
+        with self._lock:
+            self._reload()
+            matches = self.index.search(embedding, k=k, dog_ids=dog_ids)
+        return [m for m in matches if m['score'] >= DOG_MATCH_THRESHOLD]
+
+
+def _dog_saved(sender, instance, **kwargs):
+    # 只有照片变化时才重新计算特征（修改名字、体重等不影响索引）
+    registry = RegisteredDogIndex.get_instance()
+    if not registry.is_current(instance):
+        dog_id = instance.pk
+        transaction.on_commit(lambda: registry.update(dog_id))
+
+
+def _dog_deleted(sender, instance, **kwargs):
+    registry = RegisteredDogIndex.get_instance()
+    dog_id = instance.pk
+    transaction.on_commit(lambda: registry.remove(dog_id))
+
+
+post_save.connect(_dog_saved, sender=Dog, dispatch_uid='dogs_index_dog_saved')
+post_delete.connect(_dog_deleted, sender=Dog, dispatch_uid='dogs_index_dog_deleted')
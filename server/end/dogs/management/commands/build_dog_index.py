@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from dogs.dog_index import RegisteredDogIndex
+from dogs.models import Dog
+import time
+
+
+class Command(BaseCommand):
+    help = '为所有已上传照片的狗狗计算特征向量，重新生成照片匹配索引（DOG_INDEX_PATH）'
+
+    def handle(self, *args, **options):
+        registry = RegisteredDogIndex.get_instance()
+        dogs = Dog.objects.exclude(image='').exclude(image=None).only('id', 'image')
+        self.stdout.write(f'为 {dogs.count()} 只狗狗的照片建立索引...')
+        started = time.perf_counter()
+        count = registry.build(dogs.iterator())
+        self.stdout.write(self.style.SUCCESS(
+            f'已登记 {count} 只狗狗, 用时 {time.perf_counter() - started:.1f} 秒, 保存到 {registry.path}'
+        ))
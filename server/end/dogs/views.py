@@ -7,6 +7,7 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Dog
 from .serializers import DogSerializer, DogImageUploadSerializer
 from .breed_classifier import DogBreedClassifier
+from .dog_index import RegisteredDogIndex
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 import logging
@@ -167,6 +168,13 @@ class DogBreedIdentifyView(APIView):
                 description='需要识别的狗狗图片',
                 type=openapi.TYPE_FILE,
                 required=True
+            ),
+            openapi.Parameter(
+                name='top_k',
+                in_=openapi.IN_FORM,
+                description='返回前k个品种（可选）',
+                type=openapi.TYPE_INTEGER,
+                required=False
             )
         ],
         responses={
@@ -175,7 +183,9 @@ class DogBreedIdentifyView(APIView):
                 properties={
                     'status': openapi.Schema(type=openapi.TYPE_STRING, description='处理状态'),
                     'breed': openapi.Schema(type=openapi.TYPE_STRING, description='识别出的狗狗品种'),
-                    'confidence': openapi.Schema(type=openapi.TYPE_NUMBER, description='识别置信度')
+                    'confidence': openapi.Schema(type=openapi.TYPE_NUMBER, description='识别置信度'),
+                    'top_k': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT), description='前k个品种（指定top_k时返回）'),
+                    'matched_dog': openapi.Schema(type=openapi.TYPE_OBJECT, description='照片匹配到的当前用户已注册狗狗')
                 }
             )),
             400: "请求格式错误或未提供图片",
@@ -196,6 +206,17 @@ class DogBreedIdentifyView(APIView):
             
             image_file = request.FILES['image']
             
+            try:
+                top_k = request.data.get('top_k')
+                top_k = int(top_k) if top_k not in (None, '') else None
+            except (TypeError, ValueError):
+                top_k = 0
+            if top_k is not None and top_k < 1:
+                return Response({
+                    'status': 'error',
+                    'message': 'top_k必须是大于0的整数'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             # 保存临时文件
             import tempfile
             import os
@@ -211,18 +232,31 @@ class DogBreedIdentifyView(APIView):
                     
             # 使用分类器进行预测
             try:
-                classifier = DogBreedClassifier()
-                result = classifier.predict(temp_file.name)
+                classifier = DogBreedClassifier.get_instance()
+                result = classifier.predict(temp_file.name, top_k=top_k, return_embedding=True)
                 
                 # 删除临时文件
                 os.unlink(temp_file.name)
                 
+                # 通过照片特征查找当前用户已注册的同一只狗
+                matched_dog = None
+                if result.get('embedding') is not None:
+                    matches = RegisteredDogIndex.get_instance(classifier).match(result['embedding'], owner=request.user)
+                    if matches:
+                        dog = Dog.objects.filter(id=matches[0]['dog_id']).first()
+                        if dog:
+                            matched_dog = {'id': dog.id, 'name': dog.name, 'score': matches[0]['score']}
+                
                 # 返回预测结果
-                return Response({
+                response_data = {
                     'status': 'success',
                     'breed': result['breed'],
-                    'confidence': result['confidence']
-                })
+                    'confidence': result['confidence'],
+                    'matched_dog': matched_dog
+                }
+                if top_k:
+                    response_data['top_k'] = result['top_k']
+                return Response(response_data)
             except Exception as e:
                 # 确保临时文件被删除
                 if os.path.exists(temp_file.name):
@@ -176,6 +176,32 @@ MQTT_CLIENT_ID = 'python-mqtt-server'
 MQTT_KEEPALIVE = 60 
 MQTT_USERNAME = ''  # 如有需要设置
 MQTT_PASSWORD = ''  # 如有需要设置
+MQTT_INGEST_BATCH_SIZE = 500  # 每批最多写入的消息数
+MQTT_INGEST_FLUSH_INTERVAL_MS = 200  # 最长攒批时间（毫秒）
+MQTT_INGEST_QUEUE_SIZE = 10000  # 写入队列长度上限
+MQTT_INGEST_OVERFLOW = 'drop_oldest'  # 队列满时的策略: drop_oldest / drop_newest / block
+MQTT_LOG_SAMPLE_LIMIT = 5  # 每个主题每个采样窗口最多输出的调试日志条数
+MQTT_LOG_SAMPLE_INTERVAL = 10  # 调试日志采样窗口（秒）
+
+# 缓存配置：默认使用进程内缓存；多个worker需要共享传感器最新值时设置REDIS_URL使用Redis
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+SENSOR_LATEST_CACHE = 'default'  # 传感器最新值缓存使用的缓存别名
+# 缓存过期时间（秒），None为不过期。
+# 注意：start_all.py 的多进程部署（MQTT_ROLE=web）必须配置REDIS_URL，最新值缓存才能生效。
+# 没有Redis时web进程的进程内缓存收不到入库进程的更新，只能保留1秒，
+# latest接口在每个worker中约每秒查询一次数据库（不再是"不查询数据库"），入库指标接口返回503
+SENSOR_LATEST_CACHE_TIMEOUT = 1 if os.environ.get('MQTT_ROLE') == 'web' and not os.environ.get('REDIS_URL') else None
+
+# 狗狗识别模型配置
+DOG_CLASSIFIER_BF16 = os.environ.get('DOG_BF16', '0') == '1'  # CPU上启用bfloat16混合精度推理
+DOG_CLASSIFIER_CHANNELS_LAST = os.environ.get('DOG_CHANNELS_LAST', '0') == '1'  # ResNet18使用channels_last内存布局
+DOG_INDEX_PATH = os.path.join(BASE_DIR, 'models', 'dog_index.npz')  # 已注册狗狗照片特征索引（manage.py build_dog_index 生成）
 
 # Logging
 LOGGING = {
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import STM32Data
+from .models import SensorReading, STM32Data
 
 @admin.register(STM32Data)
 class STM32DataAdmin(admin.ModelAdmin):
@@ -7,3 +7,11 @@ class STM32DataAdmin(admin.ModelAdmin):
     list_filter = ('topic', 'timestamp')
     search_fields = ('topic', 'payload')
     readonly_fields = ('timestamp',)
+
+
+@admin.register(SensorReading)
+class SensorReadingAdmin(admin.ModelAdmin):
+    list_display = ('device_id', 'temperature', 'humidity', 'timestamp')
+    list_filter = ('device_id', 'timestamp')
+    search_fields = ('device_id', 'topic')
+    readonly_fields = ('timestamp',)
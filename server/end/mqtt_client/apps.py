@@ -5,8 +5,29 @@ import os
 class MqttClientConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mqtt_client'
-    
+
     def ready(self):
+        # 日志处理器（控制台、debug.log）放到后台线程执行，请求线程和MQTT线程只负责入队
+        from .log_pipeline import install_queue_logging
+        install_queue_logging()
+
+        from . import signals  # noqa: F401 注册最新值缓存的信号处理
+
+        # MQTT_ROLE由start_all.py设置：
+        #   ingest - start_mqtt进程，由命令自己连接，这里不自动连接
+        #   web    - 多worker的web进程，不入库（避免每个worker重复写入），只启动实时推送中继
+        #   未设置 - 单进程运行（manage.py runserver等），保持原来的自动连接
+        role = os.environ.get('MQTT_ROLE')
+        if role == 'ingest':
+            return
+        if role == 'web':
+            from .live_relay import start_live_relay
+            try:
+                start_live_relay()
+            except Exception as e:
+                print(f"实时推送中继启动失败: {e}")
+            return
+
         # 仅在主进程中运行，避免在Django开发服务器的自动重载进程中重复运行
         if os.environ.get('RUN_MAIN', None) != 'true':
             # 导入mqtt_client必须在这里进行，以避免循环导入
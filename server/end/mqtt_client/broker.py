@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+基于asyncio的MQTT 3.1.1代理服务器
+
+单线程事件循环处理所有传感器连接（不再为每个客户端创建线程），
+支持 CONNECT、PUBLISH(QoS0/1/2)、SUBSCRIBE/UNSUBSCRIBE、PINGREQ、DISCONNECT。
+
+收到的消息按订阅树(topic_trie.py)转发给订阅者，支持 '+' / '#' 通配符和保留消息。
+每个订阅者有独立的有界发送队列，慢订阅者只会丢弃自己的旧消息，不会拖慢发布者。
+"""
+
+import asyncio
+import logging
+import struct
+
+try:
+    from . import mqtt_codec as codec
+    from .topic_trie import TopicTrie, topic_matches
+except ImportError:  # 作为脚本运行时（python mqtt_client/example.py）
+    import mqtt_codec as codec
+    from topic_trie import TopicTrie, topic_matches
+
+logger = logging.getLogger(__name__)
+
+# CONNECT必须在连接建立后的这段时间内到达
+CONNECT_TIMEOUT = 10
+# 写缓冲超过该值时等待drain，防止慢客户端占用过多内存
+WRITE_BUFFER_HIGH_WATER = 64 * 1024
+# 每个订阅者发送队列的最大长度，队列满时丢弃最旧的消息
+OUTBOUND_QUEUE_SIZE = 1000
+# SUBACK中表示订阅失败的返回码
+SUBSCRIBE_FAILURE = 0x80
+
+
+class ClientSession:
+    """一个已连接的MQTT客户端"""
+    __slots__ = ("client_id", "address", "reader", "writer", "keepalive",
+                 "subscriptions", "outbound", "sender", "_packet_id")
+
+    def __init__(self, client_id, address, reader, writer, keepalive, queue_size=OUTBOUND_QUEUE_SIZE):
+        self.client_id = client_id
+        self.address = address
+        self.reader = reader
+        self.writer = writer
+        self.keepalive = keepalive
+        # 订阅过滤器 -> 授予的QoS
+        self.subscriptions = {}
+        self.outbound = asyncio.Queue(maxsize=queue_size)
+        self.sender = None
+        self._packet_id = 0
+
+    def next_packet_id(self):
+        self._packet_id = self._packet_id % 65535 + 1
+        return self._packet_id
+
+
+class AsyncMQTTBroker:
+    """
+    asyncio MQTT代理服务器
+
+    on_message(topic, payload, qos, retain) 在收到PUBLISH时于事件循环线程中调用，
+    回调应当足够快，耗时操作请自行转交到其他线程。
+    """
+
+    def __init__(self, host="0.0.0.0", port=1883, on_message=None, backlog=1024,
+                 queue_size=OUTBOUND_QUEUE_SIZE):
+        self.host = host
+        self.port = port
+        self.on_message = on_message
+        self.backlog = backlog
+        self.queue_size = queue_size
+        self.sessions = {}
+        self.subscriptions = TopicTrie()
+        # 主题 -> (payload, qos)
+        self.retained = {}
+        self.stats = {
+            "connections_total": 0,
+            "messages_received": 0,
+            "bytes_received": 0,
+            "protocol_errors": 0,
+            "messages_delivered": 0,
+            "messages_dropped": 0,
+        }
+        self._server = None
+        self._client_tasks = set()
+
+    # --------------- 生命周期 ---------------
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_client, self.host, self.port, backlog=self.backlog
+        )
+        logger.info(f"MQTT代理服务器已启动，监听 {self.host}:{self.port}")
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        # 等待各连接的处理协程收到EOF后自行退出
+        if self._client_tasks:
+            await asyncio.wait(self._client_tasks, timeout=CONNECT_TIMEOUT)
+        logger.info("MQTT代理服务器已停止")
+
+    def run(self):
+        """阻塞运行代理服务器（安装了uvloop时自动使用）"""
+        try:
+            import uvloop
+            uvloop.install()
+        except ImportError:
+            pass
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    # --------------- 连接处理 ---------------
+    async def _handle_client(self, reader, writer):
+        address = writer.get_extra_info("peername")
+        self.stats["connections_total"] += 1
+        task = asyncio.current_task()
+        self._client_tasks.add(task)
+        session = None
+        try:
+            packet = await asyncio.wait_for(codec.read_packet(reader), CONNECT_TIMEOUT)
+            if packet is None or packet.type != codec.CONNECT:
+                logger.debug(f"客户端 {address} 未发送CONNECT，关闭连接")
+                return
+
+            info = codec.parse_connect(packet.body)
+            client_id = info["client_id"] or f"{address[0]}:{address[1]}"
+            previous = self.sessions.get(client_id)
+            if previous is not None:
+                # 同一客户端ID重复连接时，按协议断开旧连接
+                previous.writer.close()
+
+            session = ClientSession(client_id, address, reader, writer, info["keepalive"], self.queue_size)
+            session.sender = asyncio.create_task(self._send_loop(session))
+            self.sessions[client_id] = session
+            writer.write(codec.connack_packet(0))
+            logger.debug(f"客户端 {client_id} ({address}) 已连接，keepalive={info['keepalive']}")
+
+            # 按协议，超过1.5倍keepalive没有任何报文即视为断开
+            timeout = info["keepalive"] * 1.5 if info["keepalive"] else None
+            while True:
+                packet = await asyncio.wait_for(codec.read_packet(reader), timeout)
+                if packet is None or packet.type == codec.DISCONNECT:
+                    break
+                await self._dispatch(session, packet)
+
+        except asyncio.TimeoutError:
+            logger.debug(f"客户端 {address} keepalive超时")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.debug(f"客户端 {address} 连接中断")
+        except (codec.MQTTProtocolError, struct.error, IndexError) as e:
+            self.stats["protocol_errors"] += 1
+            logger.warning(f"客户端 {address} 报文错误: {e}")
+        except Exception as e:
+            logger.error(f"处理客户端 {address} 时出错: {e}")
+        finally:
+            if session is not None:
+                session.sender.cancel()
+                self.subscriptions.remove_subscriber(session, session.subscriptions)
+                if self.sessions.get(session.client_id) is session:
+                    del self.sessions[session.client_id]
+            self._client_tasks.discard(task)
+            writer.close()
+
+    async def _send_loop(self, session):
+        """把订阅者队列中的消息写入连接，写缓冲过大时等待drain"""
+        writer = session.writer
+        try:
+            while True:
+                writer.write(await session.outbound.get())
+                while not session.outbound.empty():
+                    writer.write(session.outbound.get_nowait())
+                if writer.transport.get_write_buffer_size() > WRITE_BUFFER_HIGH_WATER:
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def _dispatch(self, session, packet):
+        writer = session.writer
+        packet_type = packet.type
+
+        if packet_type == codec.PUBLISH:
+            topic, payload, qos, retain, packet_id = codec.parse_publish(packet.flags, packet.body)
+            self.stats["messages_received"] += 1
+            self.stats["bytes_received"] += len(payload)
+            if qos == 1:
+                writer.write(codec.ack_packet(codec.PUBACK, packet_id))
+            elif qos == 2:
+                writer.write(codec.ack_packet(codec.PUBREC, packet_id))
+            self.handle_publish(session, topic, payload, qos, retain)
+
+        elif packet_type == codec.PUBREL:
+            writer.write(codec.ack_packet(codec.PUBCOMP, codec.parse_packet_id(packet.body)))
+
+        elif packet_type == codec.SUBSCRIBE:
+            packet_id, topics = codec.parse_subscribe(packet.body)
+            granted = self.handle_subscribe(session, topics)
+            writer.write(codec.suback_packet(packet_id, granted))
+            self._send_retained(session, topics, granted)
+
+        elif packet_type == codec.UNSUBSCRIBE:
+            packet_id, topics = codec.parse_unsubscribe(packet.body)
+            self.handle_unsubscribe(session, topics)
+            writer.write(codec.ack_packet(codec.UNSUBACK, packet_id))
+
+        elif packet_type == codec.PINGREQ:
+            writer.write(codec.PINGRESP_PACKET)
+
+        elif packet_type in (codec.PUBACK, codec.PUBREC, codec.PUBCOMP):
+            pass
+
+        else:
+            raise codec.MQTTProtocolError(f"不支持的报文类型: {packet_type}")
+
+        if writer.transport.get_write_buffer_size() > WRITE_BUFFER_HIGH_WATER:
+            await writer.drain()
+
+    # --------------- 消息处理 ---------------
+    def handle_publish(self, session, topic, payload, qos, retain):
+        if retain:
+            # 空载荷的保留消息表示清除该主题的保留消息
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        if self.on_message is not None:
+            try:
+                self.on_message(topic, payload, qos, retain)
+            except Exception as e:
+                logger.error(f"处理主题 {topic} 的消息时出错: {e}")
+        self.publish(topic, payload, qos)
+
+    def handle_subscribe(self, session, topics):
+        """登记订阅，返回每个主题授予的QoS（最高支持QoS1，非法主题返回0x80）"""
+        granted = []
+        for topic_filter, qos in topics:
+            qos = min(qos, 1)
+            try:
+                self.subscriptions.subscribe(topic_filter, session, qos)
+            except codec.MQTTProtocolError as e:
+                logger.warning(f"客户端 {session.client_id} 订阅失败: {e}")
+                granted.append(SUBSCRIBE_FAILURE)
+                continue
+            session.subscriptions[topic_filter] = qos
+            granted.append(qos)
+        return granted
+
+    def handle_unsubscribe(self, session, topics):
+        for topic_filter in topics:
+            if session.subscriptions.pop(topic_filter, None) is not None:
+                self.subscriptions.unsubscribe(topic_filter, session)
+
+    def publish(self, topic, payload, qos=0):
+        """把消息转发给所有匹配的订阅者（也可供服务端主动推送使用）"""
+        subscribers = self.subscriptions.match(topic)
+        if not subscribers:
+            return
+        qos0_packet = None
+        for subscriber, granted in subscribers.items():
+            delivery_qos = min(qos, granted)
+            if delivery_qos:
+                packet = codec.publish_packet(topic, payload, delivery_qos,
+                                              packet_id=subscriber.next_packet_id())
+            else:
+                if qos0_packet is None:
+                    qos0_packet = codec.publish_packet(topic, payload)
+                packet = qos0_packet
+            self._enqueue(subscriber, packet)
+
+    def _send_retained(self, session, topics, granted):
+        """新订阅建立后，下发匹配的保留消息（retain标志置1）"""
+        if not self.retained:
+            return
+        for (topic_filter, _), granted_qos in zip(topics, granted):
+            if granted_qos == SUBSCRIBE_FAILURE:
+                continue
+            for topic, (payload, qos) in self.retained.items():
+                if topic_matches(topic_filter, topic):
+                    delivery_qos = min(qos, granted_qos)
+                    packet_id = session.next_packet_id() if delivery_qos else None
+                    self._enqueue(session, codec.publish_packet(topic, payload, delivery_qos,
+                                                                retain=True, packet_id=packet_id))
+
+    def _enqueue(self, session, packet):
+        """放入订阅者发送队列；队列满时丢弃最旧的一条"""
+        queue = session.outbound
+        if queue.full():
+            queue.get_nowait()
+            self.stats["messages_dropped"] += 1
+        queue.put_nowait(packet)
+        self.stats["messages_delivered"] += 1
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+虚拟STM32/ESP8266传感器
+
+用asyncio模拟N台设备，按固定速率向MQTT代理发布DHT11温湿度载荷，
+其中一部分是ESP8266 AT固件常见的不规范载荷（伪JSON、键值对、纯数值、带单位、截断、AT指令回显等）。
+每条消息记录 (载荷, 发送时间)，manage.py mqtt_benchmark 以 --sends 启动本脚本，据此计算端到端延迟。
+
+只依赖标准库，也可以单独运行，向任意代理发布模拟数据:
+    python mqtt_client/device_sim.py --devices 200 --rate 2 --duration 30 --malformed 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+
+try:
+    from . import mqtt_codec as codec
+except ImportError:  # 作为脚本直接运行
+    import mqtt_codec as codec
+
+
+def _json_payload(device_id, seq, temperature, humidity):
+    return json.dumps({"device_id": device_id, "temperature": temperature, "humidity": humidity, "seq": seq})
+
+
+# 不规范载荷的各种变体: (名称, 生成函数)
+MALFORMED_VARIANTS = (
+    ("pseudo_json", lambda rng, d, s, t, h: f"{{'device_id': '{d}', temperature: {t}, humidity: {h}, seq: {s}}}"),
+    ("key_value", lambda rng, d, s, t, h: f"device_id:{d},temperature:{t},humidity:{h},seq:{s}"),
+    ("quoted_json", lambda rng, d, s, t, h: f'"{_json_payload(d, s, t, h)}"'),
+    ("numbers", lambda rng, d, s, t, h: f"{t},{h}"),
+    ("units", lambda rng, d, s, t, h: f'{{"device_id": "{d}", "temperature": "{t}°C", "humidity": "{h}%", "seq": {s}}}'),
+    ("truncated", lambda rng, d, s, t, h: _json_payload(d, s, t, h)[:rng.randint(8, 30)]),
+    ("at_echo", lambda rng, d, s, t, h: f'AT+MQTTPUB=0,"stm32/dht11","temperature:{t}",0,0 seq={s}'),
+)
+
+
+def make_payload(rng, device_id, seq, malformed=0.0):
+    """生成一条载荷，返回 (变体名称, 载荷字符串)"""
+    temperature = round(rng.uniform(15, 35), 1)
+    humidity = rng.randint(30, 90)
+    if rng.random() >= malformed:
+        return "json", _json_payload(device_id, seq, temperature, humidity)
+    name, build = rng.choice(MALFORMED_VARIANTS)
+    return name, build(rng, device_id, seq, temperature, humidity)
+
+
+class SimStats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failed = 0
+        self.disconnected = 0
+        self.published = 0
+        self.acked = 0
+        self.variants = {}
+        # [(载荷, 发送时间time.time())]
+        self.sends = []
+
+
+async def device(index, args, stats, stop_at):
+    """单台虚拟设备：连接、按速率发布、QoS1时等待PUBACK"""
+    rng = random.Random(f"{args.seed}-{index}")
+    device_id = f"{args.device_prefix}-{index}"
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(args.host, args.port), 10)
+        writer.write(codec.connect_packet(f"{device_id}-{args.seed}", keepalive=60))
+        packet = await asyncio.wait_for(codec.read_packet(reader), 10)
+        if packet is None or packet.type != codec.CONNACK or packet.body[1] != 0:
+            raise ConnectionError("CONNACK失败")
+    except Exception:
+        stats.connect_failed += 1
+        return
+    stats.connected += 1
+
+    in_flight = set()
+
+    async def read_acks():
+        while True:
+            packet = await codec.read_packet(reader)
+            if packet is None:
+                return
+            if packet.type == codec.PUBACK:
+                in_flight.discard(codec.parse_packet_id(packet.body))
+                stats.acked += 1
+
+    ack_task = asyncio.create_task(read_acks())
+    interval = 1.0 / args.rate
+    seq = 0
+    # 错开各设备的首次发布时间，避免同时突发
+    next_send = time.perf_counter() + rng.random() * interval
+    try:
+        while time.perf_counter() < stop_at and not ack_task.done():
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            seq += 1
+            variant, payload = make_payload(rng, device_id, seq, args.malformed)
+            packet_id = None
+            if args.qos:
+                packet_id = seq % 65535 + 1
+                in_flight.add(packet_id)
+            writer.write(codec.publish_packet(args.topic, payload.encode("utf-8"), args.qos, packet_id=packet_id))
+            stats.sends.append((payload, time.time()))
+            stats.published += 1
+            stats.variants[variant] = stats.variants.get(variant, 0) + 1
+            await writer.drain()
+            next_send += interval
+        # 断开前等待最后几条消息的PUBACK
+        ack_deadline = time.perf_counter() + 1.0
+        while in_flight and not ack_task.done() and time.perf_counter() < ack_deadline:
+            await asyncio.sleep(0.01)
+        writer.write(codec.encode_packet(codec.DISCONNECT, 0))
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        stats.disconnected += 1
+    finally:
+        ack_task.cancel()
+        writer.close()
+
+
+async def run(args):
+    stats = SimStats()
+    stop_at = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    await asyncio.gather(*(device(i, args, stats, stop_at) for i in range(args.devices)))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "devices": args.devices,
+        "connected": stats.connected,
+        "connect_failed": stats.connect_failed,
+        "disconnected": stats.disconnected,
+        "published": stats.published,
+        "acked": stats.acked,
+        "variants": stats.variants,
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "sends": stats.sends,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="模拟STM32/ESP8266设备向MQTT代理发布温湿度数据")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--devices", type=int, default=100, help="虚拟设备数")
+    parser.add_argument("--rate", type=float, default=1.0, help="每台设备每秒发布的消息数")
+    parser.add_argument("--duration", type=float, default=10, help="持续发布的秒数")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=0)
+    parser.add_argument("--malformed", type=float, default=0.2, help="不规范载荷的比例 (0~1)")
+    parser.add_argument("--topic", default="stm32/dht11")
+    parser.add_argument("--device-prefix", default="sim")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sends", action="store_true", help="输出中包含每条消息的载荷和发送时间（供基准命令使用）")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    result = asyncio.run(run(args))
+    if not args.sends:
+        result.pop("sends")
+    print(json.dumps(result, ensure_ascii=False, indent=None if args.sends else 2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+MQTT消息批量入库
+
+paho的网络线程只负责把消息放入有界队列，由独立的写入线程批量 bulk_create，
+避免每条消息一次数据库写入拖慢网络循环导致keepalive超时。
+原始消息写入STM32Data，能解析出温湿度的同时写入SensorReading。
+写入成功后把每个设备的最新读数写入最新值缓存(latest_cache)并发布到推送中心(live_hub)。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .latest_cache import latest_cache
+from .live_hub import hub
+from .log_pipeline import counters
+from .models import SensorReading, STM32Data
+from .payload_parser import parse_reading
+from .serializers import SensorReadingSerializer, STM32DataSerializer
+
+logger = logging.getLogger(__name__)
+
+# 队列满时的处理策略
+DROP_OLDEST = 'drop_oldest'   # 丢弃最早的消息，保留最新数据
+DROP_NEWEST = 'drop_newest'   # 丢弃新到的消息
+BLOCK = 'block'               # 阻塞网络线程最多block_timeout秒（反压），超时后丢弃
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class STM32DataWriter:
+    """STM32Data批量写入器：凑满batch_size条或距上次写入超过flush_interval秒时写入一次"""
+
+    def __init__(self, batch_size=500, flush_interval=0.2, queue_size=10000,
+                 overflow=DROP_OLDEST, block_timeout=1.0, on_batch=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的队列溢出策略: {overflow}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        # 写入成功后以 [(topic, payload, qos, received_at)] 调用，运行在写入线程中
+        self.on_batch = on_batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'written': 0,
+            'readings': 0,
+            'failed': 0,
+            'flushes': 0,
+            'flush_ms_last': 0.0,
+            'flush_ms_max': 0.0,
+            'flush_ms_total': 0.0,
+            'queue_high_water': 0,
+        }
+
+    # --------------- 生命周期 ---------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='stm32-data-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"STM32数据写入线程已启动 (batch={self.batch_size}, interval={self.flush_interval}s, "
+                    f"queue={self._queue.maxsize}, overflow={self.overflow})")
+
+    def stop(self, timeout=5.0):
+        """停止写入线程，队列中剩余的消息会先写入数据库"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --------------- 入队（网络线程） ---------------
+    def submit(self, topic, payload, qos, received_at=None):
+        """放入写入队列，返回是否成功；不访问数据库，可以在paho回调中直接调用"""
+        item = (topic, payload, qos, received_at or timezone.now())
+        try:
+            if self.overflow == BLOCK:
+                self._queue.put(item, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            if self.overflow != DROP_OLDEST:
+                self._count('dropped')
+                return False
+            try:
+                self._queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self._count('dropped')
+                return False
+
+        depth = self._queue.qsize()
+        with self._lock:
+            self._stats['enqueued'] += 1
+            self._stats['queue_high_water'] = max(self._stats['queue_high_water'], depth)
+        return True
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    # --------------- 写入线程 ---------------
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                # 队列中已有的消息一次取完，减少唤醒次数
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stopping = self._stop.is_set()
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline or stopping):
+                self._flush(batch)
+                batch = []
+                deadline = None
+            if stopping and self._queue.empty() and not batch:
+                break
+        close_old_connections()
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            close_old_connections()
+            readings = []
+            for topic, payload, qos, received_at in batch:
+                reading = parse_reading(topic, payload)
+                if reading is not None:
+                    readings.append(SensorReading(topic=topic, timestamp=received_at, **reading))
+                else:
+                    counters.record_parse_failure(topic)
+            rows = [
+                STM32Data(topic=topic, payload=payload, qos=qos, timestamp=received_at)
+                for topic, payload, qos, received_at in batch
+            ]
+            with transaction.atomic():
+                STM32Data.objects.bulk_create(rows)
+                SensorReading.objects.bulk_create(readings)
+        except Exception as e:
+            self._count('failed', len(batch))
+            logger.error(f"批量写入STM32数据失败（{len(batch)}条）: {e}")
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['written'] += len(batch)
+            self._stats['readings'] += len(readings)
+            self._stats['flushes'] += 1
+            self._stats['flush_ms_last'] = elapsed_ms
+            self._stats['flush_ms_total'] += elapsed_ms
+            self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed_ms)
+
+        self._publish_latest(rows, readings)
+
+        if self.on_batch is not None:
+            try:
+                self.on_batch(batch)
+            except Exception as e:
+                logger.error(f"处理已写入的MQTT消息时出错: {e}")
+
+    def _publish_latest(self, rows, readings):
+        """每批只把每个设备的最后一条读数和最后一条原始消息写入最新值缓存并推送"""
+        latest = {}
+        for reading in readings:
+            latest[reading.device_id] = reading
+        for device_id, reading in latest.items():
+            data = SensorReadingSerializer(reading).data
+            latest_cache.update(f'reading:{device_id}', reading.timestamp, data)
+            hub.publish(f'reading:{device_id}', data)
+        row = rows[-1]
+        data = STM32DataSerializer(row).data
+        latest_cache.update('stm32', row.timestamp, data)
+        hub.publish('stm32', data)
+
+    # --------------- 指标 ---------------
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        flushes = stats.pop('flush_ms_total')
+        stats['flush_ms_avg'] = round(flushes / stats['flushes'], 3) if stats['flushes'] else 0.0
+        stats['flush_ms_last'] = round(stats['flush_ms_last'], 3)
+        stats['flush_ms_max'] = round(stats['flush_ms_max'], 3)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['queue_size'] = self._queue.maxsize
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
@@ -0,0 +1,74 @@
+"""
+入库进程指标的跨进程共享
+
+start_all.py 启动时入库在独立的 start_mqtt 进程(MQTT_ROLE=ingest)中完成，
+web worker 里的 mqtt_client.writer 和 counters 都没有运行，直接读取只会得到0。
+入库进程每 PUBLISH_INTERVAL 秒把指标写入Django缓存，web进程的 ingest_stats / metrics 接口从缓存读取。
+进程内缓存(locmem)不能跨进程共享，需要配置 REDIS_URL；读不到时接口返回503。
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .log_pipeline import counters
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'mqtt:ingest:stats'
+PUBLISH_INTERVAL = 5  # 秒
+# 入库进程停止后指标在这段时间后过期，接口不会一直返回旧数据
+STATS_TIMEOUT = PUBLISH_INTERVAL * 3
+
+_publisher = None
+
+
+def _cache():
+    return caches[getattr(settings, 'SENSOR_LATEST_CACHE', 'default')]
+
+
+def is_web_role():
+    """web进程（start_all.py 的多worker拓扑）不运行入库客户端"""
+    return os.environ.get('MQTT_ROLE') == 'web'
+
+
+def collect(client):
+    """本进程的消息计数器和入库队列指标"""
+    return {
+        'messages': counters.snapshot(),
+        'ingest': client.writer.stats(),
+        'pid': os.getpid(),
+        'published_at': time.time(),
+    }
+
+
+def load(client):
+    """
+    返回入库指标 {'messages', 'ingest', 'pid', 'published_at'}：
+    web进程读取入库进程发布到缓存的指标，读不到时返回None；其他进程直接读取本进程的指标
+    """
+    if not is_web_role():
+        return collect(client)
+    return _cache().get(STATS_KEY)
+
+
+def start_publisher(client, interval=PUBLISH_INTERVAL):
+    """在入库进程中启动后台线程，定期把指标写入缓存"""
+    global _publisher
+    if _publisher is not None:
+        return
+
+    def publish():
+        cache = _cache()
+        while True:
+            try:
+                cache.set(STATS_KEY, collect(client), timeout=STATS_TIMEOUT)
+            except Exception as e:
+                logger.error(f"发布入库指标失败: {e}")
+            time.sleep(interval)
+
+    _publisher = threading.Thread(target=publish, name='mqtt-ingest-stats', daemon=True)
+    _publisher.start()
@@ -0,0 +1,75 @@
+"""
+传感器"最新值"缓存
+
+数据写入时（批量入库或post_save信号）更新缓存，latest接口直接读缓存，不查询数据库。
+缓存使用Django缓存框架：默认进程内缓存(locmem)，配置Redis后所有worker共享。
+冷启动或缓存被清空时回退到数据库查询一次，并写回缓存。
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LatestValueCache:
+    """按键保存最新一条记录的序列化数据，只接受时间更新的值"""
+
+    def __init__(self, prefix, cache_alias=None):
+        self.prefix = prefix
+        self.cache_alias = cache_alias or getattr(settings, 'SENSOR_LATEST_CACHE', 'default')
+        self.timeout = getattr(settings, 'SENSOR_LATEST_CACHE_TIMEOUT', None)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'db_loads': 0, 'updates': 0}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _key(self, key):
+        return f'{self.prefix}:latest:{key}'
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def update(self, key, timestamp, data):
+        """写入新值；timestamp早于已缓存的值时忽略（例如修改了一条旧记录）"""
+        cached = self.cache.get(self._key(key))
+        if cached is not None and cached['ts'] > timestamp.timestamp():
+            return False
+        self.cache.set(self._key(key), {'ts': timestamp.timestamp(), 'data': data}, timeout=self.timeout)
+        self._count('updates')
+        return True
+
+    def invalidate(self, key):
+        self.cache.delete(self._key(key))
+
+    def get(self, key, loader):
+        """
+        返回缓存的最新值。未命中时调用 loader() -> (timestamp, data) 或 None 从数据库加载，
+        数据库中也没有记录时返回None（不缓存空结果，下一次写入会直接填充）
+        """
+        cached = self.cache.get(self._key(key))
+        if cached is not None:
+            self._count('hits')
+            return cached['data']
+        self._count('misses')
+        loaded = loader()
+        if loaded is None:
+            return None
+        self._count('db_loads')
+        timestamp, data = loaded
+        self.update(key, timestamp, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['backend'] = self.cache.__class__.__name__
+        return stats
+
+
+# STM32原始消息的最新值缓存（键: 'stm32'）
+latest_cache = LatestValueCache('mqtt')
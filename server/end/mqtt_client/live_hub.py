@@ -0,0 +1,187 @@
+"""
+进程内的实时数据推送中心
+
+数据入库后调用 hub.publish(channel, data)，订阅者通过SSE接口实时收到最新值，
+仪表盘不再需要轮询 latest_data 接口。
+
+每个订阅者只保存每个频道的最新一条待发送数据（合并），
+慢客户端拿到的是最新值，而不是越积越多的历史消息。
+"""
+import asyncio
+import json
+import threading
+import time
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+# 没有新数据时发送SSE注释行的间隔（秒），防止代理服务器断开空闲连接
+KEEPALIVE_INTERVAL = 15
+
+
+class Subscription:
+    """一个订阅者。loop不为空时供异步视图使用，否则供同步视图（WSGI）使用"""
+
+    def __init__(self, hub, channels=None, loop=None):
+        self.hub = hub
+        self.channels = set(channels) if channels else None
+        self.coalesced = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._loop = loop
+        if loop is not None:
+            self._event = asyncio.Event()
+        else:
+            self._event = threading.Event()
+        self._signalled = False
+
+    def wants(self, channel):
+        return self.channels is None or channel in self.channels
+
+    def offer(self, channel, data):
+        """由发布线程调用：覆盖该频道尚未发送的数据并唤醒订阅者"""
+        with self._lock:
+            if channel in self._pending:
+                self.coalesced += 1
+            self._pending[channel] = data
+            if self._signalled:
+                return
+            self._signalled = True
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+        else:
+            self._event.set()
+
+    def _take(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._signalled = False
+            self._event.clear()
+        return pending
+
+    def get(self, timeout=None):
+        """阻塞等待，返回 {频道: 最新数据}，超时返回空字典"""
+        self._event.wait(timeout)
+        return self._take()
+
+    async def aget(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._take()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class LiveHub:
+    """发布/订阅中心，同时保存每个频道的最新值供新订阅者立即获取"""
+
+    def __init__(self):
+        self._subscribers = set()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, channel, data):
+        with self._lock:
+            self._latest[channel] = data
+            self.published += 1
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(channel):
+                subscription.offer(channel, data)
+
+    def latest(self, channel):
+        with self._lock:
+            return self._latest.get(channel)
+
+    def subscribe(self, channels=None, loop=None):
+        subscription = Subscription(self, channels, loop)
+        with self._lock:
+            self._subscribers.add(subscription)
+            snapshot = {c: d for c, d in self._latest.items() if subscription.wants(c)}
+        # 新订阅者先收到各频道的当前值
+        for channel, data in snapshot.items():
+            subscription.offer(channel, data)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            return {
+                'subscribers': len(subscribers),
+                'channels': len(self._latest),
+                'published': self.published,
+                'coalesced': sum(s.coalesced for s in subscribers),
+            }
+
+
+class EventStreamRenderer(BaseRenderer):
+    """让DRF的内容协商接受 Accept: text/event-stream（浏览器EventSource发送的请求头）"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return format_event('error', data)
+
+
+def format_event(channel, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f"event: {channel}\ndata: {payload}\n\n".encode('utf-8')
+
+
+def _sync_stream(hub, channels):
+    subscription = hub.subscribe(channels)
+    try:
+        yield b": connected\n\n"
+        while True:
+            pending = subscription.get(KEEPALIVE_INTERVAL)
+            if not pending:
+                yield f": keepalive {int(time.time())}\n\n".encode()
+            for channel, data in pending.items():
+                yield format_event(channel, data)
+    finally:
+        subscription.close()
+
+
+async def _async_stream(hub, channels):
+    subscription = hub.subscribe(channels, loop=asyncio.get_running_loop())
+    try:
+        yield b": connected\n\n"
+        while True:
+            pending = await subscription.aget(KEEPALIVE_INTERVAL)
+            if not pending:
+                yield f": keepalive {int(time.time())}\n\n".encode()
+            for channel, data in pending.items():
+                yield format_event(channel, data)
+    finally:
+        subscription.close()
+
+
+def sse_response(request, hub, channels=None):
+    """
+    返回SSE响应。ASGI部署时使用异步迭代，不占用线程；
+    WSGI（runserver）时每个连接占用一个工作线程。
+    """
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        stream = _async_stream(hub, channels)
+    else:
+        stream = _sync_stream(hub, channels)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# 进程内共享的推送中心
+hub = LiveHub()
@@ -0,0 +1,76 @@
+"""
+web进程中的实时推送中继
+
+由 start_all.py 启动时，入库在独立的 start_mqtt 进程(MQTT_ROLE=ingest)中完成，
+各web worker的推送中心(hub)收不到入库线程发布的数据。
+中继在每个web worker中以独立的client_id订阅代理，只解析消息并推送给本进程的SSE订阅者，不访问数据库。
+推送的数据结构与入库后推送的一致，只是没有数据库主键(id为None)。
+"""
+import logging
+import os
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.utils import timezone
+
+from .live_hub import hub
+from .payload_parser import parse_reading
+
+logger = logging.getLogger(__name__)
+
+
+class LiveRelay:
+    """订阅MQTT_TOPIC，把收到的消息推送到本进程的hub"""
+
+    def __init__(self):
+        self.client = mqtt.Client(client_id=f"{settings.MQTT_CLIENT_ID}-live-{os.getpid()}", clean_session=True)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+        if settings.MQTT_USERNAME and settings.MQTT_PASSWORD:
+            self.client.username_pw_set(settings.MQTT_USERNAME, settings.MQTT_PASSWORD)
+
+    def start(self):
+        host = settings.MQTT_BROKER_HOST
+        if host == '0.0.0.0':
+            host = 'localhost'
+        # connect_async + loop_start：代理暂时不可用时由paho后台重连，不阻塞worker启动
+        self.client.connect_async(host, settings.MQTT_BROKER_PORT, settings.MQTT_KEEPALIVE)
+        self.client.loop_start()
+        logger.info(f"实时推送中继已启动 (pid={os.getpid()})，订阅 {host}:{settings.MQTT_BROKER_PORT} {settings.MQTT_TOPIC}")
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(settings.MQTT_TOPIC)
+        else:
+            logger.error(f"实时推送中继连接MQTT代理失败，返回码: {rc}")
+
+    def on_message(self, client, userdata, msg):
+        try:
+            now = timezone.now()
+            payload = msg.payload.decode('utf-8', errors='replace')
+            reading = parse_reading(msg.topic, payload)
+            if reading is not None:
+                hub.publish(f"reading:{reading['device_id']}", {
+                    'id': None, 'topic': msg.topic, 'timestamp': now, **reading,
+                })
+            hub.publish('stm32', {
+                'id': None, 'topic': msg.topic, 'payload': payload, 'qos': msg.qos, 'timestamp': now,
+            })
+        except Exception as e:
+            logger.error(f"实时推送中继处理消息时出错: {e}")
+
+
+live_relay = None
+
+
+def start_live_relay():
+    """每个进程只启动一个中继"""
+    global live_relay
+    if live_relay is None:
+        live_relay = LiveRelay()
+        live_relay.start()
+    return live_relay
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT代理服务器压力测试客户端
+
+用asyncio模拟大量传感器同时连接并按固定速率发布温湿度数据，
+统计连接成功率、发布吞吐量以及QoS1的PUBACK往返延迟。
+
+示例:
+    python mqtt_client/loadtest.py --clients 2000 --rate 1 --duration 30 --qos 1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+
+try:
+    from . import mqtt_codec as codec
+except ImportError:  # 作为脚本直接运行
+    import mqtt_codec as codec
+
+
+class LoadStats:
+    def __init__(self):
+        self.connected = 0
+        self.connect_failed = 0
+        self.published = 0
+        self.acked = 0
+        self.disconnected = 0
+        self.ack_latencies = []
+
+
+async def sensor_client(index, args, stats, stop_at):
+    """单个模拟传感器：连接、按速率发布、QoS1时等待PUBACK"""
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(args.host, args.port), args.connect_timeout
+        )
+        writer.write(codec.connect_packet(f"loadtest-{index}", keepalive=args.keepalive))
+        packet = await asyncio.wait_for(codec.read_packet(reader), args.connect_timeout)
+        if packet is None or packet.type != codec.CONNACK or packet.body[1] != 0:
+            raise ConnectionError("CONNACK失败")
+    except Exception:
+        stats.connect_failed += 1
+        return
+    stats.connected += 1
+
+    pending = {}
+
+    async def read_acks():
+        while True:
+            packet = await codec.read_packet(reader)
+            if packet is None:
+                return
+            if packet.type == codec.PUBACK:
+                sent_at = pending.pop(codec.parse_packet_id(packet.body), None)
+                if sent_at is not None:
+                    stats.acked += 1
+                    stats.ack_latencies.append(time.perf_counter() - sent_at)
+
+    ack_task = asyncio.create_task(read_acks())
+    interval = 1.0 / args.rate
+    packet_id = 0
+    # 错开各客户端的首次发布时间，避免同时突发
+    next_send = time.perf_counter() + random.random() * interval
+    try:
+        while time.perf_counter() < stop_at and not ack_task.done():
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+            payload = json.dumps({
+                "temperature": round(random.uniform(15, 35), 1),
+                "humidity": round(random.uniform(30, 90), 1),
+            }).encode()
+            if args.qos:
+                packet_id = packet_id % 65535 + 1
+                pending[packet_id] = time.perf_counter()
+            writer.write(codec.publish_packet(args.topic, payload, args.qos, packet_id=packet_id or None))
+            stats.published += 1
+            await writer.drain()
+            next_send += interval
+        # 断开前等待最后几条消息的PUBACK
+        ack_deadline = time.perf_counter() + 1.0
+        while pending and not ack_task.done() and time.perf_counter() < ack_deadline:
+            await asyncio.sleep(0.01)
+        writer.write(codec.encode_packet(codec.DISCONNECT, 0))
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        stats.disconnected += 1
+    finally:
+        ack_task.cancel()
+        writer.close()
+
+
+async def run(args):
+    stats = LoadStats()
+    stop_at = time.perf_counter() + args.ramp + args.duration
+    tasks = []
+    ramp_delay = args.ramp / args.clients if args.clients else 0
+    start = time.perf_counter()
+    for i in range(args.clients):
+        tasks.append(asyncio.create_task(sensor_client(i, args, stats, stop_at)))
+        if ramp_delay:
+            await asyncio.sleep(ramp_delay)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(stats.ack_latencies)
+
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 2) if latencies else None
+
+    return {
+        "clients": args.clients,
+        "connected": stats.connected,
+        "connect_failed": stats.connect_failed,
+        "disconnected": stats.disconnected,
+        "published": stats.published,
+        "acked": stats.acked,
+        "publish_rate": round(stats.published / elapsed, 1),
+        "ack_p50_ms": pct(0.50),
+        "ack_p99_ms": pct(0.99),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def raise_fd_limit():
+    """尽量提高文件描述符上限，以支持上千个并发连接"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT代理服务器压力测试")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--clients", type=int, default=1000, help="并发传感器连接数")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个客户端每秒发布的消息数")
+    parser.add_argument("--duration", type=float, default=30, help="持续发布的秒数")
+    parser.add_argument("--ramp", type=float, default=5, help="建立全部连接所用的秒数")
+    parser.add_argument("--qos", type=int, choices=[0, 1], default=1)
+    parser.add_argument("--topic", default="stm32/dht11")
+    parser.add_argument("--keepalive", type=int, default=60)
+    parser.add_argument("--connect-timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    result = asyncio.run(run(args))
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT日志与计数器
+
+- install_queue_logging(): 把根日志器和其他自带处理器的日志器（如Django配置中propagate=False的'django'）
+  的处理器放到QueueListener后台线程中，业务线程（asyncio事件循环、paho网络线程）记日志只是入队，
+  不再同步写stdout/文件。
+- TopicSampler: 按主题限速的调试输出，每个主题每个时间窗口最多输出N条，其余只计数。
+- MessageCounters: 消息数、字节数、解析失败数及每秒速率，供接口查询和周期性汇总日志使用。
+
+主题来自客户端，数量不受控制，按主题保存的状态都限制在 MAX_TOPICS 个以内。
+
+只依赖标准库，内置代理服务器(example.py)和Django客户端共用。
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 按主题保存的状态（采样窗口、消息计数）最多保留的主题数
+MAX_TOPICS = 1000
+# 超过MAX_TOPICS后新主题的消息计入该键
+OTHER_TOPICS = '(other)'
+
+_listeners = []
+_listener_lock = threading.Lock()
+
+
+# --------------- 异步日志 ---------------
+def install_queue_logging(logger_name=None, queue_size=10000):
+    """
+    把日志器现有的处理器移到QueueListener线程中执行，返回启动的监听器列表。
+    指定logger_name时只处理该日志器；默认处理根日志器和其他所有已有处理器的日志器
+    （propagate=False的日志器记录不会传到根日志器，只移动根日志器的处理器时它们仍然同步输出）。
+    每个日志器一个队列，处理器仍然只处理原来日志器的记录。
+    队列满时直接丢弃新日志，记日志永远不会阻塞调用线程。重复调用不会重复安装。
+    """
+    with _listener_lock:
+        if _listeners:
+            return list(_listeners)
+        targets = [logging.getLogger(logger_name)]
+        if logger_name is None:
+            targets += [
+                existing for existing in logging.root.manager.loggerDict.values()
+                if isinstance(existing, logging.Logger) and existing.handlers
+            ]
+        for target in targets:
+            listener = _install(target, queue_size)
+            if listener is not None:
+                _listeners.append(listener)
+        if _listeners:
+            atexit.register(stop_queue_logging)
+        return list(_listeners)
+
+
+def _install(target, queue_size):
+    handlers = [h for h in target.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    if not handlers:
+        return None
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    for handler in handlers:
+        target.removeHandler(handler)
+    target.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_queue_logging():
+    """停止后台日志线程，队列中剩余的日志会先写完"""
+    with _listener_lock:
+        while _listeners:
+            _listeners.pop().stop()
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            type(self).dropped += 1
+
+
+# --------------- 按主题采样 ---------------
+class TopicSampler:
+    """每个主题每interval秒最多允许limit条调试输出，被抑制的条数在下次放行时一并报告"""
+
+    def __init__(self, limit=5, interval=10.0, max_topics=MAX_TOPICS):
+        self.limit = limit
+        self.interval = interval
+        self.max_topics = max_topics
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def allow(self, topic):
+        """返回 (是否输出, 上个窗口被抑制的条数)"""
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(topic)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.max_topics:
+                    self._evict(now)
+                self._windows.pop(topic, None)
+                self._windows[topic] = [now, 1, 0]
+                return True, suppressed
+            if window[1] < self.limit:
+                window[1] += 1
+                return True, 0
+            window[2] += 1
+            return False, 0
+
+    def _evict(self, now):
+        """主题数达到上限时先删除已过期的窗口，仍然超过时删除最早开始的（调用方持有锁）"""
+        expired = [topic for topic, window in self._windows.items() if now - window[0] >= self.interval]
+        for topic in expired:
+            del self._windows[topic]
+        # 窗口按开始时间的顺序插入，最前面的最早
+        while len(self._windows) >= self.max_topics:
+            del self._windows[next(iter(self._windows))]
+
+
+# --------------- 计数器 ---------------
+class MessageCounters:
+    """线程安全的消息计数器，snapshot()返回累计值和最近一个统计窗口内的速率"""
+
+    def __init__(self, rate_window=10.0, max_topics=MAX_TOPICS):
+        self.rate_window = rate_window
+        self.max_topics = max_topics
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._totals = {'messages': 0, 'bytes': 0, 'parse_failures': 0}
+        self._topics = {}
+        self._window_start = time.monotonic()
+        self._window_counts = dict(self._totals)
+        self._rates = {'messages_per_sec': 0.0, 'bytes_per_sec': 0.0, 'parse_failures_per_sec': 0.0}
+        self._reporter = None
+
+    def record_message(self, topic, size):
+        with self._lock:
+            self._totals['messages'] += 1
+            self._totals['bytes'] += size
+            if topic not in self._topics and len(self._topics) >= self.max_topics:
+                topic = OTHER_TOPICS
+            self._topics[topic] = self._topics.get(topic, 0) + 1
+            self._roll_window()
+
+    def record_parse_failure(self, topic=None):
+        with self._lock:
+            self._totals['parse_failures'] += 1
+            self._roll_window()
+
+    def _roll_window(self):
+        """超过统计窗口时根据窗口内的增量更新速率（调用方持有锁）"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.rate_window:
+            return
+        for key, value in self._totals.items():
+            self._rates[f'{key}_per_sec'] = round((value - self._window_counts[key]) / elapsed, 2)
+        self._window_counts = dict(self._totals)
+        self._window_start = now
+
+    def snapshot(self):
+        with self._lock:
+            self._roll_window()
+            return {
+                **self._totals,
+                **self._rates,
+                'topics': dict(self._topics),
+                'uptime_seconds': round(time.time() - self._started, 1),
+                'log_records_dropped': _NonBlockingQueueHandler.dropped,
+            }
+
+    def start_reporter(self, interval=60.0, log=None):
+        """启动后台线程，每interval秒输出一行汇总日志，替代逐条消息的输出"""
+        if self._reporter is not None:
+            return
+        log = log or logger
+
+        def report():
+            while True:
+                time.sleep(interval)
+                stats = self.snapshot()
+                log.info(f"消息统计: 累计 {stats['messages']} 条 / {stats['bytes']} 字节, "
+                         f"{stats['messages_per_sec']} 条/秒, {stats['bytes_per_sec']} 字节/秒, "
+                         f"解析失败 {stats['parse_failures']} 条")
+
+        self._reporter = threading.Thread(target=report, name='mqtt-counters-reporter', daemon=True)
+        self._reporter.start()
+
+
+# 进程内共享的计数器
+counters = MessageCounters()
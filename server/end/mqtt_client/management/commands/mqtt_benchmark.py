@@ -0,0 +1,368 @@
+"""
+MQTT入库端到端基准
+
+模拟N台设备发布温湿度数据（包含不规范载荷），测量从发布到数据行在STM32Data中可见的延迟、
+丢失率和CPU占用，单机运行，不需要外部代理。
+
+目标 (--target):
+    broker    进程内启动内置代理(AsyncMQTTBroker) + MQTTClient入库，设备模拟(device_sim.py)在子进程中通过TCP发布（默认）
+    client    不经过网络，直接调用MQTTClient.on_message，只测入库路径
+    external  向已运行的服务（如 start_all.py）发布，只轮询数据库
+
+示例:
+    MQTT_ROLE=ingest python manage.py mqtt_benchmark --devices 500 --rate 2 --duration 20
+    MQTT_ROLE=ingest python manage.py mqtt_benchmark --target external --port 1883 --json report.json
+"""
+import asyncio
+import collections
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import override_settings
+
+from mqtt_client import device_sim
+from mqtt_client.broker import AsyncMQTTBroker
+from mqtt_client.models import SensorReading, STM32Data
+from mqtt_client.mqtt_client import MQTTClient, mqtt_client
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def thread_cpu_seconds():
+    """Linux下按线程名统计本进程各线程的CPU时间（秒），其他平台返回空字典"""
+    names = {t.native_id: t.name for t in threading.enumerate()}
+    ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    result = {}
+    try:
+        tids = os.listdir('/proc/self/task')
+    except OSError:
+        return result
+    for tid in tids:
+        try:
+            with open(f'/proc/self/task/{tid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # 去掉"pid (comm)"后，utime/stime是第12、13个字段
+        name = names.get(int(tid), f'tid-{tid}')
+        result[name] = result.get(name, 0.0) + (int(fields[11]) + int(fields[12])) / ticks
+    return result
+
+
+class BrokerThread:
+    """在后台线程的事件循环中运行内置代理"""
+
+    def __init__(self, port):
+        self.broker = AsyncMQTTBroker('127.0.0.1', port)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='benchmark-broker', daemon=True)
+        self._started = threading.Event()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.broker.start())
+        self._started.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        self._started.wait(10)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.broker.stop(), self.loop).result(10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+class RowPoller:
+    """轮询STM32Data中新出现的数据行，记录每行第一次可见的时间"""
+
+    def __init__(self, after_id, interval):
+        self.last_id = after_id
+        self.interval = interval
+        self.rows = []
+        self.last_seen_at = time.time()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='benchmark-poller', daemon=True)
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.poll()
+        finally:
+            connection.close()
+
+    def poll(self):
+        batch = list(STM32Data.objects.filter(id__gt=self.last_id).order_by('id').values_list('id', 'payload'))
+        if batch:
+            now = time.time()
+            self.last_id = batch[-1][0]
+            self.rows.extend((payload, now) for _, payload in batch)
+            self.last_seen_at = now
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.thread.join()
+
+
+def simulate_subprocess(args):
+    """broker/external目标：在子进程中运行device_sim.py，与入库路径不争用同一个GIL"""
+    command = [
+        sys.executable, device_sim.__file__, '--sends',
+        '--host', args.host, '--port', str(args.port), '--devices', str(args.devices),
+        '--rate', str(args.rate), '--duration', str(args.duration), '--qos', str(args.qos),
+        '--malformed', str(args.malformed), '--topic', args.topic,
+        '--device-prefix', args.device_prefix, '--seed', str(args.seed),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True, encoding='utf-8')
+    if completed.returncode != 0:
+        raise CommandError(f'设备模拟进程失败: {completed.stderr.strip()}')
+    result = json.loads(completed.stdout)
+    result['sends'] = [tuple(send) for send in result['sends']]
+    return result
+
+
+def simulate_direct(client, args, topic):
+    """client目标：在当前进程按总速率直接调用on_message（模拟paho网络线程）"""
+    stats = device_sim.SimStats()
+    rngs = [random.Random(f'{args.seed}-{i}') for i in range(args.devices)]
+    seqs = [0] * args.devices
+    interval = 1.0 / (args.rate * args.devices)
+    start = time.perf_counter()
+    next_send = start
+    index = 0
+    while time.perf_counter() - start < args.duration:
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        seqs[index] += 1
+        variant, payload = device_sim.make_payload(rngs[index], f'{args.device_prefix}-{index}', seqs[index], args.malformed)
+        stats.sends.append((payload, time.time()))
+        client.on_message(None, None, SimpleNamespace(topic=topic, payload=payload.encode('utf-8'), qos=args.qos))
+        stats.published += 1
+        stats.variants[variant] = stats.variants.get(variant, 0) + 1
+        index = (index + 1) % args.devices
+        next_send += interval
+    return {
+        'devices': args.devices, 'connected': args.devices, 'connect_failed': 0, 'disconnected': 0,
+        'published': stats.published, 'acked': 0, 'variants': stats.variants,
+        'elapsed_s': round(time.perf_counter() - start, 3), 'cpu_seconds': None, 'sends': stats.sends,
+    }
+
+
+def match_latencies(sends, rows):
+    """按载荷把数据行与发布记录配对（同一载荷按先进先出），返回 (延迟列表秒, 未配对的行数)"""
+    pending = collections.defaultdict(collections.deque)
+    for payload, sent_at in sends:
+        pending[payload].append(sent_at)
+    latencies = []
+    unmatched = 0
+    for payload, visible_at in rows:
+        queue = pending.get(payload)
+        if queue:
+            latencies.append(visible_at - queue.popleft())
+        else:
+            unmatched += 1
+    return latencies, unmatched
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+
+class Command(BaseCommand):
+    help = 'MQTT入库端到端基准：模拟设备发布数据，测量入库延迟、丢失率和CPU占用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['broker', 'client', 'external'], default='broker')
+        parser.add_argument('--host', default='127.0.0.1', help='external目标的代理地址')
+        parser.add_argument('--port', type=int, default=None, help='external目标的代理端口（默认MQTT_BROKER_PORT）')
+        parser.add_argument('--devices', type=int, default=100, help='虚拟设备数')
+        parser.add_argument('--rate', type=float, default=1.0, help='每台设备每秒发布的消息数')
+        parser.add_argument('--duration', type=float, default=10, help='持续发布的秒数')
+        parser.add_argument('--qos', type=int, choices=[0, 1], default=0)
+        parser.add_argument('--malformed', type=float, default=0.2, help='不规范载荷的比例 (0~1)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--poll-interval', type=float, default=0.02, help='轮询数据库的间隔（秒）')
+        parser.add_argument('--drain', type=float, default=5.0, help='发布结束后最多等待多久没有新数据行（秒）')
+        parser.add_argument('--json', dest='json_path', help='把报告另存为JSON文件')
+        parser.add_argument('--keep', action='store_true', help='保留基准写入的数据（external目标始终保留）')
+
+    def handle(self, *args, **options):
+        # 本进程启动时自动连接的MQTT客户端会重复入库并干扰统计（设置 MQTT_ROLE=ingest 可避免自动连接）
+        if mqtt_client.writer.stats()['running']:
+            mqtt_client.disconnect()
+
+        target = options['target']
+        topic = settings.MQTT_TOPIC
+        sim_args = SimpleNamespace(
+            host=options['host'], port=options['port'] or settings.MQTT_BROKER_PORT,
+            devices=options['devices'], rate=options['rate'], duration=options['duration'],
+            qos=options['qos'], malformed=options['malformed'], topic=topic,
+            device_prefix=f"bench{os.getpid()}", seed=options['seed'],
+        )
+        start_row_id = STM32Data.objects.aggregate(m=Max('id'))['m'] or 0
+        start_reading_id = SensorReading.objects.aggregate(m=Max('id'))['m'] or 0
+
+        broker = ingest = None
+        if target == 'broker':
+            sim_args.host, sim_args.port = '127.0.0.1', free_port()
+            broker = BrokerThread(sim_args.port)
+            broker.start()
+        overrides = override_settings(MQTT_BROKER_HOST='127.0.0.1', MQTT_BROKER_PORT=sim_args.port,
+                                      MQTT_CLIENT_ID=f'mqtt-benchmark-{os.getpid()}')
+        overrides.enable()
+        try:
+            if target == 'broker':
+                ingest = MQTTClient()
+                ingest.connect()
+                self._wait_subscribed(broker.broker, topic)
+            elif target == 'client':
+                ingest = MQTTClient()
+                ingest.writer.start()
+
+            poller = RowPoller(start_row_id, options['poll_interval'])
+            poller.start()
+            usage_before = resource.getrusage(resource.RUSAGE_SELF)
+            threads_before = thread_cpu_seconds()
+            wall_start = time.time()
+
+            self.stdout.write(f"开始发布: {target}, {sim_args.devices}台设备 × {sim_args.rate}条/秒, "
+                              f"持续{sim_args.duration}秒, 不规范载荷{sim_args.malformed:.0%}")
+            if target == 'client':
+                sim = simulate_direct(ingest, sim_args, topic)
+            else:
+                sim = simulate_subprocess(sim_args)
+
+            # 等到全部数据行可见，或连续drain秒没有新数据行
+            published = sim['published']
+            while len(poller.rows) < published and time.time() - poller.last_seen_at < options['drain']:
+                time.sleep(options['poll_interval'])
+            wall_end = time.time()
+            threads_after = thread_cpu_seconds()
+            usage_after = resource.getrusage(resource.RUSAGE_SELF)
+            writer_stats = ingest.writer.stats() if ingest else None
+            if target == 'broker':
+                ingest.disconnect()
+            elif target == 'client':
+                ingest.writer.stop()
+            poller.stop()
+            poller.poll()
+        finally:
+            overrides.disable()
+            if broker is not None:
+                broker.stop()
+
+        report = self._report(options, sim, poller, wall_start, wall_end, usage_before, usage_after,
+                              threads_before, threads_after, writer_stats, broker)
+        self._print_report(report)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"报告已保存到 {options['json_path']}")
+
+        if target != 'external' and not options['keep']:
+            STM32Data.objects.filter(id__gt=start_row_id).delete()
+            SensorReading.objects.filter(id__gt=start_reading_id).delete()
+
+    def _wait_subscribed(self, broker, topic, timeout=10):
+        deadline = time.time() + timeout
+        while not broker.subscriptions.match(topic):
+            if time.time() > deadline:
+                raise CommandError('MQTTClient未能在超时时间内订阅内置代理')
+            time.sleep(0.01)
+
+    def _report(self, options, sim, poller, wall_start, wall_end, usage_before, usage_after,
+                threads_before, threads_after, writer_stats, broker):
+        latencies, unmatched = match_latencies(sim['sends'], poller.rows)
+        latencies.sort()
+        published = sim['published']
+        visible = len(latencies)
+        elapsed = wall_end - wall_start
+        cpu = (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime)
+        thread_cpu = {
+            name: round(seconds - threads_before.get(name, 0.0), 3)
+            for name, seconds in threads_after.items()
+            if seconds - threads_before.get(name, 0.0) >= 0.01
+        }
+        return {
+            'target': options['target'],
+            'devices': sim['devices'],
+            'rate_per_device': options['rate'],
+            'duration_s': options['duration'],
+            'qos': options['qos'],
+            'malformed_ratio': options['malformed'],
+            'connected': sim['connected'],
+            'connect_failed': sim['connect_failed'],
+            'published': published,
+            'publish_rate': round(published / sim['elapsed_s'], 1) if sim['elapsed_s'] else 0.0,
+            'variants': sim['variants'],
+            'rows_visible': visible,
+            'rows_unmatched': unmatched,
+            'dropped': published - visible,
+            'drop_rate': round((published - visible) / published, 5) if published else 0.0,
+            'ingest_rows_per_sec': round(visible / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p99': percentile(latencies, 0.99),
+                'max': round(latencies[-1] * 1000, 2) if latencies else None,
+                'poll_interval': options['poll_interval'] * 1000,
+            },
+            'cpu': {
+                'benchmark_process_seconds': round(cpu, 3),
+                'benchmark_process_percent': round(cpu / elapsed * 100, 1) if elapsed else 0.0,
+                'simulator_process_seconds': sim['cpu_seconds'],
+                'threads': thread_cpu,
+            },
+            'writer': writer_stats,
+            'broker': dict(broker.broker.stats) if broker else None,
+            'elapsed_s': round(elapsed, 3),
+        }
+
+    def _print_report(self, report):
+        latency = report['latency_ms']
+        cpu = report['cpu']
+        lines = [
+            '',
+            f"MQTT入库端到端基准 (target={report['target']}, 设备={report['devices']}, "
+            f"每台{report['rate_per_device']}条/秒, QoS{report['qos']}, 不规范载荷{report['malformed_ratio']:.0%})",
+            f"  发布: {report['published']} 条 ({report['publish_rate']} 条/秒), 连接失败 {report['connect_failed']}",
+            f"  入库可见: {report['rows_visible']} 行 ({report['ingest_rows_per_sec']} 行/秒), "
+            f"丢失 {report['dropped']} 条 ({report['drop_rate']:.3%}), 无法配对的行 {report['rows_unmatched']}",
+            f"  端到端延迟(ms): p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']} "
+            f"(轮询间隔 {latency['poll_interval']:.0f}ms)",
+            f"  CPU: 基准进程 {cpu['benchmark_process_seconds']}秒 ({cpu['benchmark_process_percent']}% 单核), "
+            + (f"设备模拟 {cpu['simulator_process_seconds']}秒" if cpu['simulator_process_seconds'] is not None
+               else "设备模拟在基准进程内"),
+        ]
+        if cpu['threads']:
+            busiest = sorted(cpu['threads'].items(), key=lambda item: -item[1])[:6]
+            lines.append('  线程CPU(秒): ' + ', '.join(f'{name}={seconds}' for name, seconds in busiest))
+        if report['writer']:
+            writer = report['writer']
+            lines.append(f"  写入线程: {writer['flushes']}次批量写入, 平均{writer['flush_ms_avg']}ms, "
+                         f"队列丢弃 {writer['dropped']} 条")
+        lines.append('  载荷变体: ' + ', '.join(f'{k}={v}' for k, v in sorted(report['variants'].items())))
+        self.stdout.write('\n'.join(lines))
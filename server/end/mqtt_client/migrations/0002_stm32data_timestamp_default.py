@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt_client', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stm32data',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='接收时间'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt_client', '0002_stm32data_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64, verbose_name='设备标识')),
+                ('topic', models.CharField(max_length=255, verbose_name='主题')),
+                ('temperature', models.FloatField(blank=True, null=True, verbose_name='温度')),
+                ('humidity', models.FloatField(blank=True, null=True, verbose_name='湿度')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='接收时间')),
+            ],
+            options={
+                'verbose_name': '传感器读数',
+                'verbose_name_plural': '传感器读数',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stm32data',
+            index=models.Index(fields=['timestamp'], name='stm32data_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['device_id', 'timestamp'], name='reading_device_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensorreading',
+            index=models.Index(fields=['timestamp'], name='reading_time_idx'),
+        ),
+    ]
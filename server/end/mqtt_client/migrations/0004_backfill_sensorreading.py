@@ -0,0 +1,175 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:11
+
+import json
+import math
+import re
+
+from django.db import migrations
+
+# 每次读取和写入的行数，避免一次性把整张表载入内存
+CHUNK_SIZE = 2000
+
+# ---------------------------------------------------------------------------
+# 载荷解析，复制自迁移时的 mqtt_client.payload_parser（只用标准库json）。
+# 迁移不导入应用代码，之后修改解析规则不会改变这个迁移的结果，也不会导致迁移失败。
+# ---------------------------------------------------------------------------
+_PAIR_RE = re.compile(
+    r"""["']?([A-Za-z_][\w.-]*)["']?\s*[:=]\s*(?:"([^"]*)"|'([^']*)'|([^,;}\s"']+))"""
+)
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_NUMBER_LIST_SPLIT_RE = re.compile(r"\s*[,;\s]\s*")
+
+FIELD_ALIASES = {
+    'temperature': 'temperature',
+    'temp': 'temperature',
+    'tmp': 'temperature',
+    't': 'temperature',
+    'humidity': 'humidity',
+    'humi': 'humidity',
+    'hum': 'humidity',
+    'h': 'humidity',
+    'device_id': 'device_id',
+    'device': 'device_id',
+}
+METRIC_FIELDS = ('temperature', 'humidity')
+POSITIONAL_FIELDS = ('temperature', 'humidity')
+
+
+def _coerce(value):
+    if _NUMBER_RE.fullmatch(value):
+        number = float(value)
+        return int(number) if number.is_integer() and '.' not in value else number
+    return value
+
+
+def _parse_pairs(text):
+    pairs = {}
+    for key, double_quoted, single_quoted, bare in _PAIR_RE.findall(text):
+        if double_quoted or single_quoted:
+            pairs[key] = double_quoted or single_quoted
+        else:
+            pairs[key] = _coerce(bare)
+    return pairs or None
+
+
+def _parse_object(text):
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return data
+    except ValueError:
+        pass
+    return _parse_pairs(text)
+
+
+def _parse_numbers(text):
+    parts = [part for part in _NUMBER_LIST_SPLIT_RE.split(text) if part]
+    if not parts or not all(_NUMBER_RE.fullmatch(part) for part in parts):
+        return _parse_pairs(text)
+    if len(parts) == 1:
+        return {'value': float(parts[0])}
+    return {field: float(part) for field, part in zip(POSITIONAL_FIELDS, parts)}
+
+
+def _parse_quoted(text):
+    while len(text) >= 2 and text[0] in '"\'' and text[-1] == text[0]:
+        text = text[1:-1].strip()
+    if not text:
+        return None
+    parser = _DISPATCH.get(text[0], _parse_pairs)
+    return _parse_pairs(text) if parser is _parse_quoted else parser(text)
+
+
+_DISPATCH = {'{': _parse_object, '"': _parse_quoted, "'": _parse_quoted}
+for _char in '0123456789-+.':
+    _DISPATCH[_char] = _parse_numbers
+
+
+def _parse_payload(payload):
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8', errors='replace')
+    text = payload.strip()
+    if not text:
+        return None
+    parser = _DISPATCH.get(text[0], _parse_pairs)
+    try:
+        return parser(text)
+    except (ValueError, RecursionError):
+        return None
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = _NUMBER_RE.match(value.strip())
+        if match is None:
+            return None
+        value = match.group()
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_reading(topic, payload):
+    """载荷 -> SensorReading字段 {'device_id', 'temperature', 'humidity'}，没有任何指标时返回None"""
+    data = _parse_payload(payload)
+    if not data:
+        return None
+
+    reading = {'device_id': topic, 'temperature': None, 'humidity': None}
+    for key, value in data.items():
+        field = FIELD_ALIASES.get(str(key).lower())
+        if field == 'device_id':
+            if value not in (None, ''):
+                reading['device_id'] = str(value)[:64]
+        elif field is not None:
+            reading[field] = _to_float(value)
+
+    if all(reading[metric] is None for metric in METRIC_FIELDS):
+        return None
+    return reading
+
+
+def backfill_readings(apps, schema_editor):
+    """按主键分块解析已有的STM32Data载荷，写入SensorReading"""
+    STM32Data = apps.get_model('mqtt_client', 'STM32Data')
+    SensorReading = apps.get_model('mqtt_client', 'SensorReading')
+    db_alias = schema_editor.connection.alias
+
+    last_pk = 0
+    while True:
+        rows = list(
+            STM32Data.objects.using(db_alias)
+            .filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', 'topic', 'payload', 'timestamp')[:CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        readings = []
+        for _, topic, payload, timestamp in rows:
+            reading = parse_reading(topic, payload)
+            if reading is not None:
+                readings.append(SensorReading(topic=topic, timestamp=timestamp, **reading))
+        SensorReading.objects.using(db_alias).bulk_create(readings)
+
+
+def remove_readings(apps, schema_editor):
+    SensorReading = apps.get_model('mqtt_client', 'SensorReading')
+    SensorReading.objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mqtt_client', '0003_sensorreading'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_readings, remove_readings),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 
@@ -7,7 +8,7 @@ class STM32Data(models.Model):
     topic = models.CharField(max_length=255, verbose_name='主题')
     payload = models.TextField(verbose_name='数据内容')
     qos = models.IntegerField(default=0, verbose_name='服务质量')
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name='接收时间')
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='接收时间')  # 批量入库时使用消息的接收时间
     
     def __str__(self):
         return f"{self.topic} - {self.timestamp}"
@@ -16,3 +17,27 @@ class STM32Data(models.Model):
         verbose_name = 'STM32数据'
         verbose_name_plural = 'STM32数据'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp'], name='stm32data_time_idx'),
+        ]
+
+
+class SensorReading(models.Model):
+    """入库时从STM32Data载荷解析出的传感器读数"""
+    device_id = models.CharField(max_length=64, verbose_name='设备标识')
+    topic = models.CharField(max_length=255, verbose_name='主题')
+    temperature = models.FloatField(null=True, blank=True, verbose_name='温度')
+    humidity = models.FloatField(null=True, blank=True, verbose_name='湿度')
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name='接收时间')
+
+    def __str__(self):
+        return f"{self.device_id} - {self.timestamp}"
+
+    class Meta:
+        verbose_name = '传感器读数'
+        verbose_name_plural = '传感器读数'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['device_id', 'timestamp'], name='reading_device_time_idx'),
+            models.Index(fields=['timestamp'], name='reading_time_idx'),
+        ]
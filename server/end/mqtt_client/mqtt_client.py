@@ -1,9 +1,9 @@
 import paho.mqtt.client as mqtt
-import json
 import logging
 import socket
 from django.conf import settings
-from .models import STM32Data
+from .ingest import STM32DataWriter
+from .log_pipeline import TopicSampler, counters
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,16 @@ class MQTTClient:
         self.client.on_message = self.on_message
         self.client.on_disconnect = self.on_disconnect
         
+        # 消息批量入库，on_message只负责入队
+        self.writer = STM32DataWriter(
+            batch_size=settings.MQTT_INGEST_BATCH_SIZE,
+            flush_interval=settings.MQTT_INGEST_FLUSH_INTERVAL_MS / 1000,
+            queue_size=settings.MQTT_INGEST_QUEUE_SIZE,
+            overflow=settings.MQTT_INGEST_OVERFLOW,
+        )
+        # 调试输出按主题采样，避免高频消息刷屏
+        self.sampler = TopicSampler(settings.MQTT_LOG_SAMPLE_LIMIT, settings.MQTT_LOG_SAMPLE_INTERVAL)
+        
         # 如果设置了用户名密码，则进行认证
         if settings.MQTT_USERNAME and settings.MQTT_PASSWORD:
             self.client.username_pw_set(settings.MQTT_USERNAME, settings.MQTT_PASSWORD)
@@ -48,6 +58,7 @@ class MQTTClient:
                 logger.warning(f"MQTT端口 {settings.MQTT_BROKER_PORT} 已被占用，假设已有MQTT代理服务器在运行")
                 logger.info(f"尝试作为MQTT客户端连接到 {connect_host}:{settings.MQTT_BROKER_PORT}...")
             
+            self.writer.start()
             logger.info(f"正在连接到MQTT代理: {connect_host}:{settings.MQTT_BROKER_PORT}")
             self.client.connect(
                 connect_host, 
@@ -65,6 +76,7 @@ class MQTTClient:
         try:
             self.client.loop_stop()
             self.client.disconnect()
+            self.writer.stop()
             logger.info("MQTT客户端已断开连接")
         except Exception as e:
             logger.error(f"断开MQTT连接时出错: {str(e)}")
@@ -97,94 +109,26 @@ class MQTTClient:
                 logger.error(f"重新连接MQTT失败: {str(e)}")
     
     def on_message(self, client, userdata, msg):
-        """消息接收回调"""
+        """消息接收回调（运行在paho网络线程中，只入队不访问数据库）"""
         try:
+            counters.record_message(msg.topic, len(msg.payload))
             payload = msg.payload.decode('utf-8', errors='replace')
-            logger.info(f"从主题 {msg.topic} 接收到消息: {payload}")
-            
-            # 直接打印接收到的原始数据
-            print(f"\n===== MQTT数据接收 =====")
-            print(f"主题: {msg.topic}")
-            print(f"数据: {payload}")
-            print(f"QoS: {msg.qos}")
-            print(f"=======================\n")
-            
-            # 存储接收到的消息
-            STM32Data.objects.create(
-                topic=msg.topic,
-                payload=payload,
-                qos=msg.qos
-            )
-            
-            # 尝试解析JSON数据并处理
-            try:
-                payload_data = json.loads(payload)
-                print(f">>> 解析为JSON: {json.dumps(payload_data, ensure_ascii=False, indent=2)}")
-                self.process_message(payload_data)
-            except json.JSONDecodeError:
-                logger.warning(f"消息不是有效的JSON格式: {payload}")
-                print(f">>> 非JSON格式数据")
-                # 如果不是JSON，则作为原始数据处理
-                self.process_raw_message(payload)
-                
+            if not self.writer.submit(msg.topic, payload, msg.qos):
+                self.log_sampled(msg.topic, f"写入队列已满，丢弃主题 {msg.topic} 的消息")
+            else:
+                self.log_sampled(msg.topic, f"从主题 {msg.topic} 接收到消息: {payload} (QoS {msg.qos})")
         except Exception as e:
             logger.error(f"处理MQTT消息时发生错误: {str(e)}")
-            print(f"处理MQTT消息时发生错误: {str(e)}")
     
-    def process_message(self, data):
-        """处理JSON格式的消息"""
-        logger.info(f"处理JSON消息: {data}")
-        # 打印格式化的数据信息
-        print(f"\n----- 处理JSON数据 -----")
-        
-        # 针对温湿度数据的特殊处理
-        if isinstance(data, dict) and ('temperature' in data or 'humidity' in data):
-            temp = data.get('temperature', 'N/A')
-            humidity = data.get('humidity', 'N/A')
-            print(f"温度: {temp}°C")
-            print(f"湿度: {humidity}%")
-        else:
-            # 其他类型的JSON数据
-            for key, value in data.items():
-                print(f"{key}: {value}")
-        
-        print(f"-------------------------\n")
-        # 这里可以根据实际需求处理JSON数据
-        # 例如：更新状态、触发事件等
-    
-    def process_raw_message(self, data):
-        """处理非JSON格式的原始消息"""
-        logger.info(f"处理原始消息: {data}")
-        
-        print(f"\n----- 处理原始数据 -----")
-        # 尝试提取常见格式的数据
-        if "temperature" in data and "humidity" in data:
-            # 尝试简单解析
-            try:
-                temp_start = data.find("temperature") + len("temperature")
-                temp_end = data.find(",", temp_start)
-                if temp_end == -1:
-                    temp_end = data.find("}", temp_start)
-                
-                humidity_start = data.find("humidity") + len("humidity")
-                humidity_end = data.find("}", humidity_start)
-                
-                temp = data[temp_start:temp_end].strip(': "\'')
-                humidity = data[humidity_start:humidity_end].strip(': "\'')
-                
-                print(f"简易解析 - 温度: {temp}°C")
-                print(f"简易解析 - 湿度: {humidity}%")
-            except Exception as e:
-                print(f"简易解析失败: {e}")
-                print(f"原始数据: {data}")
-        elif data.replace('.', '').strip().isdigit():
-            print(f"数值数据: {data}")
-        else:
-            print(f"原始数据: {data}")
-        
-        print(f"-------------------------\n")
-        # 这里可以根据实际需求处理原始数据
-        # 例如：解析特定格式的数据、触发事件等
+    def log_sampled(self, topic, message):
+        """按主题采样输出调试日志"""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        allowed, suppressed = self.sampler.allow(topic)
+        if allowed:
+            if suppressed:
+                logger.debug(f"主题 {topic} 上个窗口省略了 {suppressed} 条调试输出")
+            logger.debug(message)
 
 def host_is_localhost(host):
     """判断主机是否为本地主机"""
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT 3.1.1 报文编解码
+
+只依赖标准库，供内置代理服务器(broker.py)和压测客户端(loadtest.py)共用。
+报文读取基于 asyncio.StreamReader.readexactly，能正确处理被TCP拆分或合并的报文。
+"""
+
+import asyncio
+import struct
+
+# 报文类型
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+PUBREC = 5
+PUBREL = 6
+PUBCOMP = 7
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+# 单个报文最大长度（MQTT剩余长度字段最多4字节）
+MAX_REMAINING_LENGTH = 268435455
+
+PINGRESP_PACKET = b"\xd0\x00"
+
+
+class MQTTProtocolError(Exception):
+    """报文格式错误"""
+
+
+class Packet:
+    """解码后的报文：类型、固定头标志位和可变头+载荷"""
+    __slots__ = ("type", "flags", "body")
+
+    def __init__(self, packet_type, flags, body):
+        self.type = packet_type
+        self.flags = flags
+        self.body = body
+
+
+async def read_packet(reader, max_size=MAX_REMAINING_LENGTH):
+    """从StreamReader读取一个完整报文。
+    连接正常关闭时返回None，报文被截断时抛出asyncio.IncompleteReadError。"""
+    try:
+        header = await reader.readexactly(1)
+    except asyncio.IncompleteReadError:
+        return None
+
+    # 剩余长度：变长编码，最多4字节
+    remaining = 0
+    multiplier = 1
+    for _ in range(4):
+        encoded = (await reader.readexactly(1))[0]
+        remaining += (encoded & 0x7F) * multiplier
+        if not encoded & 0x80:
+            break
+        multiplier *= 128
+    else:
+        raise MQTTProtocolError("剩余长度字段超过4字节")
+
+    if remaining > max_size:
+        raise MQTTProtocolError(f"报文过大: {remaining}字节")
+
+    body = await reader.readexactly(remaining) if remaining else b""
+    return Packet(header[0] >> 4, header[0] & 0x0F, body)
+
+
+def encode_remaining_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length:
+            byte |= 0x80
+        encoded.append(byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_packet(packet_type, flags, body=b""):
+    return bytes([(packet_type << 4) | flags]) + encode_remaining_length(len(body)) + body
+
+
+def encode_string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack(">H", len(data)) + data
+
+
+def read_string(body, offset):
+    """读取长度前缀的UTF-8字符串，返回 (字符串, 新偏移)"""
+    if offset + 2 > len(body):
+        raise MQTTProtocolError("字符串长度字段被截断")
+    (length,) = struct.unpack_from(">H", body, offset)
+    end = offset + 2 + length
+    if end > len(body):
+        raise MQTTProtocolError("字符串内容被截断")
+    return body[offset + 2:end].decode("utf-8", errors="replace"), end
+
+
+# --------------- 解码 ---------------
+def parse_connect(body):
+    """解析CONNECT报文，返回 dict(protocol, level, flags, keepalive, client_id)"""
+    protocol, offset = read_string(body, 0)
+    if offset + 4 > len(body):
+        raise MQTTProtocolError("CONNECT报文被截断")
+    level, flags, keepalive = struct.unpack_from(">BBH", body, offset)
+    client_id, _ = read_string(body, offset + 4)
+    return {
+        "protocol": protocol,
+        "level": level,
+        "flags": flags,
+        "keepalive": keepalive,
+        "client_id": client_id,
+    }
+
+
+def parse_publish(flags, body):
+    """解析PUBLISH报文，返回 (topic, payload, qos, retain, packet_id)"""
+    qos = (flags >> 1) & 0x03
+    retain = bool(flags & 0x01)
+    topic, offset = read_string(body, 0)
+    packet_id = None
+    if qos:
+        if offset + 2 > len(body):
+            raise MQTTProtocolError("PUBLISH报文缺少报文标识符")
+        (packet_id,) = struct.unpack_from(">H", body, offset)
+        offset += 2
+    return topic, body[offset:], qos, retain, packet_id
+
+
+def parse_subscribe(body):
+    """解析SUBSCRIBE报文，返回 (packet_id, [(topic_filter, qos)])"""
+    (packet_id,) = struct.unpack_from(">H", body, 0)
+    offset = 2
+    topics = []
+    while offset < len(body):
+        topic, offset = read_string(body, offset)
+        if offset >= len(body):
+            raise MQTTProtocolError("SUBSCRIBE报文缺少QoS")
+        topics.append((topic, body[offset] & 0x03))
+        offset += 1
+    return packet_id, topics
+
+
+def parse_unsubscribe(body):
+    """解析UNSUBSCRIBE报文，返回 (packet_id, [topic_filter])"""
+    (packet_id,) = struct.unpack_from(">H", body, 0)
+    offset = 2
+    topics = []
+    while offset < len(body):
+        topic, offset = read_string(body, offset)
+        topics.append(topic)
+    return packet_id, topics
+
+
+def parse_packet_id(body):
+    (packet_id,) = struct.unpack_from(">H", body, 0)
+    return packet_id
+
+
+# --------------- 编码 ---------------
+def connect_packet(client_id, keepalive=60, clean_session=True):
+    flags = 0x02 if clean_session else 0x00
+    body = encode_string("MQTT") + struct.pack(">BBH", 4, flags, keepalive) + encode_string(client_id)
+    return encode_packet(CONNECT, 0, body)
+
+
+def connack_packet(return_code=0, session_present=False):
+    return encode_packet(CONNACK, 0, bytes([1 if session_present else 0, return_code]))
+
+
+def publish_packet(topic, payload, qos=0, retain=False, packet_id=None):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack(">H", packet_id)
+    body += payload
+    return encode_packet(PUBLISH, (qos << 1) | (1 if retain else 0), body)
+
+
+def ack_packet(packet_type, packet_id):
+    """PUBACK / PUBREC / PUBCOMP / UNSUBACK（PUBREL固定头标志位为2）"""
+    flags = 0x02 if packet_type == PUBREL else 0x00
+    return encode_packet(packet_type, flags, struct.pack(">H", packet_id))
+
+
+def subscribe_packet(packet_id, topics):
+    body = struct.pack(">H", packet_id)
+    for topic, qos in topics:
+        body += encode_string(topic) + bytes([qos])
+    return encode_packet(SUBSCRIBE, 0x02, body)
+
+
+def suback_packet(packet_id, granted):
+    return encode_packet(SUBACK, 0, struct.pack(">H", packet_id) + bytes(granted))
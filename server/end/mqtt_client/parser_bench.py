@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+传感器载荷解析器的模糊测试与吞吐量基准
+
+模糊测试: 对各种格式的样本随机截断、插入、替换字符，检查parse_reading从不抛出异常，
+且解析出的温湿度要么为None要么是有限浮点数。
+吞吐量: 按载荷格式分别统计每秒可解析的消息数，并与旧的 replace("'", '"') + json.loads
++ find()切片的解析方式对比。
+
+示例:
+    python mqtt_client/parser_bench.py --fuzz 200000 --messages 100000
+"""
+
+import argparse
+import json
+import math
+import random
+import string
+import time
+
+try:
+    from . import payload_parser
+except ImportError:  # 作为脚本直接运行
+    import payload_parser
+
+SAMPLES = {
+    "json": '{"temperature": 25.5, "humidity": 60.2}',
+    "pseudo_json": "{'temperature': 25.5, humidity: 60.2}",
+    "key_value": "temperature:25.5,humidity:60.2",
+    "numbers": "25.5,60.2",
+    "quoted_json": '"{"temperature": 25.5, "humidity": 60.2}"',
+    "garbage": "Hello_World",
+}
+
+
+def legacy_parse(payload):
+    """旧实现（example.process_message / MQTTClient.process_raw_message）的解析路径，用于对比"""
+    try:
+        return json.loads(payload)
+    except json.JSONDecodeError:
+        pass
+    fixed_payload = payload.strip()
+    if fixed_payload.startswith('"') and fixed_payload.endswith('"'):
+        fixed_payload = fixed_payload[1:-1]
+    fixed_payload = fixed_payload.replace("'", '"')
+    try:
+        return json.loads(fixed_payload)
+    except json.JSONDecodeError:
+        pass
+    if "temperature" in payload and "humidity" in payload:
+        temp_start = payload.find("temperature") + len("temperature") + 1
+        temp_end = payload.find(",", temp_start)
+        if temp_end == -1:
+            temp_end = payload.find("}", temp_start)
+        humidity_start = payload.find("humidity") + len("humidity") + 1
+        humidity_end = payload.find("}", humidity_start)
+        return {
+            "temperature": payload[temp_start:temp_end].strip(': "\''),
+            "humidity": payload[humidity_start:humidity_end].strip(': "\''),
+        }
+    return None
+
+
+# --------------- 模糊测试 ---------------
+def mutate(rng, text):
+    """对样本做1~4次随机变异"""
+    alphabet = string.printable + "{}[]\"':=,;.-+eE\x00\xff°%"
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        op = rng.random()
+        position = rng.randint(0, len(chars))
+        if op < 0.25 and chars:
+            del chars[position:position + rng.randint(1, 8)]
+        elif op < 0.5:
+            chars.insert(position, rng.choice(alphabet))
+        elif op < 0.75 and chars:
+            chars[min(position, len(chars) - 1)] = rng.choice(alphabet)
+        else:
+            chars = chars[:position]
+    return "".join(chars)
+
+
+def fuzz(iterations, seed=0):
+    rng = random.Random(seed)
+    samples = list(SAMPLES.values()) + ['"' * 50, "{" * 1000, "-" * 100, "1e999,1e999", "NaN", "temperature:"]
+    parsed = 0
+    for _ in range(iterations):
+        payload = mutate(rng, rng.choice(samples))
+        if rng.random() < 0.2:
+            payload = payload.encode("utf-8", errors="replace")
+        try:
+            reading = payload_parser.parse_reading("fuzz", payload)
+        except Exception as e:
+            raise AssertionError(f"解析 {payload!r} 时抛出异常: {e!r}")
+        if reading is None:
+            continue
+        parsed += 1
+        for metric in payload_parser.METRIC_FIELDS:
+            value = reading[metric]
+            assert value is None or (isinstance(value, float) and math.isfinite(value)), (payload, reading)
+    return {"iterations": iterations, "parsed": parsed}
+
+
+# --------------- 吞吐量 ---------------
+def throughput(func, payload, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func(payload)
+    return count / (time.perf_counter() - start)
+
+
+def benchmark(count):
+    results = []
+    for name, payload in SAMPLES.items():
+        results.append({
+            "format": name,
+            "parser_msgs_per_sec": round(throughput(payload_parser.parse_payload, payload, count)),
+            "legacy_msgs_per_sec": round(throughput(legacy_parse, payload, count)),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器载荷解析器模糊测试与吞吐量基准")
+    parser.add_argument("--fuzz", type=int, default=100000, help="模糊测试次数（0表示跳过）")
+    parser.add_argument("--messages", type=int, default=100000, help="每种格式解析的消息数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"JSON后端: {payload_parser._json_loads.__module__}")
+    if args.fuzz:
+        result = fuzz(args.fuzz, args.seed)
+        print(f"模糊测试通过: {result['iterations']}次，其中{result['parsed']}次解析出温湿度")
+
+    print(f"{'格式':<14}{'新解析器(条/秒)':>18}{'旧实现(条/秒)':>18}")
+    for row in benchmark(args.messages):
+        print(f"{row['format']:<14}{row['parser_msgs_per_sec']:>18,}{row['legacy_msgs_per_sec']:>18,}")
+
+
+if __name__ == "__main__":
+    main()
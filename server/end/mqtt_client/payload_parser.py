@@ -0,0 +1,158 @@
+"""
+STM32/ESP8266传感器消息解析
+
+把MQTT载荷解析为结构化的传感器读数，入库时调用一次，
+查询时直接读SensorReading的数值列，不再重复解析JSON。
+
+ESP8266 AT固件发出的载荷经常不是标准JSON，这里按首字符选择解析方式，每条消息只解析一次:
+    {"temperature": 25.5, "humidity": 60}   标准JSON（安装了orjson时使用orjson）
+    {'temperature': 25.5, humidity: 60}     单引号/无引号键的伪JSON
+    temperature:25.5,humidity:60            key:value / key=value 列表（逗号或分号分隔）
+    25.5 或 25.5,60                         纯数值（多个数值依次对应温度、湿度）
+    "{...}"                                 外层多一层引号时去掉后再解析
+
+本模块除可选的orjson外只依赖标准库，内置代理服务器(example.py)和Django客户端共用。
+"""
+import json
+import math
+import re
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    _json_loads = json.loads
+    _JSONDecodeError = json.JSONDecodeError
+
+# key:value 或 key=value，值可以带单/双引号
+_PAIR_RE = re.compile(
+    r"""["']?([A-Za-z_][\w.-]*)["']?\s*[:=]\s*(?:"([^"]*)"|'([^']*)'|([^,;}\s"']+))"""
+)
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_NUMBER_LIST_SPLIT_RE = re.compile(r"\s*[,;\s]\s*")
+
+# 载荷中的字段名 -> SensorReading字段
+FIELD_ALIASES = {
+    'temperature': 'temperature',
+    'temp': 'temperature',
+    'tmp': 'temperature',
+    't': 'temperature',
+    'humidity': 'humidity',
+    'humi': 'humidity',
+    'hum': 'humidity',
+    'h': 'humidity',
+    'device_id': 'device_id',
+    'device': 'device_id',
+}
+METRIC_FIELDS = ('temperature', 'humidity')
+# 纯数值载荷按位置对应的字段
+POSITIONAL_FIELDS = ('temperature', 'humidity')
+
+
+def _coerce(value):
+    """伪JSON/键值对中的值：能转成数字的转成数字，其余保持字符串"""
+    if _NUMBER_RE.fullmatch(value):
+        number = float(value)
+        return int(number) if number.is_integer() and '.' not in value else number
+    return value
+
+
+def _parse_pairs(text):
+    pairs = {}
+    for key, double_quoted, single_quoted, bare in _PAIR_RE.findall(text):
+        if double_quoted or single_quoted:
+            pairs[key] = double_quoted or single_quoted
+        else:
+            pairs[key] = _coerce(bare)
+    return pairs or None
+
+
+def _parse_object(text):
+    """'{' 开头：先按标准JSON解析，失败时按伪JSON键值对解析"""
+    try:
+        data = _json_loads(text)
+        if isinstance(data, dict):
+            return data
+    except (_JSONDecodeError, ValueError):
+        pass
+    return _parse_pairs(text)
+
+
+def _parse_numbers(text):
+    """数字开头：单个数值为 {'value': x}，多个数值依次对应温度、湿度"""
+    parts = [part for part in _NUMBER_LIST_SPLIT_RE.split(text) if part]
+    if not parts or not all(_NUMBER_RE.fullmatch(part) for part in parts):
+        # 形如 "25C" 的载荷退回按键值对解析
+        return _parse_pairs(text)
+    if len(parts) == 1:
+        return {'value': float(parts[0])}
+    return {field: float(part) for field, part in zip(POSITIONAL_FIELDS, parts)}
+
+
+def _parse_quoted(text):
+    """外层包了引号的载荷，去掉引号后按内容的首字符重新分派"""
+    while len(text) >= 2 and text[0] in '"\'' and text[-1] == text[0]:
+        text = text[1:-1].strip()
+    if not text:
+        return None
+    parser = _DISPATCH.get(text[0], _parse_pairs)
+    return _parse_pairs(text) if parser is _parse_quoted else parser(text)
+
+
+_DISPATCH = {'{': _parse_object, '"': _parse_quoted, "'": _parse_quoted}
+for _char in '0123456789-+.':
+    _DISPATCH[_char] = _parse_numbers
+
+
+def parse_payload(payload):
+    """解析载荷为字典（str或bytes），无法识别时返回None，任何输入都不会抛出异常"""
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode('utf-8', errors='replace')
+    text = payload.strip()
+    if not text:
+        return None
+    parser = _DISPATCH.get(text[0], _parse_pairs)
+    try:
+        return parser(text)
+    except (ValueError, RecursionError):
+        return None
+
+
+def _to_float(value):
+    """转为有限浮点数；带单位的字符串（如 "25.5°C"、"60%"）取开头的数值"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = _NUMBER_RE.match(value.strip())
+        if match is None:
+            return None
+        value = match.group()
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def parse_reading(topic, payload):
+    """
+    解析为SensorReading字段: {'device_id', 'temperature', 'humidity'}
+    没有任何指标时返回None；载荷未指定设备时以主题作为设备标识
+    """
+    data = parse_payload(payload)
+    if not data:
+        return None
+
+    reading = {'device_id': topic, 'temperature': None, 'humidity': None}
+    for key, value in data.items():
+        field = FIELD_ALIASES.get(str(key).lower())
+        if field == 'device_id':
+            if value not in (None, ''):
+                reading['device_id'] = str(value)[:64]
+        elif field is not None:
+            reading[field] = _to_float(value)
+
+    if all(reading[metric] is None for metric in METRIC_FIELDS):
+        return None
+    return reading
@@ -1,9 +1,15 @@
 from rest_framework import serializers
-from .models import STM32Data
+from .models import SensorReading, STM32Data
 
 class STM32DataSerializer(serializers.ModelSerializer):
     """STM32数据的序列化器"""
     class Meta:
         model = STM32Data
         fields = ['id', 'topic', 'payload', 'qos', 'timestamp']
-        read_only_fields = ['timestamp'] 
\ No newline at end of file
+        read_only_fields = ['timestamp'] 
+
+class SensorReadingSerializer(serializers.ModelSerializer):
+    """传感器读数的序列化器"""
+    class Meta:
+        model = SensorReading
+        fields = ['id', 'device_id', 'topic', 'temperature', 'humidity', 'timestamp']
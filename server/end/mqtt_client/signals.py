@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .latest_cache import latest_cache
+from .models import SensorReading, STM32Data
+
+
+# 批量入库(bulk_create)不会触发信号，由ingest直接更新缓存；这里处理通过API或后台增删的记录
+@receiver(post_save, sender=STM32Data)
+def cache_latest_stm32_data(sender, instance, **kwargs):
+    """保存后更新最新值缓存（修改旧记录时时间戳更早，不会覆盖）"""
+    from .serializers import STM32DataSerializer
+    data = STM32DataSerializer(instance).data
+    transaction.on_commit(lambda: latest_cache.update('stm32', instance.timestamp, data))
+
+
+@receiver(post_delete, sender=STM32Data)
+def invalidate_latest_stm32_data(sender, instance, **kwargs):
+    transaction.on_commit(lambda: latest_cache.invalidate('stm32'))
+
+
+@receiver(post_delete, sender=SensorReading)
+def invalidate_latest_reading(sender, instance, **kwargs):
+    transaction.on_commit(lambda: latest_cache.invalidate(f'reading:{instance.device_id}'))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+MQTT主题订阅树
+
+按主题层级('/'分隔)组织订阅过滤器，支持单层通配符 '+' 和多层通配符 '#'。
+匹配一个主题只需沿层级向下走一遍，耗时与主题深度相关，而与订阅数量无关。
+"""
+
+try:
+    from .mqtt_codec import MQTTProtocolError
+except ImportError:  # 作为脚本直接运行
+    from mqtt_codec import MQTTProtocolError
+
+
+def validate_filter(topic_filter):
+    """检查订阅过滤器是否合法：'#'只能是最后一层，通配符必须独占一层"""
+    if not topic_filter:
+        raise MQTTProtocolError("订阅主题不能为空")
+    levels = topic_filter.split("/")
+    for index, level in enumerate(levels):
+        if "#" in level and (level != "#" or index != len(levels) - 1):
+            raise MQTTProtocolError(f"非法的订阅主题: {topic_filter}")
+        if "+" in level and level != "+":
+            raise MQTTProtocolError(f"非法的订阅主题: {topic_filter}")
+    return levels
+
+
+def topic_matches(topic_filter, topic):
+    """判断主题是否匹配过滤器（用于保留消息等少量主题的逐个比较）"""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    # 以$开头的系统主题不匹配首层通配符
+    if topic.startswith("$") and filter_levels[0] in ("+", "#"):
+        return False
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children = {}
+        # 订阅者 -> 授予的QoS
+        self.subscribers = {}
+
+
+class TopicTrie:
+    """主题订阅树，订阅者可以是任意可哈希对象（代理服务器中为ClientSession）"""
+
+    def __init__(self):
+        self._root = _Node()
+        self._count = 0
+
+    def __len__(self):
+        """订阅总数"""
+        return self._count
+
+    def subscribe(self, topic_filter, subscriber, qos=0):
+        node = self._root
+        for level in validate_filter(topic_filter):
+            node = node.children.setdefault(level, _Node())
+        if subscriber not in node.subscribers:
+            self._count += 1
+        node.subscribers[subscriber] = qos
+
+    def unsubscribe(self, topic_filter, subscriber):
+        """取消订阅，返回是否存在该订阅；空节点会被清理掉"""
+        path = []
+        node = self._root
+        for level in topic_filter.split("/"):
+            child = node.children.get(level)
+            if child is None:
+                return False
+            path.append((node, level))
+            node = child
+        if node.subscribers.pop(subscriber, None) is None:
+            return False
+        self._count -= 1
+        for parent, level in reversed(path):
+            child = parent.children[level]
+            if child.subscribers or child.children:
+                break
+            del parent.children[level]
+        return True
+
+    def remove_subscriber(self, subscriber, topic_filters):
+        """订阅者断开时移除其全部订阅"""
+        for topic_filter in topic_filters:
+            self.unsubscribe(topic_filter, subscriber)
+
+    def match(self, topic):
+        """返回匹配该主题的 {订阅者: QoS}，同一订阅者匹配多个过滤器时取最高QoS"""
+        result = {}
+        levels = topic.split("/")
+        system_topic = topic.startswith("$")
+        self._match(self._root, levels, 0, system_topic, result)
+        return result
+
+    def _match(self, node, levels, depth, system_topic, result):
+        # 首层通配符不匹配$开头的系统主题
+        wildcard_allowed = not (depth == 0 and system_topic)
+
+        multi = node.children.get("#") if wildcard_allowed else None
+        if multi is not None:
+            # '#' 同时匹配父层级本身，如 sensors/# 匹配 sensors
+            self._collect(multi, result)
+
+        if depth == len(levels):
+            self._collect(node, result)
+            return
+
+        child = node.children.get(levels[depth])
+        if child is not None:
+            self._match(child, levels, depth + 1, system_topic, result)
+        if wildcard_allowed:
+            single = node.children.get("+")
+            if single is not None:
+                self._match(single, levels, depth + 1, system_topic, result)
+
+    @staticmethod
+    def _collect(node, result):
+        for subscriber, qos in node.subscribers.items():
+            if result.get(subscriber, -1) < qos:
+                result[subscriber] = qos
@@ -2,13 +2,57 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import STM32Data
-from .serializers import STM32DataSerializer
+from rest_framework.renderers import JSONRenderer
+from django.db.models import Avg, Count, Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import SensorReading, STM32Data
+from .serializers import SensorReadingSerializer, STM32DataSerializer
 from .mqtt_client import mqtt_client
+from .live_hub import EventStreamRenderer, hub, sse_response
+from .latest_cache import latest_cache
+from . import ingest_stats
 import logging
 
 logger = logging.getLogger(__name__)
 
+# readings接口单次返回的最大记录数
+MAX_READINGS_LIMIT = 10000
+
+
+def parse_time_param(value):
+    """解析ISO 8601时间参数，未带时区的按当前时区处理；格式错误时抛出ValueError"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"无效的时间格式: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def role_conflict(action):
+    """web进程（MQTT_ROLE=web）不运行入库客户端，启动/停止会在worker中多出一个重复入库的客户端"""
+    return Response(
+        {"error": f"MQTT客户端由入库进程(start_mqtt)管理，web进程不能{action}"},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def ingest_unavailable():
+    return Response(
+        {"error": "读取不到入库进程的指标：入库进程未运行，或没有配置REDIS_URL（进程内缓存不能跨进程共享）"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+
+def load_latest_stm32_data():
+    """最新值缓存未命中时从数据库加载"""
+    latest = STM32Data.objects.first()  # 因为我们在Meta中设置了按时间戳倒序排列
+    if latest is None:
+        return None
+    return latest.timestamp, STM32DataSerializer(latest).data
+
+
 class STM32DataViewSet(viewsets.ModelViewSet):
     """STM32数据的API视图集"""
     queryset = STM32Data.objects.all()
@@ -17,13 +61,15 @@ class STM32DataViewSet(viewsets.ModelViewSet):
     
     def get_permissions(self):
         """根据不同的操作设置不同的权限"""
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'ingest_stats', 'metrics', 'readings', 'readings_summary', 'stream', 'latest_reading']:
             return [permissions.AllowAny()]
         return [permissions.IsAuthenticated()]
     
     @action(detail=False, methods=['post'])
     def start_mqtt(self, request):
         """启动MQTT客户端"""
+        if ingest_stats.is_web_role():
+            return role_conflict("启动")
         try:
             mqtt_client.connect()
             return Response({"status": "MQTT客户端已启动"}, status=status.HTTP_200_OK)
@@ -37,6 +83,8 @@ class STM32DataViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def stop_mqtt(self, request):
         """停止MQTT客户端"""
+        if ingest_stats.is_web_role():
+            return role_conflict("停止")
         try:
             mqtt_client.disconnect()
             return Response({"status": "MQTT客户端已停止"}, status=status.HTTP_200_OK)
@@ -47,14 +95,45 @@ class STM32DataViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['get'])
+    def ingest_stats(self, request):
+        """获取MQTT消息入库队列的指标（队列深度、丢弃数、写入延迟等）"""
+        stats = ingest_stats.load(mqtt_client)
+        if stats is None:
+            return ingest_unavailable()
+        return Response(stats["ingest"])
+    
+    @action(detail=False, methods=['get'])
+    def metrics(self, request):
+        """MQTT消息计数器：消息数/秒、字节数/秒、解析失败数及入库队列指标（来自入库进程）"""
+        stats = ingest_stats.load(mqtt_client)
+        if stats is None:
+            return ingest_unavailable()
+        return Response({
+            "messages": stats["messages"],
+            "ingest": stats["ingest"],
+            "live": hub.stats(),
+            "latest_cache": latest_cache.stats(),
+        })
+    
+    @action(detail=False, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def stream(self, request):
+        """
+        SSE实时推送，替代轮询latest_data:
+        - event: stm32            最新一条原始消息
+        - event: reading:<设备>   该设备最新的温湿度读数
+        可用 ?channels=stm32,reading:stm32/dht11 只订阅部分频道
+        """
+        channels = request.query_params.get('channels')
+        return sse_response(request, hub, channels.split(',') if channels else None)
+    
     @action(detail=False, methods=['get'])
     def latest_data(self, request):
-        """获取最新的数据记录"""
+        """获取最新的数据记录（读最新值缓存，未命中时才查询数据库）"""
         try:
-            latest = STM32Data.objects.first()  # 因为我们在Meta中设置了按时间戳倒序排列
-            if latest:
-                serializer = self.get_serializer(latest)
-                return Response(serializer.data)
+            latest = latest_cache.get('stm32', load_latest_stm32_data)
+            if latest is not None:
+                return Response(latest)
             return Response({"message": "没有找到数据"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             logger.error(f"获取最新数据失败: {str(e)}")
@@ -62,3 +141,68 @@ class STM32DataViewSet(viewsets.ModelViewSet):
                 {"error": f"获取最新数据失败: {str(e)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+    
+    @action(detail=False, methods=['get'])
+    def latest_reading(self, request):
+        """获取指定设备最新的温湿度读数: ?device_id=stm32/dht11"""
+        device_id = request.query_params.get('device_id')
+        if not device_id:
+            return Response({"error": "缺少device_id参数"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        def load():
+            reading = SensorReading.objects.filter(device_id=device_id).first()
+            if reading is None:
+                return None
+            return reading.timestamp, SensorReadingSerializer(reading).data
+        
+        latest = latest_cache.get(f'reading:{device_id}', load)
+        if latest is None:
+            return Response({"message": "没有找到数据"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(latest)
+    
+    def filter_readings(self, request):
+        """按 start / end / device_id 查询参数过滤传感器读数"""
+        queryset = SensorReading.objects.all()
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        device_id = request.query_params.get('device_id')
+        if start:
+            queryset = queryset.filter(timestamp__gte=parse_time_param(start))
+        if end:
+            queryset = queryset.filter(timestamp__lt=parse_time_param(end))
+        if device_id:
+            queryset = queryset.filter(device_id=device_id)
+        return queryset
+    
+    @action(detail=False, methods=['get'])
+    def readings(self, request):
+        """按时间范围查询温湿度读数: ?start=2025-03-01T00:00&end=...&device_id=...&limit=1000"""
+        try:
+            queryset = self.filter_readings(request)
+            limit = min(int(request.query_params.get('limit', 1000)), MAX_READINGS_LIMIT)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({"error": "limit必须大于0"}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = SensorReadingSerializer(queryset[:limit], many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['get'])
+    def readings_summary(self, request):
+        """按设备统计时间范围内温湿度的最小/最大/平均值"""
+        try:
+            queryset = self.filter_readings(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        summary = queryset.order_by().values('device_id').annotate(
+            count=Count('id'),
+            temperature_avg=Avg('temperature'),
+            temperature_min=Min('temperature'),
+            temperature_max=Max('temperature'),
+            humidity_avg=Avg('humidity'),
+            humidity_min=Min('humidity'),
+            humidity_max=Max('humidity'),
+            first=Min('timestamp'),
+            last=Max('timestamp'),
+        )
+        return Response(list(summary))
@@ -1,149 +1,277 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-启动脚本 - 同时启动MQTT代理服务器和Django
+启动脚本 - 以受监管的子进程同时启动MQTT代理服务器、MQTT入库进程和Django
+
+    broker  mqtt_client/example.py          就绪检查: TCP连接MQTT端口
+    ingest  manage.py start_mqtt            独立进程批量入库 (MQTT_ROLE=ingest)
+    web     uvicorn/gunicorn 多worker        就绪检查: GET /api/test/ (MQTT_ROLE=web)
+
+- 按顺序启动，每个服务通过就绪检查后立即启动下一个，不再固定等待
+- 子进程异常退出时按指数退避重启（1秒起翻倍，最长30秒；稳定运行30秒后重新计数）
+- Ctrl+C / SIGTERM 时按相反顺序发送SIGTERM，超时后强制结束
+- 子进程直接继承终端输出，不再经过读取线程转发
+
+web服务器按 gunicorn(+uvicorn worker) > uvicorn > runserver 的顺序选择已安装的，
+web worker不入库，只运行实时推送中继（见 mqtt_client/live_relay.py）。
+
+多进程部署需要设置 REDIS_URL 作为共享缓存：没有Redis时各进程的缓存互不相通，
+传感器最新值缓存只能保留1秒（latest接口每个worker约每秒查询一次数据库），
+web进程也读不到入库进程的指标（ingest_stats / metrics 返回503）。
+worker数默认为2：默认数据库是SQLite（同一时间只能有一个写入），每个worker还会各自加载一份识别模型，
+按CPU核数启动worker只会增加内存占用。
+
+用法:
+    python start_all.py                               # 默认2个web worker
+    REDIS_URL=redis://127.0.0.1:6379/0 python start_all.py --workers 4
+    python start_all.py --workers 4 --port 8000 --server uvicorn
 """
 
+import argparse
+import importlib.util
+import logging
 import os
-import sys
-import time
+import signal
+import socket
 import subprocess
+import sys
 import threading
-import signal
+import time
+import urllib.error
+import urllib.request
 
 # 设置基础目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def run_mqtt_broker():
-    """启动MQTT代理服务器"""
-    print("正在启动MQTT代理服务器...")
-    mqtt_script = os.path.join(BASE_DIR, 'mqtt_client', 'example.py')
-    
-    # 确保脚本存在
-    if not os.path.exists(mqtt_script):
-        print(f"错误: MQTT脚本不存在: {mqtt_script}")
-        return None
-    
-    # 启动MQTT代理服务器
-    mqtt_process = subprocess.Popen([sys.executable, mqtt_script],
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.STDOUT,
-                                   universal_newlines=True)
-    
-    print("MQTT代理服务器启动中...")
-    
-    # 等待服务器启动
-    time.sleep(2)
-    
-    if mqtt_process.poll() is not None:
-        print("MQTT代理服务器启动失败!")
-        return None
-    
-    print("MQTT代理服务器已启动")
-    return mqtt_process
-
-def run_django_server():
-    """启动Django开发服务器"""
-    print("正在启动Django开发服务器...")
-    manage_script = os.path.join(BASE_DIR, 'manage.py')
-    
-    # 确保脚本存在
-    if not os.path.exists(manage_script):
-        print(f"错误: Django管理脚本不存在: {manage_script}")
-        return None
-    
-    # 启动Django服务器
-    django_process = subprocess.Popen([sys.executable, manage_script, 'runserver'],
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT,
-                                     universal_newlines=True)
-    
-    print("Django开发服务器启动中...")
-    
-    # 等待服务器启动
-    time.sleep(2)
-    
-    if django_process.poll() is not None:
-        print("Django开发服务器启动失败!")
-        return None
-    
-    print("Django开发服务器已启动")
-    return django_process
-
-def output_reader(process, prefix):
-    """读取并显示进程输出"""
-    for line in iter(process.stdout.readline, ''):
-        print(f"[{prefix}] {line.strip()}")
+MQTT_BROKER_PORT = 1883
+STARTUP_TIMEOUT = 60        # 单个服务通过就绪检查的最长时间（秒）
+PROBE_INTERVAL = 0.1        # 就绪检查间隔（秒）
+BACKOFF_BASE = 1.0          # 第一次重启前的等待时间（秒）
+BACKOFF_MAX = 30.0          # 重启等待时间上限（秒）
+STABLE_SECONDS = 30.0       # 运行超过该时间后退出视为偶发故障，退避重新计数
+STOP_TIMEOUT = 10.0         # 发送SIGTERM后等待退出的时间（秒）
+DEFAULT_WORKERS = 2         # web worker进程数（SQLite只能单写入，每个worker各加载一份识别模型）
+
+logger = logging.getLogger("start_all")
+
+
+# --------------- 就绪检查 ---------------
+def tcp_probe(host, port):
+    """能建立TCP连接即视为就绪"""
+    def probe():
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            return False
+    probe.description = f"tcp://{host}:{port}"
+    return probe
+
+
+def http_probe(url):
+    """HTTP状态码小于500即视为就绪"""
+    def probe():
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                return response.status < 500
+        except urllib.error.HTTPError as e:
+            return e.code < 500
+        except (OSError, ValueError):
+            return False
+    probe.description = url
+    return probe
+
+
+# --------------- 受监管的服务 ---------------
+class Service:
+    """一个子进程及其启动命令、环境变量和就绪检查"""
+
+    def __init__(self, name, command, probe=None, env=None):
+        self.name = name
+        self.command = command
+        self.probe = probe
+        self.env = {**os.environ, "PYTHONUNBUFFERED": "1", **(env or {})}
+        self.process = None
+        self.restarts = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # 独立进程组：终端的Ctrl+C只发给监管进程，由它按顺序停止子进程
+            kwargs["start_new_session"] = True
+        self.process = subprocess.Popen(self.command, cwd=BASE_DIR, env=self.env, **kwargs)
+        logger.info(f"[{self.name}] 已启动 (pid={self.process.pid}): {' '.join(self.command)}")
+
+    def wait_ready(self, stopping, timeout=STARTUP_TIMEOUT):
+        """等待就绪检查通过；进程提前退出、超时或正在停止时返回False"""
+        if self.probe is None:
+            return self.process.poll() is None
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return False
+            if self.probe():
+                return True
+            if stopping.wait(PROBE_INTERVAL):
+                return False
+        return False
+
+    def stop(self):
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"[{self.name}] {STOP_TIMEOUT}秒内未退出，强制结束")
+            process.kill()
+            process.wait()
+
+
+class Supervisor:
+    """按顺序启动服务，每个服务一个线程阻塞等待子进程退出，异常退出时退避重启"""
+
+    def __init__(self, services):
+        self.services = services
+        self.stopping = threading.Event()
+        self._watchers = []
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
+
+        started_at = time.monotonic()
+        for service in self.services:
+            with service.lock:
+                if self.stopping.is_set():
+                    break
+                service.start()
+            if not service.wait_ready(self.stopping):
+                if not self.stopping.is_set():
+                    logger.error(f"[{service.name}] 启动失败（退出码 {service.process.poll()}），正在停止所有服务...")
+                self.stop()
+                return 1
+            probe = service.probe.description if service.probe else "进程已运行"
+            logger.info(f"[{service.name}] 已就绪 ({probe})，用时 {time.monotonic() - started_at:.2f} 秒")
+            watcher = threading.Thread(target=self._watch, args=(service,), name=f"watch-{service.name}", daemon=True)
+            watcher.start()
+            self._watchers.append(watcher)
+
+        if not self.stopping.is_set():
+            logger.info(f"所有服务已启动，用时 {time.monotonic() - started_at:.2f} 秒，按 Ctrl+C 停止所有服务")
+        # 带超时等待只是为了在Windows上也能及时响应Ctrl+C，子进程退出由监视线程处理
+        while not self.stopping.wait(0.5):
+            pass
+        self.stop()
+        return 0
+
+    def _on_signal(self, signum, frame):
+        self.stopping.set()
+
+    def _watch(self, service):
+        failures = 0
+        while True:
+            started = time.monotonic()
+            code = service.process.wait()
+            if self.stopping.is_set():
+                return
+            if time.monotonic() - started >= STABLE_SECONDS:
+                failures = 0
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** failures)
+            failures += 1
+            logger.warning(f"[{service.name}] 已退出（退出码 {code}），{delay:.0f} 秒后第 {failures} 次重启")
+            if self.stopping.wait(delay):
+                return
+            with service.lock:
+                if self.stopping.is_set():
+                    return
+                service.start()
+                service.restarts += 1
+            if service.wait_ready(self.stopping):
+                logger.info(f"[{service.name}] 重启后已就绪")
+            elif not self.stopping.is_set():
+                logger.warning(f"[{service.name}] 重启后未通过就绪检查")
+
+    def stop(self):
+        self.stopping.set()
+        logger.info("正在停止所有服务...")
+        for service in reversed(self.services):
+            with service.lock:
+                service.stop()
+        logger.info("所有服务已停止")
+
+
+# --------------- 服务定义 ---------------
+def module_available(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def web_command(server, host, port, workers):
+    """生成web服务器命令；auto按 gunicorn(+uvicorn worker) > uvicorn > runserver 选择"""
+    if server == "auto":
+        if os.name != "nt" and module_available("gunicorn"):
+            server = "gunicorn"
+        elif module_available("uvicorn"):
+            server = "uvicorn"
+        else:
+            server = "runserver"
+
+    if server == "gunicorn":
+        command = [sys.executable, "-m", "gunicorn", "--bind", f"{host}:{port}", "--workers", str(workers)]
+        if module_available("uvicorn"):
+            # ASGI worker，SSE推送接口不占用线程
+            return command + ["--worker-class", "uvicorn.workers.UvicornWorker", "dogserver.asgi:application"]
+        return command + ["--threads", "4", "dogserver.wsgi:application"]
+    if server == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "dogserver.asgi:application",
+                "--host", host, "--port", str(port), "--workers", str(workers), "--no-access-log"]
+
+    logger.warning("未安装gunicorn/uvicorn，使用单进程的Django开发服务器（pip install uvicorn 后可使用多worker）")
+    return [sys.executable, os.path.join(BASE_DIR, "manage.py"), "runserver", f"{host}:{port}", "--noreload"]
+
+
+def build_services(args):
+    services = []
+    broker_probe = tcp_probe("127.0.0.1", MQTT_BROKER_PORT)
+    if args.no_broker or broker_probe():
+        logger.info(f"不启动内置MQTT代理服务器，使用已有代理 (端口 {MQTT_BROKER_PORT})")
+    else:
+        services.append(Service("broker", [sys.executable, os.path.join(BASE_DIR, "mqtt_client", "example.py")],
+                                probe=broker_probe))
+
+    manage_script = os.path.join(BASE_DIR, "manage.py")
+    services.append(Service("ingest", [sys.executable, manage_script, "start_mqtt"],
+                            env={"MQTT_ROLE": "ingest"}))
+
+    probe_host = "127.0.0.1" if args.host in ("0.0.0.0", "") else args.host
+    services.append(Service("web", web_command(args.server, args.host, args.port, args.workers),
+                            probe=http_probe(f"http://{probe_host}:{args.port}/api/test/"),
+                            env={"MQTT_ROLE": "web"}))
+    return services
+
 
 def main():
     """主函数"""
-    print("开始启动所有服务...")
-    
-    # 启动MQTT代理服务器
-    mqtt_process = run_mqtt_broker()
-    if mqtt_process is None:
-        print("启动失败，退出程序")
-        return
-    
-    # 创建MQTT输出线程
-    mqtt_thread = threading.Thread(target=output_reader, args=(mqtt_process, "MQTT"), daemon=True)
-    mqtt_thread.start()
-    
-    # 等待MQTT服务器完全启动
-    time.sleep(3)
-    
-    # 启动Django服务器
-    django_process = run_django_server()
-    if django_process is None:
-        print("启动失败，正在停止MQTT服务器...")
-        mqtt_process.terminate()
-        return
-    
-    # 创建Django输出线程
-    django_thread = threading.Thread(target=output_reader, args=(django_process, "Django"), daemon=True)
-    django_thread.start()
-    
-    print("\n所有服务已启动!")
-    print("按 Ctrl+C 停止所有服务\n")
-    
-    # 处理信号，优雅地关闭进程
-    def signal_handler(sig, frame):
-        print("\n正在停止所有服务...")
-        django_process.terminate()
-        mqtt_process.terminate()
-        print("所有服务已停止")
-        sys.exit(0)
-    
-    signal.signal(signal.SIGINT, signal_handler)
-    
-    # 保持主线程运行
-    try:
-        while True:
-            time.sleep(1)
-            
-            # 检查进程是否仍在运行
-            if mqtt_process.poll() is not None:
-                print("MQTT代理服务器已停止，正在终止所有服务...")
-                if django_process.poll() is None:
-                    django_process.terminate()
-                break
-            
-            if django_process.poll() is not None:
-                print("Django服务器已停止，正在终止所有服务...")
-                if mqtt_process.poll() is None:
-                    mqtt_process.terminate()
-                break
-            
-    except KeyboardInterrupt:
-        pass
-    finally:
-        # 确保进程被终止
-        if mqtt_process.poll() is None:
-            mqtt_process.terminate()
-        if django_process.poll() is None:
-            django_process.terminate()
-        
-        print("所有服务已停止")
+    parser = argparse.ArgumentParser(description="启动并监管MQTT代理、MQTT入库进程和Django服务")
+    parser.add_argument("--host", default="127.0.0.1", help="web服务监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="web服务监听端口")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="web worker进程数")
+    parser.add_argument("--server", choices=["auto", "gunicorn", "uvicorn", "runserver"], default="auto",
+                        help="web服务器")
+    parser.add_argument("--no-broker", action="store_true", help="不启动内置MQTT代理，连接已有代理")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if not os.environ.get("REDIS_URL"):
+        logger.warning("未设置REDIS_URL：各进程不共享缓存，传感器最新值缓存只保留1秒"
+                       "（latest接口每个worker约每秒查询一次数据库），ingest_stats / metrics 接口返回503")
+    logger.info("开始启动所有服务...")
+    sys.exit(Supervisor(build_services(args)).run())
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
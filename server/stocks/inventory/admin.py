@@ -7,7 +7,8 @@ from .models import (
     EnvironmentData,
     InventoryEvent,
     InventoryReport,
-    SensorData
+    SensorData,
+    SensorAlertRule
 )
 
 
@@ -71,3 +72,13 @@ class SensorDataAdmin(admin.ModelAdmin):
     search_fields = ('timestamp',)
     date_hierarchy = 'timestamp'
     ordering = ('-timestamp',)
+
+
+@admin.register(SensorAlertRule)
+class SensorAlertRuleAdmin(admin.ModelAdmin):
+    """
+    传感器警报规则管理
+    """
+    list_display = ('name', 'source', 'metric', 'kind', 'operator', 'value', 'window_minutes', 'cooldown_minutes', 'enabled')
+    list_filter = ('source', 'metric', 'kind', 'enabled')
+    search_fields = ('name',)
@@ -0,0 +1,304 @@
+"""
+传感器警报引擎
+
+数据写入时（post_save信号和批量写入，见signals.py、sensor_ingest.py）调用 engine.process(source, instances)，
+按启用的 SensorAlertRule 逐条判断新读数，不查询历史数据：
+
+- threshold  超过阈值：读数高于/低于阈值时触发，恢复正常之前不重复触发
+- rate       变化过快：与时间窗口内最早的读数相比，上升/下降超过阈值时触发；
+             窗口内的读数保存在环形缓冲区(deque)中，每条读数只进出一次，均摊O(1)
+- sustained  持续超限：连续超限达到 window_minutes 分钟时触发，只需记下开始超限的时间
+
+传感器数据自带的 threshold 字段（温度警报阈值）作为内置规则：温度高于该值时触发。
+触发时在写入数据的同一事务中生成 event_type=sensor_alert 的 InventoryEvent，
+提交后通过SSE推送（alert频道）。同一规则在 cooldown_minutes 内最多触发一次。
+
+规则状态保存在进程内：多个进程各自判断自己写入的数据，进程重启后窗口从空开始。
+时间早于已处理的最新读数的数据（补传）不参与判断，避免旧数据打乱窗口和重复报警。
+
+规则状态（是否已触发、窗口、冷却、最新读数时间）在事务提交后才更新：判断时修改的是状态的副本，
+提交时（transaction.on_commit）替换进程内的状态。写入失败回滚时状态不变，重试同一批数据
+（例如 sensor_bridge 补发暂存的批次）时重新判断，不会因为上次失败而漏报。
+同一事务中的多次调用依次使用前面尚未提交的状态；回滚（包括回滚到保存点）时Django丢弃对应的
+on_commit回调，这些调用的状态也一起丢弃。
+"""
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from functools import partial
+
+from django.db import transaction
+from django.utils import timezone
+
+from .live_hub import hub
+from .models import InventoryEvent, SensorAlertRule
+
+# 规则缓存时间（秒）；本进程修改规则后立即重新加载，其他进程最迟在这段时间后生效
+RULES_TTL = 30
+# 变化过快规则的窗口最多保存的读数，数据频率很高时丢弃最旧的（窗口实际变短）
+RING_SIZE = 4096
+# 内置温度阈值规则的冷却时间（分钟）
+BUILTIN_COOLDOWN_MINUTES = 10
+
+TIME_FIELDS = {'sensor': 'timestamp', 'environment': 'recorded_at'}
+METRIC_LABELS = dict(SensorAlertRule.METRIC_CHOICES)
+OPERATOR_LABELS = dict(SensorAlertRule.OPERATOR_CHOICES)
+UNITS = {'temperature': '°C', 'humidity': '%', 'light': ' lux'}
+
+
+class Rule:
+    """规则的只读快照；value为None时使用读数自带的threshold字段"""
+    __slots__ = ('key', 'name', 'source', 'metric', 'kind', 'operator', 'value', 'window', 'cooldown')
+
+    def __init__(self, key, name, source, metric, kind, operator, value, window_minutes, cooldown_minutes):
+        self.key = key
+        self.name = name
+        self.source = source
+        self.metric = metric
+        self.kind = kind
+        self.operator = operator
+        self.value = value
+        self.window = timedelta(minutes=window_minutes)
+        self.cooldown = timedelta(minutes=cooldown_minutes)
+
+    @classmethod
+    def from_model(cls, rule):
+        return cls(rule.pk, rule.name, rule.source, rule.metric, rule.kind, rule.operator,
+                   rule.value, rule.window_minutes, rule.cooldown_minutes)
+
+    @property
+    def signature(self):
+        """判断条件变化时规则状态需要重置"""
+        return (self.source, self.metric, self.kind, self.operator, self.value, self.window)
+
+
+BUILTIN_RULE = Rule('reading-threshold', '温度警报阈值', 'sensor', 'temperature', 'threshold', 'gt',
+                    None, 0, BUILTIN_COOLDOWN_MINUTES)
+
+
+class RuleState:
+    __slots__ = ('signature', 'active', 'since', 'last_fired', 'window')
+
+    def __init__(self, rule):
+        self.signature = rule.signature
+        self.active = False     # 已触发且尚未恢复正常
+        self.since = None       # 持续超限规则：开始超限的时间
+        self.last_fired = None  # 最近一次触发的读数时间，用于冷却
+        self.window = deque(maxlen=RING_SIZE) if rule.kind == 'rate' else None
+
+    def copy(self):
+        state = RuleState.__new__(RuleState)
+        state.signature = self.signature
+        state.active = self.active
+        state.since = self.since
+        state.last_fired = self.last_fired
+        state.window = deque(self.window, maxlen=RING_SIZE) if self.window is not None else None
+        return state
+
+
+class _Pending:
+    """一次process()调用修改过的规则状态，事务提交后替换进程内的状态"""
+    __slots__ = ('source', 'states', 'last_seen', 'callback')
+
+    def __init__(self, source):
+        self.source = source
+        self.states = {}
+        self.last_seen = None
+        self.callback = None
+
+
+class AlertEngine:
+    """按规则增量判断新读数，触发时生成InventoryEvent并推送"""
+
+    def __init__(self, ttl=RULES_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = None
+        self._expires = 0.0
+        self._states = {}
+        self._last_seen = {}
+        # 本线程当前事务中尚未提交的process()调用（_Pending列表）
+        self._local = threading.local()
+        self._stats = {'readings': 0, 'skipped': 0, 'alerts': 0}
+
+    def invalidate(self):
+        """规则修改后调用，下次处理数据时重新加载"""
+        with self._lock:
+            self._expires = 0.0
+
+    def reset(self):
+        """清空所有规则状态（窗口、冷却、最新读数时间）"""
+        with self._lock:
+            self._states.clear()
+            self._last_seen.clear()
+            self._expires = 0.0
+        self._local.pending = []
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rules=sum(len(rules) for rules in (self._rules or {}).values()))
+
+    def process(self, source, instances):
+        """
+        判断新写入的 SensorData / EnvironmentData，返回生成的警报事件列表。
+        需要在写入数据的事务中调用：数据回滚时警报事件一起回滚，提交后才推送。
+        """
+        time_field = TIME_FIELDS[source]
+        alerts = []
+        pending = self._pending()
+        current = _Pending(source)
+        with self._lock:
+            rules = self._load_rules()[source]
+            last = self._last_seen.get(source)
+            for earlier in pending:
+                if earlier.source == source and earlier.last_seen is not None:
+                    last = earlier.last_seen if last is None else max(last, earlier.last_seen)
+            for instance in sorted(instances, key=lambda obj: getattr(obj, time_field)):
+                timestamp = getattr(instance, time_field)
+                if last is not None and timestamp < last:
+                    self._stats['skipped'] += 1
+                    continue
+                last = current.last_seen = timestamp
+                self._stats['readings'] += 1
+                for rule in rules:
+                    alert = self._evaluate(rule, instance, timestamp, self._state(rule, current, pending))
+                    if alert is not None:
+                        alerts.append(alert)
+            self._stats['alerts'] += len(alerts)
+
+        if current.last_seen is not None:
+            # 不在事务中时on_commit立即执行，所以在锁外注册
+            current.callback = partial(self._commit, current)
+            pending.append(current)
+            transaction.on_commit(current.callback)
+        return [self._emit(*alert) for alert in alerts]
+
+    def _pending(self):
+        """本线程尚未提交的调用；on_commit回调已被回滚丢弃的调用不再有效"""
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            pending = self._local.pending = []
+        if pending:
+            queued = transaction.get_connection().run_on_commit
+            pending[:] = [item for item in pending if any(func is item.callback for _, func, *_ in queued)]
+        return pending
+
+    def _commit(self, current):
+        with self._lock:
+            self._states.update(current.states)
+            last = self._last_seen.get(current.source)
+            if last is None or current.last_seen > last:
+                self._last_seen[current.source] = current.last_seen
+        pending = getattr(self._local, 'pending', [])
+        if current in pending:
+            pending.remove(current)
+
+    def _load_rules(self):
+        if self._rules is not None and time.monotonic() < self._expires:
+            return self._rules
+        rules = {source: [] for source in TIME_FIELDS}
+        rules['sensor'].append(BUILTIN_RULE)
+        for rule in SensorAlertRule.objects.filter(enabled=True):
+            rules[rule.source].append(Rule.from_model(rule))
+        # 删除或停用的规则丢弃状态；条件改变的规则在 _state 中重置
+        keys = {rule.key for source_rules in rules.values() for rule in source_rules}
+        self._states = {key: state for key, state in self._states.items() if key in keys}
+        self._rules = rules
+        self._expires = time.monotonic() + self.ttl
+        return rules
+
+    def _state(self, rule, current, pending):
+        """本次调用使用的规则状态：依次查找本次调用、同一事务中之前的调用、已提交的状态，复制后修改"""
+        state = current.states.get(rule.key)
+        if state is not None and state.signature == rule.signature:
+            return state
+        if state is None:
+            for earlier in reversed(pending):
+                state = earlier.states.get(rule.key)
+                if state is not None:
+                    break
+            else:
+                state = self._states.get(rule.key)
+        if state is None or state.signature != rule.signature:
+            state = RuleState(rule)
+        else:
+            state = state.copy()
+        current.states[rule.key] = state
+        return state
+
+    def _evaluate(self, rule, instance, timestamp, state):
+        """返回 (规则, 读数, 时间, 观测值, 阈值) 或 None"""
+        value = getattr(instance, rule.metric, None)
+        limit = rule.value if rule.value is not None else getattr(instance, 'threshold', None)
+        if value is None or limit is None:
+            return None
+
+        if rule.kind == 'rate':
+            window = state.window
+            window.append((timestamp, value))
+            start = timestamp - rule.window
+            while window[0][0] < start:
+                window.popleft()
+            observed = value - window[0][1]
+            breached = observed > limit if rule.operator == 'gt' else observed < -limit
+        else:
+            observed = value
+            breached = value > limit if rule.operator == 'gt' else value < limit
+
+        if not breached:
+            state.active = False
+            state.since = None
+            return None
+        if rule.kind == 'sustained':
+            if state.since is None:
+                state.since = timestamp
+            if timestamp - state.since < rule.window:
+                return None
+        if state.active:
+            return None
+        state.active = True
+        if state.last_fired is not None and timestamp - state.last_fired < rule.cooldown:
+            return None
+        state.last_fired = timestamp
+        return rule, instance, timestamp, observed, limit
+
+    def _emit(self, rule, instance, timestamp, observed, limit):
+        from .serializers import InventoryEventSerializer
+
+        title, description = describe(rule, instance, timestamp, observed, limit)
+        event = InventoryEvent.objects.create(
+            event_type='sensor_alert',
+            title=title[:100],
+            description=description,
+            reported_by=None,
+        )
+        data = InventoryEventSerializer(event).data
+        transaction.on_commit(lambda: hub.publish('alert', data))
+        return event
+
+
+def describe(rule, instance, timestamp, observed, limit):
+    """警报事件的标题和描述"""
+    label = METRIC_LABELS[rule.metric]
+    unit = UNITS[rule.metric]
+    operator = OPERATOR_LABELS[rule.operator]
+    minutes = int(rule.window.total_seconds() // 60)
+    if rule.kind == 'rate':
+        direction = '上升' if observed > 0 else '下降'
+        condition = f"{label}{minutes}分钟内{direction}{abs(observed):g}{unit}，超过{limit:g}{unit}"
+    elif rule.kind == 'sustained':
+        condition = f"{label}持续{minutes}分钟{operator}{limit:g}{unit}，当前{observed:g}{unit}"
+    else:
+        condition = f"{label}{observed:g}{unit}，{operator}{limit:g}{unit}"
+    source = dict(SensorAlertRule.SOURCE_CHOICES)[rule.source]
+    lines = [
+        f"规则: {rule.name}",
+        f"来源: {source} #{instance.pk}",
+        f"时间: {timezone.localtime(timestamp).strftime('%Y-%m-%d %H:%M:%S')}",
+        f"条件: {condition}",
+    ]
+    return f"{rule.name}: {condition}", '\n'.join(lines)
+
+
+engine = AlertEngine()
@@ -0,0 +1,192 @@
+"""
+传感器图表数据的时间分桶聚合
+
+原来的 SensorDataViewSet.chart_data 对每个时间区间分别查询（exists、遍历温度、两次count），
+30天的图表约720个区间、每个区间4次以上查询。这里只按时间顺序读取一遍
+(timestamp, temperature, humidity, light)，用NumPy bincount按区间求和、计数，输出与原实现一致：
+
+- 区间以第一条数据的时间为起点，每 interval_minutes 分钟一个，直到当前时间
+- 只输出有数据的区间，时间戳为区间起点
+- 温度取非空值的平均，区间内没有温度时为25.0；湿度、光照取平均；均保留一位小数
+
+bincount按输入顺序逐个累加，与原来按时间顺序 sum() 的累加顺序相同，平均值逐位一致。
+
+间隔为整小时/整天时，图表改为读取SensorRollup汇总行（aggregate_rollups），月视图只读取约720行。
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+
+import numpy as np
+from django.utils import timezone
+from rest_framework import serializers
+
+# 区间内没有温度数据时使用的默认温度
+DEFAULT_TEMPERATURE = 25.0
+# 每次从数据库游标读取的行数
+CHUNK_SIZE = 20000
+
+# aggregate_sensor_rows 输入行的字段顺序
+SENSOR_CHART_FIELDS = ('timestamp', 'temperature', 'humidity', 'light')
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def empty_sensor_chart():
+    return {'timestamps': [], 'temperature': [], 'humidity': [], 'light': []}
+
+
+def aggregate_sensor_data(queryset, interval_minutes, now=None):
+    """
+    按时间区间聚合SensorData，返回 {'timestamps', 'temperature', 'humidity', 'light'} 四个等长列表。
+    只发出一条查询，内存中只保存每行的区间编号和三个数值。
+    """
+    rows = (
+        queryset.order_by('timestamp')
+        .values_list(*SENSOR_CHART_FIELDS)
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    return aggregate_sensor_rows(rows, interval_minutes, now)
+
+
+def to_microseconds(value):
+    """带时区的datetime -> 自1970-01-01 UTC起的微秒数（整数，无精度损失）"""
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_microseconds(value):
+    """to_microseconds的逆运算，返回UTC时间（与数据库读出的时间相同）"""
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def aggregate_sensor_rows(rows, interval_minutes, now=None):
+    """
+    同aggregate_sensor_data，输入为按时间升序的 (timestamp, temperature, humidity, light) 行，
+    例如按月分表后 sensor_shards.router.values_list 合并的结果
+    """
+    rows = iter(rows)
+    timestamps, temperatures, humidities, lights = [], [], [], []
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        timestamp, temperature, humidity, light = zip(*chunk)
+        timestamps.append(np.fromiter((to_microseconds(ts) for ts in timestamp), dtype=np.int64, count=len(chunk)))
+        # 温度可以为空，None转换为NaN
+        temperatures.append(np.array(temperature, dtype=np.float64))
+        humidities.append(np.array(humidity, dtype=np.float64))
+        lights.append(np.array(light, dtype=np.float64))
+    if not timestamps:
+        return empty_sensor_chart()
+    return aggregate_sensor_arrays(
+        np.concatenate(timestamps), np.concatenate(temperatures),
+        np.concatenate(humidities), np.concatenate(lights), interval_minutes, now,
+    )
+
+
+def aggregate_sensor_arrays(timestamps, temperatures, humidities, lights, interval_minutes, now=None):
+    """
+    同aggregate_sensor_rows，输入为按时间升序的NumPy数组：timestamps为微秒数（to_microseconds），
+    温度为空时为NaN。内存中的最近数据窗口（recent_window）直接使用这个函数。
+    """
+    if not len(timestamps):
+        return empty_sensor_chart()
+    now = now or timezone.now()
+    interval = timedelta(minutes=interval_minutes) // MICROSECOND
+    first = int(timestamps[0])
+    if first > to_microseconds(now):
+        return empty_sensor_chart()
+
+    # 整数微秒整除得到区间编号，与原来 [起点+k*间隔, 起点+(k+1)*间隔) 的比较完全等价
+    buckets = (timestamps - first) // interval
+
+    # 原实现只遍历到当前时间所在的区间，之后（时间在未来）的数据不参与聚合
+    last_bucket = (to_microseconds(now) - first) // interval
+    if buckets[-1] > last_bucket:
+        keep = buckets <= last_bucket
+        buckets, temperatures, humidities, lights = buckets[keep], temperatures[keep], humidities[keep], lights[keep]
+
+    size = last_bucket + 1
+    counts = np.bincount(buckets, minlength=size)
+    humidity_sums = np.bincount(buckets, weights=humidities, minlength=size)
+    light_sums = np.bincount(buckets, weights=lights, minlength=size)
+    has_temperature = ~np.isnan(temperatures)
+    temperature_counts = np.bincount(buckets[has_temperature], minlength=size)
+    temperature_sums = np.bincount(buckets[has_temperature], weights=temperatures[has_temperature], minlength=size)
+
+    result = empty_sensor_chart()
+    for bucket in np.flatnonzero(counts).tolist():
+        count = int(counts[bucket])
+        if temperature_counts[bucket]:
+            avg_temperature = float(temperature_sums[bucket]) / int(temperature_counts[bucket])
+        else:
+            avg_temperature = DEFAULT_TEMPERATURE
+        result['timestamps'].append(from_microseconds(first + interval * bucket).isoformat())
+        # 使用Python的round，与原实现的舍入方式一致
+        result['temperature'].append(round(avg_temperature, 1))
+        result['humidity'].append(round(float(humidity_sums[bucket]) / count, 1))
+        result['light'].append(round(float(light_sums[bucket]) / count, 1))
+    return result
+
+
+def aggregate_rollups(queryset, interval_minutes):
+    """
+    按SensorRollup汇总行聚合图表数据，输出格式与aggregate_sensor_data相同。
+    interval_minutes必须是汇总粒度的整数倍；区间以第一个汇总行的起点为起点（按整点/整天对齐）。
+    """
+    rows = list(
+        queryset.order_by('bucket_start')
+        .values_list('bucket_start', 'count', 'temperature_count', 'temperature_sum', 'humidity_sum', 'light_sum')
+    )
+    if not rows:
+        return empty_sensor_chart()
+
+    starts, counts, temperature_counts, temperature_sums, humidity_sums, light_sums = zip(*rows)
+    first = starts[0]
+    interval = timedelta(minutes=interval_minutes)
+    buckets = np.fromiter(((start - first) // interval for start in starts), dtype=np.int64, count=len(rows))
+
+    def column(values):
+        return np.array([0.0 if value is None else value for value in values], dtype=np.float64)
+
+    counts = np.bincount(buckets, weights=column(counts))
+    temperature_counts = np.bincount(buckets, weights=column(temperature_counts))
+    temperature_sums = np.bincount(buckets, weights=column(temperature_sums))
+    humidity_sums = np.bincount(buckets, weights=column(humidity_sums))
+    light_sums = np.bincount(buckets, weights=column(light_sums))
+
+    result = empty_sensor_chart()
+    for bucket in np.flatnonzero(counts).tolist():
+        count = counts[bucket]
+        if temperature_counts[bucket]:
+            avg_temperature = float(temperature_sums[bucket] / temperature_counts[bucket])
+        else:
+            avg_temperature = DEFAULT_TEMPERATURE
+        result['timestamps'].append((first + interval * bucket).isoformat())
+        result['temperature'].append(round(avg_temperature, 1))
+        result['humidity'].append(round(float(humidity_sums[bucket] / count), 1))
+        result['light'].append(round(float(light_sums[bucket] / count), 1))
+    return result
+
+
+def rollup_records(queryset):
+    """
+    把环境数据的汇总行转换为与EnvironmentDataSerializer相同字段的记录（id、notes为空，数值为区间平均），
+    并附带区间内的记录数和最小、最大值
+    """
+    recorded_at = serializers.DateTimeField()
+    records = []
+    for rollup in queryset.order_by('bucket_start'):
+        records.append({
+            'id': None,
+            'temperature': rollup.temperature_sum / rollup.temperature_count if rollup.temperature_count else None,
+            'humidity': rollup.humidity_sum / rollup.count if rollup.humidity_sum is not None else None,
+            'recorded_at': recorded_at.to_representation(rollup.bucket_start),
+            'notes': None,
+            'count': rollup.count,
+            'temperature_min': rollup.temperature_min,
+            'temperature_max': rollup.temperature_max,
+            'humidity_min': rollup.humidity_min,
+            'humidity_max': rollup.humidity_max,
+        })
+    return records
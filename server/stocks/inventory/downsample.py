@@ -0,0 +1,91 @@
+"""
+图表数据降采样（Largest-Triangle-Three-Buckets）
+
+把n个点降到max_points个点：首尾两点保留，中间的点均分为max_points-2个桶，
+每个桶选出与“上一个选中点”和“下一个桶的平均点”构成三角形面积最大的点。
+相比每隔k个取一个点，LTTB会保留峰值、谷值等视觉上的极值。
+
+多条曲线共用一个时间轴时（如温度、湿度、光照），各曲线先归一化到[0, 1]，
+再按三角形面积之和选点，所有曲线使用同一组下标，返回的时间戳仍然一一对应。
+
+每个桶内的面积计算用NumPy向量化，Python循环次数只与max_points有关。
+"""
+import numpy as np
+
+# 未指定max_points时返回的最大点数
+DEFAULT_MAX_POINTS = 500
+# max_points参数允许的范围
+MIN_POINTS = 3
+MAX_POINTS_LIMIT = 5000
+
+
+def parse_max_points(value, default=DEFAULT_MAX_POINTS):
+    """解析max_points查询参数，不是整数时抛出ValueError，超出范围时截断到[MIN_POINTS, MAX_POINTS_LIMIT]"""
+    if value in (None, ''):
+        return default
+    return min(MAX_POINTS_LIMIT, max(MIN_POINTS, int(value)))
+
+
+def _normalize(values):
+    """按行归一化到[0, 1]，常数行为0，NaN用该行的平均值代替"""
+    values = np.array(values, dtype=np.float64)
+    for row in values:
+        missing = np.isnan(row)
+        if missing.all():
+            row[:] = 0.0
+            continue
+        if missing.any():
+            row[missing] = np.nanmean(row)
+        low, high = row.min(), row.max()
+        row[:] = (row - low) / (high - low) if high > low else 0.0
+    return values
+
+
+def lttb_indices(x, y, max_points):
+    """
+    返回LTTB选中的点的下标（升序的NumPy数组）。
+    x: 长度为n的横坐标（如时间戳秒数），需要单调递增
+    y: 长度为n的一条曲线，或形状为(曲线数, n)的多条曲线
+    n不超过max_points时返回全部下标
+    """
+    x = np.asarray(x, dtype=np.float64)
+    n = x.size
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+
+    ys = _normalize(np.atleast_2d(np.asarray(y, dtype=np.float64)))
+    span = x[-1] - x[0]
+    x = (x - x[0]) / span if span > 0 else np.zeros(n)
+
+    # 中间n-2个点均分为max_points-2个桶，第i个桶为 [edges[i], edges[i+1])
+    every = (n - 2) / (max_points - 2)
+    edges = (np.arange(max_points - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+
+    # 各桶的平均点；第i个桶使用第i+1个桶的平均点，最后一个桶使用最后一个数据点
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(ys[:, :n - 1], edges[:-1], axis=1) / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.concatenate([avg_y[:, 1:], ys[:, -1:]], axis=1)
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], ys[:, a:a + 1]
+        # 三角形面积的两倍，各曲线求和
+        areas = np.abs(
+            (ax - next_x[i]) * (ys[:, lo:hi] - ay)
+            - (ax - x[lo:hi]) * (next_y[:, i:i + 1] - ay)
+        ).sum(axis=0)
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def take(values, indices):
+    """按下标从列表中取值"""
+    return [values[i] for i in indices.tolist()]
@@ -0,0 +1 @@
+# 初始化文件 
\ No newline at end of file
@@ -0,0 +1,95 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory.charts import aggregate_sensor_data, empty_sensor_chart
+from inventory.models import SensorData
+
+
+def legacy_chart_data(queryset, interval_minutes, now):
+    """原 SensorDataViewSet.chart_data 的逐区间查询实现，用于对比结果和耗时"""
+    sensor_data = queryset.order_by('timestamp')
+    if not sensor_data:
+        return empty_sensor_chart()
+    result = empty_sensor_chart()
+    current_time = sensor_data.first().timestamp
+    while current_time <= now:
+        interval_end = current_time + timedelta(minutes=interval_minutes)
+        interval_data = sensor_data.filter(timestamp__gte=current_time, timestamp__lt=interval_end)
+        if interval_data.exists():
+            avg_temp_values = [d.temperature for d in interval_data if d.temperature is not None]
+            avg_temp = sum(avg_temp_values) / len(avg_temp_values) if avg_temp_values else 25.0
+            avg_humidity = sum(d.humidity for d in interval_data) / interval_data.count()
+            avg_light = sum(d.light for d in interval_data) / interval_data.count()
+            result['timestamps'].append(current_time.isoformat())
+            result['temperature'].append(round(avg_temp, 1))
+            result['humidity'].append(round(avg_humidity, 1))
+            result['light'].append(round(avg_light, 1))
+        current_time = interval_end
+    return result
+
+
+class Command(BaseCommand):
+    help = '传感器图表聚合基准：在事务中生成测试数据，对比逐区间查询与单次查询聚合的耗时和结果（结束后回滚）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='生成的SensorData行数')
+        parser.add_argument('--days', type=int, default=30, help='数据分布的天数（也是图表的时间范围）')
+        parser.add_argument('--interval', type=int, default=60, help='聚合间隔（分钟）')
+        parser.add_argument('--legacy', action='store_true', help='同时运行原实现并比较结果（百万行时非常慢）')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options)
+            # 测试数据不写入数据库
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+        start_time = now - timedelta(days=options['days'])
+        span = options['days'] * 86400
+
+        self.stdout.write(f"生成 {options['rows']} 行测试数据...")
+        started = time.perf_counter()
+        batch = []
+        for _ in range(options['rows']):
+            batch.append(SensorData(
+                temperature=None if rng.random() < 0.1 else round(rng.uniform(15, 35), 1),
+                humidity=round(rng.uniform(30, 90), 1),
+                light=round(rng.uniform(0, 1000), 1),
+                timestamp=start_time + timedelta(seconds=rng.uniform(0, span)),
+            ))
+            if len(batch) == 10000:
+                SensorData.objects.bulk_create(batch)
+                batch = []
+        SensorData.objects.bulk_create(batch)
+        self.stdout.write(f"  用时 {time.perf_counter() - started:.1f} 秒")
+
+        queryset = SensorData.objects.filter(timestamp__gte=start_time)
+        results = {}
+        for name, func in [('single_pass', aggregate_sensor_data), ('legacy', legacy_chart_data)]:
+            if name == 'legacy' and not options['legacy']:
+                continue
+            started = time.perf_counter()
+            with connection.execute_wrapper(self._count_query):
+                self._queries = 0
+                results[name] = func(queryset, options['interval'], now)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:<12} {elapsed * 1000:>10.1f} ms  {self._queries:>6} 次查询  "
+                              f"{len(results[name]['timestamps'])} 个数据点")
+
+        if 'legacy' in results:
+            if results['legacy'] == results['single_pass']:
+                self.stdout.write(self.style.SUCCESS('两种实现的输出完全一致'))
+            else:
+                self.stdout.write(self.style.ERROR('两种实现的输出不一致'))
+
+    def _count_query(self, execute, sql, params, many, context):
+        self._queries += 1
+        return execute(sql, params, many, context)
@@ -0,0 +1,363 @@
+"""
+传感器数据入库链路基准：直连入库(sensor_bridge) 对比 HTTP转发
+
+进程内启动一个模拟WebSocket服务器(ws_codec)，按固定速率推送N条type=emit的传感器数据，
+分别测量各链路从服务器发出到数据提交入库的延迟、吞吐量和CPU占用：
+
+    bridge  SensorBridge + SensorDataWriter，直接bulk_create（manage.py sensor_bridge）
+    http    每条消息一次 requests.post 到 add_data（原来的websocket_client.py）
+    bulk    按批提交到 add_data_bulk，复用keep-alive连接（现在的websocket_client.py，不含本地暂存）
+
+http、bulk链路在子进程中启动 runserver --noreload 接收请求，CPU统计包含该子进程。
+各链路都按发送顺序提交，第k条提交的数据对应第k条发出的消息。
+结束后删除基准写入的数据并重建受影响的汇总（--keep保留）。
+
+示例:
+    python manage.py bench_sensor_bridge --messages 5000 --rate 1000
+    python manage.py bench_sensor_bridge --paths bridge,bulk --messages 20000 --rate 0
+"""
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from inventory import rollups, ws_codec
+from inventory.models import SensorData
+from inventory.sensor_bridge import SensorBridge, SensorDataWriter
+
+PATHS = ('bridge', 'http', 'bulk')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_cpu_seconds(pid):
+    """Linux下读取子进程的CPU时间（秒），其他平台返回None"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2)
+
+
+class FeedServer:
+    """模拟WebSocket传感器服务器：第一个客户端连接后按速率推送messages条数据，记录每条的发送时间"""
+
+    def __init__(self, messages, rate, seed=0):
+        self.messages = messages
+        self.rate = rate
+        self.port = free_port()
+        self.sends = []
+        self.rng = random.Random(seed)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name='bench-feed-server', daemon=True)
+        self._ready = threading.Event()
+        self._served = False
+
+    @property
+    def url(self):
+        return f'ws://127.0.0.1:{self.port}'
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait(10)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', self.port))
+        self._ready.set()
+        self.loop.run_forever()
+
+    def _payload(self):
+        return json.dumps({
+            'type': 'emit',
+            'temperature': round(self.rng.uniform(18, 30), 1),
+            'humidity': round(self.rng.uniform(30, 80), 1),
+            'light': round(self.rng.uniform(100, 900), 1),
+            'timestamp': timezone.localtime().isoformat(),
+        })
+
+    async def _handle(self, reader, writer):
+        try:
+            _, conn = await ws_codec.accept(reader, writer)
+        except ws_codec.WebSocketError:
+            return
+        if self._served:
+            await conn.close()
+            return
+        self._served = True
+        start = time.perf_counter()
+        for index in range(self.messages):
+            if self.rate:
+                delay = start + index / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            payload = self._payload()
+            self.sends.append(time.perf_counter())
+            await conn.send(payload)
+        # 保持连接，由客户端在数据全部入库后断开
+        while await conn.recv() is not None:
+            pass
+
+
+class DjangoServer:
+    """子进程中运行 runserver --noreload，供http、bulk链路提交数据"""
+
+    def __init__(self):
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        self.process = None
+
+    def start(self, timeout=30):
+        manage = os.path.abspath(sys.argv[0])
+        self.process = subprocess.Popen(
+            [sys.executable, manage, 'runserver', f'127.0.0.1:{self.port}', '--noreload'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                requests.get(f'{self.base_url}/api/sensor-data/latest/', timeout=1)
+                return
+            except requests.RequestException:
+                if self.process.poll() is not None:
+                    break
+                time.sleep(0.2)
+        self.stop()
+        raise CommandError('runserver未能启动，无法测试http/bulk链路')
+
+    def cpu_seconds(self):
+        return process_cpu_seconds(self.process.pid)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(10)
+
+
+# --------------- 各链路的消费端，返回每条数据的提交时间 ---------------
+async def consume_bridge(url, count, options, timeout):
+    commits = []
+    # 暂存目录用临时目录，基准不会留下或补发正式的暂存数据
+    with tempfile.TemporaryDirectory() as spool_dir:
+        writer = SensorDataWriter(
+            batch_size=options['batch_size'], flush_interval=options['flush_interval'],
+            queue_size=max(10000, count), spool_dir=spool_dir,
+            on_batch=lambda batch: commits.extend([time.perf_counter()] * len(batch)),
+        )
+        bridge = SensorBridge(url, writer, min_backoff=0.1)
+        writer.start()
+        task = asyncio.create_task(bridge.run())
+        deadline = time.perf_counter() + timeout
+        while len(commits) < count and time.perf_counter() < deadline and not task.done():
+            await asyncio.sleep(0.01)
+        bridge.stop()
+        await task
+        await asyncio.to_thread(writer.stop)
+        return commits, writer.stats()
+
+
+async def consume_http(url, count, api_url, timeout):
+    commits = []
+    conn = await ws_codec.connect(url)
+    deadline = time.perf_counter() + timeout
+    try:
+        while len(commits) < count and time.perf_counter() < deadline:
+            message = await conn.recv()
+            if message is None:
+                break
+            # 与原来的websocket_client.py相同：每条消息单独发起一次请求，不复用连接
+            response = await asyncio.to_thread(requests.post, api_url, json=json.loads(message))
+            if response.status_code == 201:
+                commits.append(time.perf_counter())
+    finally:
+        await conn.close()
+    return commits, None
+
+
+async def consume_bulk(url, count, api_url, options, timeout):
+    commits = []
+    buffer = []
+    full = asyncio.Event()
+    session = requests.Session()
+    conn = await ws_codec.connect(url)
+    deadline = time.perf_counter() + timeout
+
+    async def receive():
+        while True:
+            message = await conn.recv()
+            if message is None:
+                return
+            buffer.append(json.loads(message))
+            if len(buffer) >= options['batch_size']:
+                full.set()
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while len(commits) < count and time.perf_counter() < deadline:
+            try:
+                await asyncio.wait_for(full.wait(), options['flush_interval'])
+            except asyncio.TimeoutError:
+                pass
+            batch = buffer[:options['batch_size']]
+            del buffer[:options['batch_size']]
+            if len(buffer) < options['batch_size']:
+                full.clear()
+            if not batch:
+                continue
+            response = await asyncio.to_thread(session.post, api_url, json=batch)
+            if response.status_code == 201:
+                commits.extend([time.perf_counter()] * response.json()['created'])
+    finally:
+        receiver.cancel()
+        await conn.close()
+        session.close()
+    return commits, None
+
+
+class Command(BaseCommand):
+    help = '传感器数据入库链路基准：直连入库对比HTTP转发，测量吞吐量、延迟和CPU占用'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paths', default=','.join(PATHS), help=f"要测试的链路，逗号分隔 ({', '.join(PATHS)})")
+        parser.add_argument('--messages', type=int, default=2000, help='每个链路推送的消息数')
+        parser.add_argument('--rate', type=float, default=500, help='每秒推送的消息数，0为尽快推送')
+        parser.add_argument('--batch-size', type=int, default=200, help='bridge、bulk链路每批最多的条数')
+        parser.add_argument('--flush-interval', type=float, default=0.2, help='bridge、bulk链路最长缓冲时间（秒）')
+        parser.add_argument('--timeout', type=float, default=120, help='每个链路最长运行时间（秒）')
+        parser.add_argument('--json', dest='json_path', help='把报告另存为JSON文件')
+        parser.add_argument('--keep', action='store_true', help='保留基准写入的数据')
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options['paths'].split(',') if path.strip()]
+        unknown = set(paths) - set(PATHS)
+        if unknown:
+            raise CommandError(f"未知的链路: {', '.join(sorted(unknown))}")
+
+        server = None
+        if {'http', 'bulk'} & set(paths):
+            server = DjangoServer()
+            server.start()
+
+        reports = []
+        try:
+            for path in paths:
+                reports.append(self._run_path(path, options, server))
+                self._print_report(reports[-1])
+        finally:
+            if server is not None:
+                server.stop()
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as f:
+                json.dump(reports, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"报告已保存到 {options['json_path']}")
+
+    def _run_path(self, path, options, server):
+        count = options['messages']
+        start_id = SensorData.objects.aggregate(m=Max('id'))['m'] or 0
+        started_at = timezone.now()
+        feed = FeedServer(count, options['rate'])
+        feed.start()
+
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        server_cpu_before = server.cpu_seconds() if server else None
+        try:
+            if path == 'bridge':
+                coroutine = consume_bridge(feed.url, count, options, options['timeout'])
+            elif path == 'http':
+                coroutine = consume_http(feed.url, count, f'{server.base_url}/api/sensor-data/add_data/',
+                                         options['timeout'])
+            else:
+                coroutine = consume_bulk(feed.url, count, f'{server.base_url}/api/sensor-data/add_data_bulk/',
+                                         options, options['timeout'])
+            commits, writer_stats = asyncio.run(coroutine)
+        finally:
+            feed.stop()
+        usage_after = resource.getrusage(resource.RUSAGE_SELF)
+        server_cpu = None
+        if path != 'bridge' and server_cpu_before is not None:
+            server_cpu = round(server.cpu_seconds() - server_cpu_before, 3)
+
+        rows = SensorData.objects.filter(id__gt=start_id).count()
+        if not options['keep']:
+            self._cleanup(start_id, started_at)
+
+        sends = feed.sends
+        latencies = sorted(commit - send for send, commit in zip(sends, commits))
+        elapsed = commits[-1] - sends[0] if commits else 0.0
+        cpu = (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime)
+        return {
+            'path': path,
+            'messages': count,
+            'rate': options['rate'],
+            'sent': len(sends),
+            'committed': len(commits),
+            'rows': rows,
+            'elapsed_s': round(elapsed, 3),
+            'rows_per_sec': round(len(commits) / elapsed, 1) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': round(latencies[-1] * 1000, 2) if latencies else None,
+            },
+            'cpu': {
+                'benchmark_process_seconds': round(cpu, 3),
+                'django_server_seconds': server_cpu,
+            },
+            'writer': writer_stats,
+        }
+
+    def _cleanup(self, start_id, started_at):
+        # 直接删除，避免post_delete信号逐行重算汇总；删除后重建基准期间的汇总
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SensorData._meta.db_table} WHERE id > %s', [start_id])
+        rollups.rebuild('sensor', since=started_at)
+
+    def _print_report(self, report):
+        latency = report['latency_ms']
+        cpu = report['cpu']
+        cpu_line = f"  CPU: 基准进程 {cpu['benchmark_process_seconds']}秒"
+        if cpu['django_server_seconds'] is not None:
+            cpu_line += f", runserver进程 {cpu['django_server_seconds']}秒"
+        lines = [
+            '',
+            f"链路 {report['path']} ({report['messages']}条, 推送速率 {report['rate'] or '不限'}条/秒)",
+            f"  入库: {report['committed']}/{report['sent']} 条, 数据库新增 {report['rows']} 行, "
+            f"{report['rows_per_sec']} 条/秒, 用时 {report['elapsed_s']}秒",
+            f"  发送到提交的延迟(ms): p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}",
+            cpu_line,
+        ]
+        if report['writer']:
+            writer = report['writer']
+            lines.append(f"  写入线程: {writer['flushes']}次批量写入, 平均{writer['flush_ms_avg']}ms, "
+                         f"队列丢弃 {writer['dropped']} 条")
+        self.stdout.write('\n'.join(lines))
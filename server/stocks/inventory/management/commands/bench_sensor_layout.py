@@ -0,0 +1,179 @@
+"""
+SensorData表结构基准：在独立的SQLite文件中生成N行数据，比较三种布局的范围查询延迟
+
+    flat     单表，没有时间索引（0020迁移之前的结构）
+    indexed  单表 + 覆盖索引 sensordata_timestamp_idx
+    sharded  按月分表（sensor_shards，manage.py shard_sensor_data --keep-months 1），当前月留在主表
+
+范围查询都通过 SensorShardRouter.values_list 读取图表用到的列（与chart_data的原始数据路径相同），
+另外测量取最新一条（latest接口）。每个查询执行 --repeat 次取中位数。
+
+数据库文件默认放在系统临时目录，不影响项目数据库；生成后保留，--reuse 跳过生成直接测量。
+
+示例:
+    python manage.py bench_sensor_layout --rows 10000000 --months 12
+    python manage.py bench_sensor_layout --rows 10000000 --reuse
+"""
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.utils import timezone
+
+from inventory.charts import SENSOR_CHART_FIELDS
+from inventory.models import SensorData
+from inventory.sensor_shards import SensorShardRouter, month_start, next_month
+
+LAYOUTS = ('flat', 'indexed', 'sharded')
+
+
+def scratch_connection(alias, path):
+    """指向path的SQLite连接，注册为alias供 .using(alias) 使用（只在当前线程有效）"""
+    settings_dict = dict(connections['default'].settings_dict,
+                         ENGINE='django.db.backends.sqlite3', NAME=path, OPTIONS={})
+    connection = DatabaseWrapper(settings_dict, alias)
+    connections[alias] = connection
+    return connection
+
+
+class Command(BaseCommand):
+    help = 'SensorData表结构基准：单表无索引 / 覆盖索引 / 按月分表的范围查询延迟'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='生成的数据行数')
+        parser.add_argument('--months', type=int, default=12, help='数据覆盖最近多少个月（每月按30天计）')
+        parser.add_argument('--repeat', type=int, default=3, help='每个查询执行的次数')
+        parser.add_argument('--dir', default=os.path.join(tempfile.gettempdir(), 'sensor_layout_bench'),
+                            help='基准数据库文件所在目录')
+        parser.add_argument('--reuse', action='store_true', help='使用已生成的数据库文件，不重新生成')
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        paths = {layout: os.path.join(directory, f'{layout}.sqlite3') for layout in LAYOUTS}
+        if options['reuse']:
+            missing = [path for path in paths.values() if not os.path.exists(path)]
+            if missing:
+                raise CommandError(f"数据库文件不存在: {', '.join(missing)}")
+        else:
+            os.makedirs(directory, exist_ok=True)
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.remove(path)
+            self._build(paths, options['rows'], options['months'])
+
+        # 查询的"当前时间"取数据中最新的时间，--reuse时与生成时一致
+        flat = scratch_connection('bench_flat', paths['flat'])
+        latest = SensorData.objects.using('bench_flat').order_by('-timestamp').values_list('timestamp', flat=True).first()
+        flat.close()
+        queries = [
+            ('最近1小时', latest - timezone.timedelta(hours=1), None),
+            ('最近24小时', latest - timezone.timedelta(hours=24), None),
+            ('最近7天', latest - timezone.timedelta(days=7), None),
+            ('最近30天', latest - timezone.timedelta(days=30), None),
+            ('半年前的1天', latest - timezone.timedelta(days=183), latest - timezone.timedelta(days=182)),
+        ]
+
+        results = {}
+        for layout in LAYOUTS:
+            alias = f'bench_{layout}'
+            connection = scratch_connection(alias, paths[layout])
+            results[layout] = self._measure(alias, queries, options['repeat'])
+            connection.close()
+
+        self._print_report(options, paths, queries, results)
+
+    # --------------- 生成数据 ---------------
+    def _build(self, paths, rows, months):
+        end = timezone.now()
+        start = end - timezone.timedelta(days=30 * months)
+        step = (end - start).total_seconds() / rows
+
+        started = time.perf_counter()
+        connection = scratch_connection('bench_flat', paths['flat'])
+        index = SensorData._meta.indexes[0]
+        # 索引在schema_editor退出时才创建，删除索引要放在第二个schema_editor中
+        with connection.schema_editor() as editor:
+            editor.create_model(SensorData)
+        with connection.schema_editor() as editor:
+            editor.remove_index(SensorData, index)
+        # 在SQLite内用递归CTE生成数据，时间均匀分布，格式与Django保存的DateTimeField相同（UTC）
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=OFF')
+            cursor.execute('PRAGMA synchronous=OFF')
+            cursor.execute(f'''
+                WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < {rows - 1})
+                INSERT INTO {SensorData._meta.db_table} (temperature, humidity, light, threshold, timestamp, created_at)
+                SELECT
+                    CASE WHEN i % 50 = 0 THEN NULL ELSE 15 + (abs(random()) % 200) / 10.0 END,
+                    30 + (abs(random()) % 500) / 10.0,
+                    (abs(random()) % 9000) / 10.0,
+                    NULL,
+                    datetime({start.timestamp()} + i * {step}, 'unixepoch'),
+                    datetime({start.timestamp()} + i * {step}, 'unixepoch')
+                FROM seq
+            ''')
+        connection.close()
+        self.stdout.write(f'flat: 生成 {rows} 行, {time.perf_counter() - started:.1f}秒')
+
+        started = time.perf_counter()
+        shutil.copyfile(paths['flat'], paths['indexed'])
+        connection = scratch_connection('bench_indexed', paths['indexed'])
+        with connection.schema_editor() as editor:
+            editor.add_index(SensorData, index)
+        connection.close()
+        self.stdout.write(f'indexed: 创建覆盖索引, {time.perf_counter() - started:.1f}秒')
+
+        # 用 shard_sensor_data 相同的代码把当前月之前的整月移到分表
+        started = time.perf_counter()
+        shutil.copyfile(paths['indexed'], paths['sharded'])
+        connection = scratch_connection('bench_sharded', paths['sharded'])
+        router = SensorShardRouter('bench_sharded')
+        cutoff = month_start(end)
+        month = month_start(start)
+        while month < cutoff:
+            router.archive_month(month)
+            month = next_month(month)
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
+        connection.close()
+        self.stdout.write(f'sharded: 移到 {len(router.shard_tables())} 张月分表, {time.perf_counter() - started:.1f}秒')
+
+    # --------------- 测量 ---------------
+    def _measure(self, alias, queries, repeat):
+        router = SensorShardRouter(alias)
+        result = {}
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            SensorData.objects.using(alias).order_by('-timestamp').values_list(*SENSOR_CHART_FIELDS).first()
+            timings.append(time.perf_counter() - started)
+        result['最新一条'] = (1, statistics.median(timings) * 1000, 1)
+
+        for name, start, end in queries:
+            timings = []
+            rows = 0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = sum(1 for _ in router.values_list(SENSOR_CHART_FIELDS, start, end))
+                timings.append(time.perf_counter() - started)
+            result[name] = (rows, statistics.median(timings) * 1000, len(router.tables_for_range(start, end)) + 1)
+        return result
+
+    def _print_report(self, options, paths, queries, results):
+        sizes = {layout: os.path.getsize(path) / 1024 / 1024 for layout, path in paths.items()}
+        lines = [
+            '',
+            f"SensorData表结构基准 ({options['rows']} 行, {options['months']} 个月, 每个查询 {options['repeat']} 次取中位数)",
+            '  文件大小(MB): ' + ', '.join(f'{layout}={size:.0f}' for layout, size in sizes.items()),
+            f"  {'查询':<10}{'行数':>10}" + ''.join(f'{layout + "(ms)":>14}' for layout in LAYOUTS) + f"{'查询表数':>10}",
+        ]
+        for name in ['最新一条'] + [query[0] for query in queries]:
+            rows = results['flat'][name][0]
+            cells = ''.join(f'{results[layout][name][1]:>14.1f}' for layout in LAYOUTS)
+            lines.append(f'  {name:<10}{rows:>10}{cells}{results["sharded"][name][2]:>10}')
+        self.stdout.write('\n'.join(lines))
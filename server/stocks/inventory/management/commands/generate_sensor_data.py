@@ -0,0 +1,269 @@
+"""
+生成模拟传感器数据，用于填充数据库和压力测试（数据模型见 inventory.sensor_synth）
+
+    db    直接写入数据库（默认）。--method sql 用 executemany 写入（仅SQLite，最快），
+          --method bulk 用 bulk_create；写入后重建该时间范围的小时/天汇总，清空最新值缓存。
+          直接写入不经过信号，不触发警报规则。
+    http  多个客户端并发向 add_data_bulk 提交数据，同时另一组客户端反复请求图表接口，
+          分别统计写入吞吐量和各接口的响应时间（--read-only 只测读取）。
+
+示例:
+    python manage.py generate_sensor_data --days 180 --interval 10
+    python manage.py generate_sensor_data --days 30 --clear --seed 1
+    python manage.py generate_sensor_data --mode http --url http://127.0.0.1:8000 --days 1 --interval 1 \\
+        --clients 4 --readers 8 --username admin --password admin
+    python manage.py generate_sensor_data --mode http --read-only --readers 16 --read-requests 200 --token <JWT>
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from inventory import rollups
+from inventory.latest_cache import latest_cache
+from inventory.models import SensorData
+from inventory.sensor_ingest import MAX_BATCH_SIZE
+from inventory.sensor_synth import SensorSeries, nullable, to_datetime_strings, to_iso_strings
+
+# http模式下读取客户端轮流请求的接口
+READ_ENDPOINTS = (
+    ('最近24小时', '/api/sensor-data/chart_data/?hours=24'),
+    ('最近7天', '/api/sensor-data/chart_data/?days=7'),
+    ('最近30天', '/api/sensor-data/chart_data/?days=30'),
+    ('最近365天', '/api/sensor-data/chart_data/?days=365'),
+    ('最近7天(原始数据)', '/api/sensor-data/chart_data/?days=7&resolution=raw'),
+    ('最新一条', '/api/sensor-data/latest/'),
+)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1)
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    return f"p50={percentile(latencies, 0.5)} p95={percentile(latencies, 0.95)} p99={percentile(latencies, 0.99)}"
+
+
+class Command(BaseCommand):
+    help = '用NumPy批量生成多月的模拟传感器数据，直接写入数据库或通过HTTP并发压测写入和图表接口'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['db', 'http'], default='db', help='直接写入数据库或通过HTTP接口')
+        parser.add_argument('--days', type=float, default=90, help='生成最近多少天的数据')
+        parser.add_argument('--interval', type=float, default=60, help='读数间隔（秒）')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--gaps-per-day', type=float, default=0.5, help='平均每天的断线次数')
+        parser.add_argument('--gap-minutes', type=float, default=30, help='断线的平均持续时间（分钟）')
+        parser.add_argument('--null-rate', type=float, default=0.01, help='温度为空的读数比例')
+        parser.add_argument('--threshold', type=float, help='写入每条读数的温度警报阈值')
+        parser.add_argument('--batch-size', type=int, help='db模式每次写入的行数（默认50000）；http模式每个请求的条数（默认1000）')
+        # db模式
+        parser.add_argument('--method', choices=['sql', 'bulk'], default='sql', help='db模式的写入方式')
+        parser.add_argument('--clear', action='store_true', help='db模式写入前删除主表中该时间范围的数据')
+        parser.add_argument('--no-rollups', action='store_true', help='db模式写入后不重建汇总')
+        # http模式
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='http模式的Django服务地址')
+        parser.add_argument('--clients', type=int, default=4, help='http模式并发写入的客户端数')
+        parser.add_argument('--readers', type=int, default=4, help='http模式并发读取图表接口的客户端数')
+        parser.add_argument('--read-requests', type=int, default=50, help='每个读取客户端的请求数')
+        parser.add_argument('--read-only', action='store_true', help='http模式只测读取，不写入数据')
+        parser.add_argument('--token', help='http模式读取图表接口使用的JWT访问令牌')
+        parser.add_argument('--username', help='http模式用用户名密码获取JWT令牌')
+        parser.add_argument('--password')
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0 or options['interval'] <= 0:
+            raise CommandError('--days 和 --interval 必须大于0')
+        end = timezone.now()
+        start = end - timezone.timedelta(days=options['days'])
+        series = SensorSeries(
+            start, end, interval=options['interval'], seed=options['seed'],
+            gaps_per_day=options['gaps_per_day'], gap_minutes=options['gap_minutes'], null_rate=options['null_rate'],
+        )
+        if options['mode'] == 'db':
+            self._write_db(series, start, end, options)
+        else:
+            self._run_http(series, options)
+
+    # --------------- db模式 ---------------
+    def _write_db(self, series, start, end, options):
+        if options['method'] == 'sql' and connection.vendor != 'sqlite':
+            raise CommandError('--method sql 只支持SQLite，其他数据库请使用 --method bulk')
+        batch_size = options['batch_size'] or 50000
+        table = connection.ops.quote_name(SensorData._meta.db_table)
+
+        if options['clear']:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {table} WHERE timestamp >= %s AND timestamp < %s', [
+                    connection.ops.adapt_datetimefield_value(start), connection.ops.adapt_datetimefield_value(end),
+                ])
+                self.stdout.write(f'已删除 {cursor.rowcount} 行')
+
+        self.stdout.write(f'生成 {start:%Y-%m-%d %H:%M} 至 {end:%Y-%m-%d %H:%M} 的数据，'
+                          f"间隔 {options['interval']:g} 秒（断线前约 {series.total} 条）...")
+        started = time.perf_counter()
+        rows = 0
+        # 整个写入在一个事务中，SQLite只在提交时写一次日志
+        with transaction.atomic():
+            for chunk in series.chunks(batch_size):
+                if options['method'] == 'sql':
+                    self._insert_sql(table, chunk, options['threshold'])
+                else:
+                    self._insert_bulk(chunk, options['threshold'])
+                rows += len(chunk['timestamp'])
+                self.stdout.write(f'  {rows} 行, {rows / (time.perf_counter() - started):.0f} 行/秒')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"写入 {rows} 行, 用时 {elapsed:.1f} 秒, {rows / elapsed if elapsed else 0:.0f} 行/秒 ({options['method']})"
+        ))
+
+        latest_cache.invalidate('sensor')
+        if not options['no_rollups']:
+            started = time.perf_counter()
+            written = rollups.rebuild('sensor', since=start)
+            self.stdout.write(f'重建汇总 {written} 行, 用时 {time.perf_counter() - started:.1f} 秒')
+
+    def _insert_sql(self, table, chunk, threshold):
+        created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        count = len(chunk['timestamp'])
+        rows = zip(
+            nullable(chunk['temperature']),
+            chunk['humidity'].tolist(),
+            chunk['light'].tolist(),
+            [threshold] * count,
+            to_datetime_strings(chunk['timestamp']).tolist(),
+            [created_at] * count,
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (temperature, humidity, light, threshold, timestamp, created_at) '
+                f'VALUES (%s, %s, %s, %s, %s, %s)', rows
+            )
+
+    def _insert_bulk(self, chunk, threshold):
+        objs = [
+            SensorData(temperature=temperature, humidity=humidity, light=light, threshold=threshold,
+                       timestamp=datetime.fromtimestamp(ts, tz=dt_timezone.utc))
+            for temperature, humidity, light, ts in zip(
+                nullable(chunk['temperature']), chunk['humidity'].tolist(),
+                chunk['light'].tolist(), chunk['timestamp'].tolist(),
+            )
+        ]
+        SensorData.objects.bulk_create(objs, batch_size=5000)
+
+    # --------------- http模式 ---------------
+    def _run_http(self, series, options):
+        base_url = options['url'].rstrip('/')
+        headers = self._auth_headers(base_url, options) if options['readers'] else {}
+        batch_size = min(options['batch_size'] or 1000, MAX_BATCH_SIZE)
+        writes = {'rows': 0, 'created': 0, 'errors': 0, 'failed_requests': 0, 'latencies': []}
+        reads = {name: {'latencies': [], 'errors': 0, 'bytes': 0} for name, _ in READ_ENDPOINTS}
+        lock = threading.Lock()
+        batches = iter(()) if options['read_only'] else self._http_batches(series, batch_size, options['threshold'])
+
+        def writer():
+            session = requests.Session()
+            while True:
+                with lock:
+                    batch = next(batches, None)
+                if batch is None:
+                    return
+                started = time.perf_counter()
+                try:
+                    response = session.post(f'{base_url}/api/sensor-data/add_data_bulk/', json=batch, timeout=60)
+                    ok = response.status_code == 201
+                    result = response.json() if ok else None
+                except requests.RequestException:
+                    ok, result = False, None
+                elapsed = time.perf_counter() - started
+                with lock:
+                    writes['rows'] += len(batch)
+                    writes['latencies'].append(elapsed)
+                    if ok:
+                        writes['created'] += result['created']
+                        writes['errors'] += len(result['errors'])
+                    else:
+                        writes['failed_requests'] += 1
+
+        def reader(offset):
+            session = requests.Session()
+            session.headers.update(headers)
+            for i in range(options['read_requests']):
+                name, path = READ_ENDPOINTS[(offset + i) % len(READ_ENDPOINTS)]
+                started = time.perf_counter()
+                try:
+                    response = session.get(f'{base_url}{path}', timeout=120)
+                    ok, size = response.status_code == 200, len(response.content)
+                except requests.RequestException:
+                    ok, size = False, 0
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if ok:
+                        reads[name]['latencies'].append(elapsed)
+                        reads[name]['bytes'] += size
+                    else:
+                        reads[name]['errors'] += 1
+
+        writers = 0 if options['read_only'] else options['clients']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, writers + options['readers'])) as executor:
+            futures = [executor.submit(writer) for _ in range(writers)]
+            futures += [executor.submit(reader, i) for i in range(options['readers'])]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+        self._print_http_report(options, writes, reads, elapsed)
+
+    def _http_batches(self, series, batch_size, threshold):
+        for chunk in series.chunks(max(batch_size, 100000)):
+            timestamps = to_iso_strings(chunk['timestamp']).tolist()
+            temperatures = nullable(chunk['temperature'])
+            humidity = chunk['humidity'].tolist()
+            light = chunk['light'].tolist()
+            for first in range(0, len(timestamps), batch_size):
+                last = first + batch_size
+                yield [
+                    {'type': 'emit', 'temperature': t, 'humidity': h, 'light': l, 'threshold': threshold, 'timestamp': ts}
+                    for t, h, l, ts in zip(temperatures[first:last], humidity[first:last],
+                                           light[first:last], timestamps[first:last])
+                ]
+
+    def _auth_headers(self, base_url, options):
+        token = options['token']
+        if token is None and options['username']:
+            response = requests.post(f'{base_url}/api/token/', json={
+                'username': options['username'], 'password': options['password'] or '',
+            }, timeout=30)
+            if response.status_code != 200:
+                raise CommandError(f'获取令牌失败: {response.status_code} {response.text[:200]}')
+            token = response.json()['access']
+        if token is None:
+            raise CommandError('图表接口需要认证，请提供 --token 或 --username/--password（或设置 --readers 0）')
+        return {'Authorization': f'Bearer {token}'}
+
+    def _print_http_report(self, options, writes, reads, elapsed):
+        lines = ['', f"HTTP压测 {options['url']}, 用时 {elapsed:.1f} 秒"]
+        if not options['read_only'] and options['clients']:
+            lines += [
+                f"写入 ({options['clients']}个客户端): 提交 {writes['rows']} 条, 入库 {writes['created']} 条, "
+                f"{writes['created'] / elapsed if elapsed else 0:.0f} 条/秒, 无效 {writes['errors']} 条, "
+                f"失败请求 {writes['failed_requests']} 个",
+                f"  每个请求的响应时间(ms): {latency_summary(writes['latencies'])}",
+            ]
+        if options['readers']:
+            lines.append(f"读取 ({options['readers']}个客户端, 每个 {options['read_requests']} 个请求):")
+            lines.append(f"  {'接口':<14}{'请求数':>8}{'失败':>6}{'平均大小(KB)':>14}  响应时间(ms)")
+            for name, _ in READ_ENDPOINTS:
+                result = reads[name]
+                count = len(result['latencies'])
+                size = result['bytes'] / count / 1024 if count else 0
+                lines.append(f"  {name:<14}{count:>8}{result['errors']:>6}{size:>14.1f}  {latency_summary(result['latencies'])}")
+        self.stdout.write('\n'.join(lines))
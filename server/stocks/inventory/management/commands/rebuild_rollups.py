@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory import rollups
+
+
+class Command(BaseCommand):
+    help = '按原始数据重建传感器数据/环境数据的小时、天汇总'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', choices=['sensor', 'environment', 'all'], default='all')
+        parser.add_argument('--days', type=int, default=None, help='只重建最近多少天的汇总（默认全部）')
+
+    def handle(self, *args, **options):
+        sources = list(rollups.SOURCES) if options['source'] == 'all' else [options['source']]
+        since = timezone.now() - timedelta(days=options['days']) if options['days'] else None
+        for source in sources:
+            written = rollups.rebuild(source, since)
+            self.stdout.write(self.style.SUCCESS(f'{source}: 已写入 {written} 条汇总'))
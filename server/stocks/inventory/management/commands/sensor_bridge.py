@@ -0,0 +1,61 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand
+
+from inventory.sensor_bridge import SPOOL_DIR, SensorBridge, SensorDataWriter
+
+
+class Command(BaseCommand):
+    help = '连接WebSocket服务器，把传感器数据直接批量写入数据库（替代websocket_client.py的HTTP转发）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='ws://localhost:8080', help='WebSocket服务器地址')
+        parser.add_argument('--batch-size', type=int, default=500, help='每批最多写入的条数')
+        parser.add_argument('--flush-interval', type=float, default=0.2, help='数据在队列中最长等待的秒数')
+        parser.add_argument('--queue-size', type=int, default=10000, help='写入队列长度，满时丢弃最旧的数据')
+        parser.add_argument('--spool-dir', default=SPOOL_DIR, help='数据库不可用时数据暂存的目录')
+        parser.add_argument('--max-backoff', type=float, default=30.0, help='重连间隔的上限（秒）')
+        parser.add_argument('--stats-interval', type=float, default=60.0, help='输出统计信息的间隔（秒），0为不输出')
+
+    def handle(self, *args, **options):
+        writer = SensorDataWriter(
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            queue_size=options['queue_size'],
+            spool_dir=options['spool_dir'],
+        )
+        bridge = SensorBridge(options['url'], writer, max_backoff=options['max_backoff'])
+        writer.start()
+        self.stdout.write(self.style.SUCCESS(f"传感器数据直连入库已启动: {options['url']}"))
+        self.stdout.write(self.style.WARNING('按CTRL+C退出'))
+        try:
+            asyncio.run(self._run(bridge, writer, options['stats_interval']))
+        except KeyboardInterrupt:
+            pass
+        # 队列中剩余的数据写入数据库（数据库不可用时写入暂存）后再退出
+        writer.stop()
+        self.stdout.write(self.style.SUCCESS(f'传感器数据直连入库已停止: {bridge.stats()}, {writer.stats()}'))
+
+    async def _run(self, bridge, writer, stats_interval):
+        loop = asyncio.get_running_loop()
+        # Ctrl+C和SIGTERM都正常停止；Windows的事件循环不支持add_signal_handler，Ctrl+C按KeyboardInterrupt处理
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, bridge.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        reporter = None
+        if stats_interval > 0:
+            reporter = asyncio.create_task(self._report(bridge, writer, stats_interval))
+        try:
+            await bridge.run()
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    async def _report(self, bridge, writer, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.stdout.write(f'传感器数据直连入库统计: {bridge.stats()}, {writer.stats()}')
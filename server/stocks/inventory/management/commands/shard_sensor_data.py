@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.models import SensorData
+from inventory.sensor_shards import month_start, next_month, router, shard_model
+
+
+class Command(BaseCommand):
+    help = '把较早月份的传感器数据移到按月分表（inventory_sensordata_YYYYMM），或把分表移回主表'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=3,
+                            help='主表保留最近几个月的数据（包括当前月），更早的整月移到分表')
+        parser.add_argument('--restore', action='store_true', help='把所有分表的数据移回主表并删除分表')
+        parser.add_argument('--list', action='store_true', help='只列出已有的分表和行数')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for table in router.shard_tables():
+                self.stdout.write(f'{table}: {shard_model(table).objects.count()} 行')
+            self.stdout.write(f'{SensorData._meta.db_table}: {SensorData.objects.count()} 行')
+            return
+
+        if options['restore']:
+            for table in router.shard_tables():
+                moved = router.restore_shard(table)
+                self.stdout.write(self.style.SUCCESS(f'{table}: {moved} 行已移回主表'))
+            return
+
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months 至少为1，当前月的数据必须保留在主表')
+
+        # 主表保留的第一个月
+        cutoff = month_start(timezone.now())
+        for _ in range(options['keep_months'] - 1):
+            cutoff = month_start(cutoff - timezone.timedelta(days=1))
+
+        oldest = SensorData.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None or oldest >= cutoff:
+            self.stdout.write('没有需要移动的数据')
+            return
+
+        month = month_start(oldest)
+        while month < cutoff:
+            end = next_month(month)
+            if SensorData.objects.filter(timestamp__gte=month, timestamp__lt=end).exists():
+                moved = router.archive_month(month)
+                self.stdout.write(self.style.SUCCESS(f"{month.strftime('%Y-%m')}: {moved} 行已移到分表"))
+            month = end
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0017_alter_inventoryoperation_operator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('sensor', '传感器数据'), ('environment', '环境数据')], max_length=16, verbose_name='数据来源')),
+                ('resolution', models.CharField(choices=[('hour', '小时'), ('day', '天')], max_length=8, verbose_name='汇总粒度')),
+                ('bucket_start', models.DateTimeField(help_text='按本地时区对齐的小时或天', verbose_name='区间起点')),
+                ('count', models.IntegerField(default=0, verbose_name='记录数')),
+                ('temperature_count', models.IntegerField(default=0, help_text='温度可以为空，单独计数', verbose_name='温度记录数')),
+                ('temperature_sum', models.FloatField(blank=True, null=True, verbose_name='温度合计')),
+                ('temperature_min', models.FloatField(blank=True, null=True, verbose_name='最低温度')),
+                ('temperature_max', models.FloatField(blank=True, null=True, verbose_name='最高温度')),
+                ('humidity_sum', models.FloatField(blank=True, null=True, verbose_name='湿度合计')),
+                ('humidity_min', models.FloatField(blank=True, null=True, verbose_name='最低湿度')),
+                ('humidity_max', models.FloatField(blank=True, null=True, verbose_name='最高湿度')),
+                ('light_sum', models.FloatField(blank=True, null=True, verbose_name='光照合计')),
+                ('light_min', models.FloatField(blank=True, null=True, verbose_name='最低光照')),
+                ('light_max', models.FloatField(blank=True, null=True, verbose_name='最高光照')),
+            ],
+            options={
+                'verbose_name': '传感器汇总',
+                'verbose_name_plural': '传感器汇总',
+                'ordering': ['source', 'resolution', 'bucket_start'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sensorrollup',
+            constraint=models.UniqueConstraint(fields=('source', 'resolution', 'bucket_start'), name='unique_sensor_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+# 迁移时的数据来源和汇总粒度，复制自当时的inventory.rollups；
+# 迁移只使用历史模型，之后修改rollups或模型不影响在新数据库上执行迁移
+SOURCES = {
+    'sensor': ('SensorData', 'timestamp', ('temperature', 'humidity', 'light')),
+    'environment': ('EnvironmentData', 'recorded_at', ('temperature', 'humidity')),
+}
+RESOLUTION_TRUNC = {'hour': TruncHour, 'day': TruncDay}
+
+
+def backfill(apps, schema_editor):
+    """按已有的传感器数据和环境数据生成小时/天汇总"""
+    SensorRollup = apps.get_model('inventory', 'SensorRollup')
+    for source, (model_name, time_field, metrics) in SOURCES.items():
+        raw_model = apps.get_model('inventory', model_name)
+        aggregates = {'count': Count('pk'), 'temperature_count': Count('temperature')}
+        for metric in metrics:
+            aggregates.update({
+                f'{metric}_sum': Sum(metric),
+                f'{metric}_min': Min(metric),
+                f'{metric}_max': Max(metric),
+            })
+        for resolution, trunc in RESOLUTION_TRUNC.items():
+            rows = (
+                raw_model.objects
+                .annotate(bucket=trunc(time_field, tzinfo=timezone.get_current_timezone()))
+                .values('bucket')
+                .annotate(**aggregates)
+                .order_by('bucket')
+            )
+            SensorRollup.objects.filter(source=source, resolution=resolution).delete()
+            SensorRollup.objects.bulk_create(
+                (SensorRollup(source=source, resolution=resolution, bucket_start=row.pop('bucket'), **row)
+                 for row in rows.iterator()),
+                batch_size=1000,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
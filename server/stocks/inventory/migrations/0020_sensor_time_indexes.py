@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_backfill_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='environmentdata',
+            index=models.Index(fields=['recorded_at', 'temperature', 'humidity'], name='envdata_recorded_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensordata',
+            index=models.Index(fields=['timestamp', 'temperature', 'humidity', 'light'], name='sensordata_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.2 on 2026-10-19 11:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_sensor_time_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorAlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='规则名称')),
+                ('source', models.CharField(choices=[('sensor', '传感器数据'), ('environment', '环境数据')], default='sensor', max_length=16, verbose_name='数据来源')),
+                ('metric', models.CharField(choices=[('temperature', '温度'), ('humidity', '湿度'), ('light', '光照')], max_length=16, verbose_name='指标')),
+                ('kind', models.CharField(choices=[('threshold', '超过阈值'), ('rate', '变化过快'), ('sustained', '持续超限')], default='threshold', max_length=16, verbose_name='规则类型')),
+                ('operator', models.CharField(choices=[('gt', '高于'), ('lt', '低于')], default='gt', help_text='变化过快规则：高于表示上升超过阈值，低于表示下降超过阈值', max_length=4, verbose_name='比较方式')),
+                ('value', models.FloatField(help_text='变化过快规则为时间窗口内允许的最大变化量', verbose_name='阈值')),
+                ('window_minutes', models.PositiveIntegerField(default=5, help_text='变化过快规则与窗口内最早的读数比较；持续超限规则要求超限持续的时间', verbose_name='时间窗口（分钟）')),
+                ('cooldown_minutes', models.PositiveIntegerField(default=10, help_text='同一规则两次警报的最短间隔', verbose_name='冷却时间（分钟）')),
+                ('enabled', models.BooleanField(default=True, verbose_name='启用')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '传感器警报规则',
+                'verbose_name_plural': '传感器警报规则',
+                'ordering': ['source', 'metric', 'id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='inventoryevent',
+            name='event_type',
+            field=models.CharField(choices=[('shortage', '库存短缺'), ('excess', '库存过剩'), ('expiry', '临近过期'), ('damaged', '物品损坏'), ('miscount', '盘点差异'), ('special_request', '特殊出库请求'), ('sensor_alert', '传感器警报'), ('other', '其他')], max_length=20, verbose_name='事件类型'),
+        ),
+        migrations.AlterField(
+            model_name='inventoryevent',
+            name='reported_by',
+            field=models.ForeignKey(blank=True, help_text='为空表示由系统生成（例如传感器警报）', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reported_events', to=settings.AUTH_USER_MODEL, verbose_name='报告人'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from users.models import User
 from django.utils import timezone
@@ -298,10 +298,24 @@ class EnvironmentData(models.Model):
         verbose_name = _('环境数据')
         verbose_name_plural = _('环境数据')
         ordering = ['-recorded_at']
+        indexes = [
+            # 按recorded_at范围查询、按时间排序；包含图表用到的列，查询只读索引不回表
+            models.Index(fields=['recorded_at', 'temperature', 'humidity'], name='envdata_recorded_at_idx'),
+        ]
 
     def __str__(self):
         return f"温度: {self.temperature}°C, 湿度: {self.humidity}% ({self.recorded_at.strftime('%Y-%m-%d %H:%M')})"
 
+    def save(self, *args, **kwargs):
+        # 原始数据和信号中维护的小时/天汇总、警报事件在同一个事务中写入：
+        # SQLite只提交一次，任何一步失败时整体回滚，汇总不会与原始数据不一致
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
 
 class InventoryEvent(models.Model):
     """
@@ -314,6 +328,7 @@ class InventoryEvent(models.Model):
         ('damaged', '物品损坏'),
         ('miscount', '盘点差异'),
         ('special_request', '特殊出库请求'),
+        ('sensor_alert', '传感器警报'),
         ('other', '其他'),
     )
     event_type = models.CharField(_('事件类型'), max_length=20, choices=EVENT_TYPES)
@@ -336,7 +351,10 @@ class InventoryEvent(models.Model):
         User,
         on_delete=models.CASCADE,
         verbose_name=_('报告人'),
-        related_name='reported_events'
+        related_name='reported_events',
+        help_text='为空表示由系统生成（例如传感器警报）',
+        null=True,
+        blank=True
     )
     handled_by = models.ForeignKey(
         User,
@@ -408,10 +426,115 @@ class SensorData(models.Model):
         verbose_name = _('传感器数据')
         verbose_name_plural = _('传感器数据')
         ordering = ['-timestamp']
+        indexes = [
+            # 按timestamp范围查询、取最新一条（倒序扫描）；包含图表用到的列，查询只读索引不回表
+            models.Index(fields=['timestamp', 'temperature', 'humidity', 'light'], name='sensordata_timestamp_idx'),
+        ]
 
     def __str__(self):
         return f"湿度: {self.humidity}%, 光照: {self.light} lux ({self.timestamp.strftime('%Y-%m-%d %H:%M')})"
 
+    def save(self, *args, **kwargs):
+        # 原始数据和信号中维护的小时/天汇总、警报事件在同一个事务中写入：
+        # SQLite只提交一次，任何一步失败时整体回滚，汇总不会与原始数据不一致
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+
+class SensorRollup(models.Model):
+    """
+    传感器数据和环境数据的小时/天汇总，由inventory.rollups在数据写入时增量维护，
+    图表接口按汇总读取，不再扫描原始数据。可以用 manage.py rebuild_rollups 重建。
+    """
+    SOURCE_CHOICES = (
+        ('sensor', '传感器数据'),
+        ('environment', '环境数据'),
+    )
+    RESOLUTION_CHOICES = (
+        ('hour', '小时'),
+        ('day', '天'),
+    )
+
+    source = models.CharField(_('数据来源'), max_length=16, choices=SOURCE_CHOICES)
+    resolution = models.CharField(_('汇总粒度'), max_length=8, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField(_('区间起点'), help_text='按本地时区对齐的小时或天')
+    count = models.IntegerField(_('记录数'), default=0)
+    temperature_count = models.IntegerField(_('温度记录数'), default=0, help_text='温度可以为空，单独计数')
+    temperature_sum = models.FloatField(_('温度合计'), null=True, blank=True)
+    temperature_min = models.FloatField(_('最低温度'), null=True, blank=True)
+    temperature_max = models.FloatField(_('最高温度'), null=True, blank=True)
+    humidity_sum = models.FloatField(_('湿度合计'), null=True, blank=True)
+    humidity_min = models.FloatField(_('最低湿度'), null=True, blank=True)
+    humidity_max = models.FloatField(_('最高湿度'), null=True, blank=True)
+    light_sum = models.FloatField(_('光照合计'), null=True, blank=True)
+    light_min = models.FloatField(_('最低光照'), null=True, blank=True)
+    light_max = models.FloatField(_('最高光照'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('传感器汇总')
+        verbose_name_plural = _('传感器汇总')
+        ordering = ['source', 'resolution', 'bucket_start']
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'resolution', 'bucket_start'], name='unique_sensor_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()} {self.get_resolution_display()} {self.bucket_start.strftime('%Y-%m-%d %H:%M')} ({self.count}条)"
+
+
+class SensorAlertRule(models.Model):
+    """
+    传感器警报规则，由inventory.alerts在数据写入时增量判断，触发时生成传感器警报事件并推送给SSE订阅者
+    """
+    SOURCE_CHOICES = (
+        ('sensor', '传感器数据'),
+        ('environment', '环境数据'),
+    )
+    METRIC_CHOICES = (
+        ('temperature', '温度'),
+        ('humidity', '湿度'),
+        ('light', '光照'),
+    )
+    KIND_CHOICES = (
+        ('threshold', '超过阈值'),
+        ('rate', '变化过快'),
+        ('sustained', '持续超限'),
+    )
+    OPERATOR_CHOICES = (
+        ('gt', '高于'),
+        ('lt', '低于'),
+    )
+
+    name = models.CharField(_('规则名称'), max_length=100)
+    source = models.CharField(_('数据来源'), max_length=16, choices=SOURCE_CHOICES, default='sensor')
+    metric = models.CharField(_('指标'), max_length=16, choices=METRIC_CHOICES)
+    kind = models.CharField(_('规则类型'), max_length=16, choices=KIND_CHOICES, default='threshold')
+    operator = models.CharField(
+        _('比较方式'), max_length=4, choices=OPERATOR_CHOICES, default='gt',
+        help_text='变化过快规则：高于表示上升超过阈值，低于表示下降超过阈值'
+    )
+    value = models.FloatField(_('阈值'), help_text='变化过快规则为时间窗口内允许的最大变化量')
+    window_minutes = models.PositiveIntegerField(
+        _('时间窗口（分钟）'), default=5,
+        help_text='变化过快规则与窗口内最早的读数比较；持续超限规则要求超限持续的时间'
+    )
+    cooldown_minutes = models.PositiveIntegerField(_('冷却时间（分钟）'), default=10, help_text='同一规则两次警报的最短间隔')
+    enabled = models.BooleanField(_('启用'), default=True)
+    created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('传感器警报规则')
+        verbose_name_plural = _('传感器警报规则')
+        ordering = ['source', 'metric', 'id']
+
+    def __str__(self):
+        return f"{self.name} ({self.get_source_display()} {self.get_metric_display()} {self.get_kind_display()})"
+
 
 class MaterialRequest(models.Model):
     """
@@ -0,0 +1,235 @@
+"""
+传感器最近数据的内存窗口
+
+仪表盘的大部分请求是最近24小时的图表（chart_data?hours=24）和latest。这里在进程内用NumPy数组
+保存最近 SENSOR_RECENT_WINDOW_HOURS 小时、最多 SENSOR_RECENT_CAPACITY 条读数（环形缓冲区），
+起点在窗口内的原始数据图表直接用内存中的数组聚合（charts.aggregate_sensor_arrays），不查询数据库；
+更早的时间范围仍然读取数据库。
+
+- 第一次使用时从数据库加载窗口内的数据（进程启动后的第一个请求）
+- 本进程写入的数据在事务提交后追加（signals.py、sensor_ingest.save_readings）
+- 其他进程写入的数据（多个worker、manage.py sensor_bridge）：读取前按主键补读新增的行，
+  每 SENSOR_RECENT_SYNC_INTERVAL 秒最多一次，走主键索引，通常返回0行
+- 写入早于窗口最新时间的数据（补传）时按时间合并到窗口中的对应位置，早于窗口起点的数据忽略
+- 修改、删除记录时清空窗口，下次使用时重新加载；
+  其他进程的修改和删除最迟在 RELOAD_INTERVAL 秒后随重新加载生效
+
+每列数组的长度是容量的两倍，每个值同时写入 i 和 i+容量 两个位置，
+所以最近的 size 条数据始终是连续的切片 [head, head+size)，读取时不需要拼接。
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .charts import from_microseconds, to_microseconds
+from .models import SensorData
+from .sensor_shards import router
+
+# 窗口中保存的数值列，温度、阈值为空时为NaN
+VALUE_FIELDS = ('temperature', 'humidity', 'light', 'threshold')
+LOAD_FIELDS = ('id', 'timestamp', 'created_at') + VALUE_FIELDS
+# 定期从数据库重新加载的间隔（秒），用于同步其他进程的修改和删除
+RELOAD_INTERVAL = 600
+
+
+class RecentWindow:
+    """最近一段时间的传感器数据（NumPy环形缓冲区），线程安全"""
+
+    def __init__(self, capacity=None, hours=None, sync_interval=None):
+        self.capacity = capacity or getattr(settings, 'SENSOR_RECENT_CAPACITY', 200000)
+        self.hours = hours or getattr(settings, 'SENSOR_RECENT_WINDOW_HOURS', 25)
+        self.sync_interval = (sync_interval if sync_interval is not None
+                              else getattr(settings, 'SENSOR_RECENT_SYNC_INTERVAL', 1.0))
+        size = self.capacity * 2
+        self._ids = np.zeros(size, dtype=np.int64)
+        self._timestamps = np.zeros(size, dtype=np.int64)
+        self._created = np.zeros(size, dtype=np.int64)
+        self._values = np.full((len(VALUE_FIELDS), size), np.nan)
+        self._lock = threading.Lock()
+        self._head = 0
+        self._size = 0
+        # 窗口覆盖的起始时间（微秒）：此后的数据全部在内存中；None表示尚未加载
+        self._since = None
+        self._max_id = 0
+        self._loaded_at = 0.0
+        self._synced_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'syncs': 0, 'appended': 0, 'merges': 0,
+                       'invalidations': 0}
+
+    # --------------- 读取 ---------------
+    def chart_arrays(self, start):
+        """
+        start之后的 (timestamps, temperature, humidity, light) 数组（时间为微秒数，按时间升序），
+        可直接传给 charts.aggregate_sensor_arrays；窗口不包含start之后的全部数据时返回None
+        """
+        start = to_microseconds(start)
+        with self._lock:
+            self._refresh()
+            if self._since is None or start < self._since:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            window = slice(self._head, self._head + self._size)
+            timestamps = self._timestamps[window]
+            first = int(np.searchsorted(timestamps, start, side='left'))
+            values = self._values[:3, window][:, first:]
+            return (timestamps[first:].copy(),) + tuple(column.copy() for column in values)
+
+    def latest(self):
+        """窗口中时间最新的一条（未保存到数据库的SensorData实例，只用于序列化）；窗口为空时返回None"""
+        with self._lock:
+            self._refresh()
+            if not self._size:
+                return None
+            i = self._head + self._size - 1
+            values = {
+                name: None if np.isnan(value) else float(value)
+                for name, value in zip(VALUE_FIELDS, self._values[:, i].tolist())
+            }
+            return SensorData(
+                id=int(self._ids[i]),
+                timestamp=from_microseconds(self._timestamps[i]),
+                created_at=from_microseconds(self._created[i]),
+                **values,
+            )
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                size=self._size,
+                capacity=self.capacity,
+                since=from_microseconds(self._since).isoformat() if self._since is not None else None,
+            )
+
+    # --------------- 写入 ---------------
+    def append(self, instances):
+        """追加本进程新写入的SensorData（事务提交后调用）；窗口尚未加载时忽略，加载时会从数据库读到"""
+        with self._lock:
+            if self._since is None:
+                return
+            self._append_rows([
+                (obj.pk, to_microseconds(obj.timestamp), to_microseconds(obj.created_at or obj.timestamp),
+                 *(getattr(obj, name) for name in VALUE_FIELDS))
+                for obj in instances
+            ])
+
+    def invalidate(self):
+        """清空窗口，下次使用时从数据库重新加载"""
+        with self._lock:
+            self._clear()
+            self._stats['invalidations'] += 1
+
+    def _clear(self):
+        self._head = 0
+        self._size = 0
+        self._since = None
+        self._max_id = 0
+
+    def _append_rows(self, rows):
+        """rows: (id, 时间微秒, 创建时间微秒, 各数值) 元组；主键不大于已见过的最大值的行已在窗口中，跳过"""
+        rows = sorted((row for row in rows if row[0] > self._max_id), key=lambda row: row[1])
+        if not rows:
+            return
+        self._max_id = max(row[0] for row in rows)
+        # 早于窗口起点的数据（补传的旧数据）与窗口无关
+        rows = [row for row in rows if row[1] >= self._since]
+        if not rows:
+            return
+        if self._size and rows[0][1] < self._timestamps[self._head + self._size - 1]:
+            # 补传的数据早于窗口中最新的数据，按时间合并到窗口中
+            self._merge_rows(rows)
+            return
+
+        rows = rows[-self.capacity:]
+        count = len(rows)
+        ids, timestamps, created, *values = zip(*rows)
+        positions = (self._head + self._size + np.arange(count)) % self.capacity
+        for target in (positions, positions + self.capacity):
+            self._ids[target] = ids
+            self._timestamps[target] = timestamps
+            self._created[target] = created
+            self._values[:, target] = np.array(values, dtype=np.float64)
+        self._size += count
+        if self._size > self.capacity:
+            # 超出容量，最旧的数据被覆盖，窗口起点后移
+            self._head = (self._head + self._size - self.capacity) % self.capacity
+            self._size = self.capacity
+            self._since = max(self._since, int(self._timestamps[self._head]) + 1)
+        self._stats['appended'] += count
+
+    def _merge_rows(self, rows):
+        """把按时间排序的rows合并到窗口中，重写整个缓冲区（补传的数据很少，复制一次窗口的代价可以接受）"""
+        ids, timestamps, created, *values = zip(*rows)
+        window = slice(self._head, self._head + self._size)
+        merged_timestamps = np.concatenate([self._timestamps[window], np.array(timestamps, dtype=np.int64)])
+        # 稳定排序：时间相同的数据保持窗口中已有的在前
+        order = np.argsort(merged_timestamps, kind='stable')[-self.capacity:]
+        merged = (
+            np.concatenate([self._ids[window], np.array(ids, dtype=np.int64)])[order],
+            merged_timestamps[order],
+            np.concatenate([self._created[window], np.array(created, dtype=np.int64)])[order],
+            np.concatenate([self._values[:, window], np.array(values, dtype=np.float64)], axis=1)[:, order],
+        )
+        dropped = len(merged_timestamps) - len(order)
+        size = len(order)
+        for start in (0, self.capacity):
+            target = slice(start, start + size)
+            self._ids[target], self._timestamps[target], self._created[target] = merged[:3]
+            self._values[:, target] = merged[3]
+        self._head = 0
+        self._size = size
+        if dropped:
+            # 超出容量，只保留最新的数据
+            self._since = max(self._since, int(self._timestamps[0]) + 1)
+        self._stats['appended'] += len(rows)
+        self._stats['merges'] += 1
+
+    # --------------- 与数据库同步 ---------------
+    def _refresh(self):
+        now = time.monotonic()
+        if self._since is None or now - self._loaded_at >= RELOAD_INTERVAL:
+            self._load()
+        elif now - self._synced_at >= self.sync_interval:
+            self._sync()
+
+    def _load(self):
+        self._clear()
+        # 先记下最大主键，加载期间新写入的行留给下一次补读，避免重复
+        max_id = SensorData.objects.aggregate(m=Max('id'))['m'] or 0
+        start = timezone.now() - timezone.timedelta(hours=self.hours)
+        rows = deque(maxlen=self.capacity)
+        for row in router.values_list(LOAD_FIELDS, start=start):
+            if row[0] <= max_id:
+                rows.append(row)
+        truncated = len(rows) == self.capacity
+        self._since = to_microseconds(start)
+        self._append_rows(self._convert(rows))
+        if truncated and self._size:
+            # 超过容量时只保留最新的数据，窗口从保留的第一条之后开始
+            self._since = int(self._timestamps[self._head]) + 1
+        self._max_id = max(self._max_id, max_id)
+        self._loaded_at = self._synced_at = time.monotonic()
+        self._stats['loads'] += 1
+
+    def _sync(self):
+        rows = SensorData.objects.filter(id__gt=self._max_id).order_by('id').values_list(*LOAD_FIELDS)
+        self._append_rows(self._convert(rows))
+        self._synced_at = time.monotonic()
+        self._stats['syncs'] += 1
+
+    @staticmethod
+    def _convert(rows):
+        return [
+            (pk, to_microseconds(timestamp), to_microseconds(created_at), *values)
+            for pk, timestamp, created_at, *values in rows
+        ]
+
+
+# 进程内共享的最近数据窗口
+recent_window = RecentWindow()
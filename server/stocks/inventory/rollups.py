@@ -0,0 +1,232 @@
+"""
+传感器数据的小时/天汇总（SensorRollup）维护
+
+- record(source, instances): 新数据写入时按小时、天累加到汇总行（每个区间一条UPDATE，没有时插入）
+- refresh(source, timestamps): 修改或删除原始数据后，按原始数据重新计算受影响的区间
+- rebuild(source, since): 重建全部或某个时间之后的汇总（manage.py rebuild_rollups 使用）
+
+区间按本地时区（settings.TIME_ZONE）对齐，与 TruncHour / TruncDay 的结果一致。
+单条写入（add_data、管理后台等）由 SensorData / EnvironmentData.save() 把原始数据和汇总放在同一个事务中，
+每条读数多两条汇总行的UPDATE，但SQLite仍只提交一次；大量写入请使用批量接口（sensor_ingest）。
+bulk_create、原生SQL写入的数据不会触发信号，写入后需要调用 record() 或重建汇总。
+传感器数据按月分表（sensor_shards）后，重算时同时读取主表和相关的分表。
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDay, TruncHour
+from django.utils import timezone
+
+# 汇总粒度 -> 区间长度（分钟）
+RESOLUTION_MINUTES = {'hour': 60, 'day': 1440}
+RESOLUTION_TRUNC = {'hour': TruncHour, 'day': TruncDay}
+
+# 数据来源 -> (模型名, 时间字段, 指标字段)
+SOURCES = {
+    'sensor': ('SensorData', 'timestamp', ('temperature', 'humidity', 'light')),
+    'environment': ('EnvironmentData', 'recorded_at', ('temperature', 'humidity')),
+}
+METRICS = ('temperature', 'humidity', 'light')
+
+
+def _models(source):
+    """返回 (原始数据模型, 汇总模型)"""
+    from django.apps import apps
+    model_name, _, _ = SOURCES[source]
+    return apps.get_model('inventory', model_name), apps.get_model('inventory', 'SensorRollup')
+
+
+def bucket_start(timestamp, resolution):
+    local = timezone.localtime(timestamp)
+    if resolution == 'day':
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def coarsest_resolution(interval_minutes):
+    """能整除图表间隔的最粗汇总粒度，没有时返回None（读取原始数据）"""
+    for resolution in ('day', 'hour'):
+        if interval_minutes % RESOLUTION_MINUTES[resolution] == 0:
+            return resolution
+    return None
+
+
+# --------------- 增量累加 ---------------
+def _empty_bucket():
+    bucket = {'count': 0}
+    for metric in METRICS:
+        bucket.update({f'{metric}_count': 0, f'{metric}_sum': 0.0, f'{metric}_min': None, f'{metric}_max': None})
+    return bucket
+
+
+def _accumulate(bucket, values):
+    bucket['count'] += 1
+    for metric, value in values.items():
+        if value is None:
+            continue
+        bucket[f'{metric}_count'] += 1
+        bucket[f'{metric}_sum'] += value
+        if bucket[f'{metric}_min'] is None or value < bucket[f'{metric}_min']:
+            bucket[f'{metric}_min'] = value
+        if bucket[f'{metric}_max'] is None or value > bucket[f'{metric}_max']:
+            bucket[f'{metric}_max'] = value
+
+
+def record(source, instances):
+    """把新写入的原始数据累加到所属的小时、天汇总，调用方负责事务"""
+    _, time_field, metrics = SOURCES[source]
+    _, rollup_model = _models(source)
+    buckets = defaultdict(_empty_bucket)
+    for instance in instances:
+        timestamp = getattr(instance, time_field)
+        values = {metric: getattr(instance, metric) for metric in metrics}
+        for resolution in RESOLUTION_MINUTES:
+            _accumulate(buckets[(resolution, bucket_start(timestamp, resolution))], values)
+
+    for (resolution, start), bucket in buckets.items():
+        _upsert(rollup_model, source, resolution, start, bucket)
+
+
+def _increment_fields(bucket):
+    fields = {'count': F('count') + bucket['count']}
+    for metric in METRICS:
+        if not bucket[f'{metric}_count']:
+            continue
+        low = Value(bucket[f'{metric}_min'], output_field=FloatField())
+        high = Value(bucket[f'{metric}_max'], output_field=FloatField())
+        if metric == 'temperature':
+            fields['temperature_count'] = F('temperature_count') + bucket['temperature_count']
+        fields[f'{metric}_sum'] = Coalesce(F(f'{metric}_sum'), Value(0.0)) + bucket[f'{metric}_sum']
+        # 汇总行中该指标为空时，Least/Greatest在部分数据库上会返回NULL，先用新值填充
+        fields[f'{metric}_min'] = Least(Coalesce(F(f'{metric}_min'), low), low)
+        fields[f'{metric}_max'] = Greatest(Coalesce(F(f'{metric}_max'), high), high)
+    return fields
+
+
+def _new_row_fields(bucket):
+    fields = {'count': bucket['count'], 'temperature_count': bucket['temperature_count']}
+    for metric in METRICS:
+        if bucket[f'{metric}_count']:
+            fields.update({
+                f'{metric}_sum': bucket[f'{metric}_sum'],
+                f'{metric}_min': bucket[f'{metric}_min'],
+                f'{metric}_max': bucket[f'{metric}_max'],
+            })
+    return fields
+
+
+def _upsert(rollup_model, source, resolution, start, bucket):
+    rows = rollup_model.objects.filter(source=source, resolution=resolution, bucket_start=start)
+    if rows.update(**_increment_fields(bucket)):
+        return
+    try:
+        with transaction.atomic():
+            rollup_model.objects.create(source=source, resolution=resolution, bucket_start=start,
+                                        **_new_row_fields(bucket))
+    except IntegrityError:
+        # 并发写入时另一个请求先插入了该区间
+        rows.update(**_increment_fields(bucket))
+
+
+# --------------- 按原始数据重算 ---------------
+def _aggregate(source, resolution, raw_queryset):
+    """按区间聚合原始数据，返回汇总模型的字段字典列表"""
+    _, time_field, metrics = SOURCES[source]
+    aggregates = {'count': Count('pk'), 'temperature_count': Count('temperature')}
+    for metric in metrics:
+        aggregates.update({
+            f'{metric}_sum': Sum(metric),
+            f'{metric}_min': Min(metric),
+            f'{metric}_max': Max(metric),
+        })
+    rows = (
+        raw_queryset
+        .annotate(bucket=RESOLUTION_TRUNC[resolution](time_field, tzinfo=timezone.get_current_timezone()))
+        .values('bucket')
+        .annotate(**aggregates)
+        .order_by('bucket')
+    )
+    result = []
+    for row in rows:
+        row['bucket_start'] = row.pop('bucket')
+        result.append(row)
+    return result
+
+
+def _merge(total, row):
+    """把同一区间在另一张表上的聚合结果合并到total"""
+    for key, value in row.items():
+        if key == 'bucket_start' or value is None:
+            continue
+        current = total.get(key)
+        if current is None:
+            total[key] = value
+        elif key.endswith('_min'):
+            total[key] = min(current, value)
+        elif key.endswith('_max'):
+            total[key] = max(current, value)
+        else:
+            total[key] = current + value
+
+
+def _aggregate_tables(source, resolution, querysets):
+    """按区间聚合多张表（主表和月分表）的原始数据，同一区间的结果合并"""
+    if len(querysets) == 1:
+        return _aggregate(source, resolution, querysets[0])
+    merged = {}
+    for queryset in querysets:
+        for row in _aggregate(source, resolution, queryset):
+            if row['bucket_start'] in merged:
+                _merge(merged[row['bucket_start']], row)
+            else:
+                merged[row['bucket_start']] = row
+    return [merged[start] for start in sorted(merged)]
+
+
+def _raw_querysets(source, start=None, end=None):
+    """[start, end) 内原始数据的QuerySet列表；传感器数据按月分表后包括相关的分表（见sensor_shards）"""
+    if source == 'sensor':
+        from .sensor_shards import router
+        return router.querysets(start, end)
+    raw_model, _ = _models(source)
+    _, time_field, _ = SOURCES[source]
+    raw = raw_model.objects.all()
+    if start is not None:
+        raw = raw.filter(**{f'{time_field}__gte': start})
+    if end is not None:
+        raw = raw.filter(**{f'{time_field}__lt': end})
+    return [raw]
+
+
+def refresh(source, timestamps):
+    """重新计算包含这些时间的小时、天汇总（修改或删除原始数据后调用）"""
+    _, rollup_model = _models(source)
+    for resolution, minutes in RESOLUTION_MINUTES.items():
+        for start in {bucket_start(ts, resolution) for ts in timestamps if ts is not None}:
+            end = start + timedelta(minutes=minutes)
+            rows = _aggregate_tables(source, resolution, _raw_querysets(source, start, end))
+            rollup_model.objects.filter(source=source, resolution=resolution, bucket_start=start).delete()
+            rollup_model.objects.bulk_create(
+                rollup_model(source=source, resolution=resolution, **row) for row in rows
+            )
+
+
+def rebuild(source, since=None):
+    """删除并重建汇总；since不为空时只重建该时间所在区间及之后的汇总。返回写入的汇总行数"""
+    _, rollup_model = _models(source)
+    written = 0
+    with transaction.atomic():
+        for resolution in RESOLUTION_MINUTES:
+            start = bucket_start(since, resolution) if since is not None else None
+            rollups = rollup_model.objects.filter(source=source, resolution=resolution)
+            if start is not None:
+                rollups = rollups.filter(bucket_start__gte=start)
+            rows = _aggregate_tables(source, resolution, _raw_querysets(source, start))
+            rollups.delete()
+            rollup_model.objects.bulk_create(
+                (rollup_model(source=source, resolution=resolution, **row) for row in rows), batch_size=1000
+            )
+            written += len(rows)
+    return written
@@ -0,0 +1,365 @@
+"""
+WebSocket传感器数据直连入库
+
+原来的链路是 WebSocket服务器 → websocket_client.py → HTTP POST → DRF视图 → ORM，
+每条数据要经过三次序列化和一次HTTP请求。这里在Django进程内用asyncio直接消费WebSocket数据：
+
+- 事件循环线程只负责接收和解析消息（sensor_ingest.parse_reading），解析结果放入有界队列
+- 独立的写入线程(SensorDataWriter)凑批后调用 sensor_ingest.save_readings，一次 bulk_create 写入
+  inventory_sensordata，并维护小时/天汇总、最新值缓存；数据库不可用时批次暂存到本地文件，恢复后按顺序补发
+- 连接失败或断开后按指数退避重连（1秒起，每次加倍，最长30秒，带随机抖动），
+  连接稳定保持一段时间后退避时间恢复为初始值
+
+由 manage.py sensor_bridge 启动，与websocket_client.py二选一运行。
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from django.db import DataError, IntegrityError, close_old_connections
+
+from . import sensor_ingest, ws_codec
+
+logger = logging.getLogger(__name__)
+
+SPOOL_DIR = 'sensor_bridge_spool'  # 数据库不可用时数据暂存的目录
+MAX_SPOOL_FILES = 10000  # 暂存批次上限，超过时丢弃最旧的批次
+RETRY_INTERVAL = 1  # 写入失败后首次重试的间隔（秒），之后逐次加倍
+MAX_RETRY_INTERVAL = 60
+
+
+def _isoformat(value):
+    # 暂存文件中的时间戳保留微秒（DjangoJSONEncoder只保留到毫秒）
+    return value.isoformat()
+
+
+class SensorDataWriter:
+    """
+    SensorData批量写入器：凑满batch_size条或等待flush_interval秒后由写入线程一次写入
+
+    - 缓冲区是有界的deque，满时丢弃最旧的数据（保留最新数据），入队不访问数据库、不阻塞事件循环
+    - 数据库暂时不可用（OperationalError等）时，批次按顺序写入spool_dir下的文件，按退避间隔重试；
+      恢复后先按顺序补发暂存的批次，再写入新数据（与websocket_client.SensorForwarder相同）
+    - 数据本身有问题（IntegrityError / DataError）时重试也不会成功，记录日志后丢弃
+    """
+
+    def __init__(self, batch_size=500, flush_interval=0.2, queue_size=10000, on_batch=None,
+                 spool_dir=SPOOL_DIR):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.spool_dir = spool_dir
+        # 写入成功后以 [(字段字典, 接收时间perf_counter)] 调用，运行在写入线程中（补发的暂存批次除外）
+        self.on_batch = on_batch
+        self._buffer = deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._retry_at = 0.0
+        self._retry_interval = RETRY_INTERVAL
+        self._spool_seq = 0
+        self._stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'written': 0,
+            'rejected': 0,
+            'spooled': 0,
+            'lost': 0,
+            'replayed': 0,
+            'flushes': 0,
+            'flush_ms_max': 0.0,
+            'flush_ms_total': 0.0,
+            'latency_ms_max': 0.0,
+            'latency_ms_total': 0.0,
+            'queue_high_water': 0,
+        }
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    # --------------- 生命周期 ---------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        pending = len(self._spool_files())
+        if pending:
+            logger.info(f"发现{pending}个暂存批次，数据库可用后补发")
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='sensor-data-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"传感器数据写入线程已启动 (batch={self.batch_size}, interval={self.flush_interval}s, "
+                    f"queue={self.queue_size}, spool={self.spool_dir})")
+
+    def stop(self, timeout=10.0):
+        """停止写入线程，缓冲区中剩余的数据写入数据库（数据库不可用时写入暂存）"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --------------- 入队（事件循环线程） ---------------
+    def submit(self, fields, received=None):
+        """放入缓冲区，不访问数据库；缓冲区满时丢弃最旧的一条"""
+        item = (fields, received if received is not None else time.perf_counter())
+        with self._cond:
+            if len(self._buffer) == self.queue_size:
+                self._stats['dropped'] += 1
+            self._buffer.append(item)
+            self._stats['enqueued'] += 1
+            self._stats['queue_high_water'] = max(self._stats['queue_high_water'], len(self._buffer))
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    # --------------- 写入线程 ---------------
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                stopping = self._stopping and not self._buffer
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                logger.error(f"写入传感器数据时发生未知错误: {e}")
+                if batch:
+                    self._spool_or_drop([fields for fields, _ in batch])
+            if stopping:
+                break
+        close_old_connections()
+
+    def _deliver(self, batch):
+        # 有暂存数据时先补发，保证数据按接收顺序写入；补发未完成时新批次也进入暂存
+        if self._spool_files() and not self._replay():
+            if batch:
+                self._spool_or_drop([fields for fields, _ in batch])
+            return
+        if not batch:
+            return
+        start = time.perf_counter()
+        if not self._write([fields for fields, _ in batch]):
+            self._spool_or_drop([fields for fields, _ in batch])
+            return
+
+        done = time.perf_counter()
+        elapsed_ms = (done - start) * 1000
+        latencies = [(done - received) * 1000 for _, received in batch]
+        with self._cond:
+            self._stats['written'] += len(batch)
+            self._stats['flushes'] += 1
+            self._stats['flush_ms_total'] += elapsed_ms
+            self._stats['flush_ms_max'] = max(self._stats['flush_ms_max'], elapsed_ms)
+            self._stats['latency_ms_total'] += sum(latencies)
+            self._stats['latency_ms_max'] = max(self._stats['latency_ms_max'], max(latencies))
+
+        if self.on_batch is not None:
+            try:
+                self.on_batch(batch)
+            except Exception as e:
+                logger.error(f"处理已写入的传感器数据时出错: {e}")
+
+    def _write(self, readings):
+        """写入一个批次；返回False表示数据库暂时不可用，需要暂存后重试"""
+        try:
+            close_old_connections()
+            sensor_ingest.save_readings(readings)
+        except (IntegrityError, DataError) as e:
+            with self._cond:
+                self._stats['rejected'] += len(readings)
+            logger.error(f"传感器数据不能写入，丢弃{len(readings)}条: {e}")
+            return True
+        except Exception as e:
+            logger.error(f"批量写入传感器数据失败（{len(readings)}条），{self._retry_interval}秒后重试: {e}")
+            self._retry_at = time.monotonic() + self._retry_interval
+            self._retry_interval = min(self._retry_interval * 2, MAX_RETRY_INTERVAL)
+            return False
+        self._retry_interval = RETRY_INTERVAL
+        return True
+
+    # --------------- 本地暂存 ---------------
+    def _spool_or_drop(self, readings):
+        """暂存失败（磁盘已满、目录没有权限等）时记录日志并丢弃，写入线程继续运行"""
+        try:
+            self._spool(readings)
+        except Exception as e:
+            with self._cond:
+                self._stats['lost'] += len(readings)
+            logger.exception(f"暂存传感器数据失败，丢弃{len(readings)}条: {e}")
+
+    def _spool_files(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+
+    def _spool(self, readings):
+        files = self._spool_files()
+        for name in files[:max(0, len(files) - MAX_SPOOL_FILES + 1)]:
+            logger.warning(f"暂存批次超过{MAX_SPOOL_FILES}个，丢弃最旧的批次: {name}")
+            os.remove(os.path.join(self.spool_dir, name))
+        # 文件名按写入顺序排序；先写临时文件再改名，进程中断时不会留下不完整的批次
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._spool_seq += 1
+        name = f"{time.time_ns():020d}-{self._spool_seq:06d}.json"
+        path = os.path.join(self.spool_dir, name)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(readings, f, default=_isoformat, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        with self._cond:
+            self._stats['spooled'] += len(readings)
+        logger.warning(f"数据库不可用，{len(readings)}条数据已暂存: {name}")
+
+    def _replay(self):
+        """按顺序补发暂存的批次，全部补发成功时返回True"""
+        if time.monotonic() < self._retry_at:
+            return False
+        for name in self._spool_files():
+            path = os.path.join(self.spool_dir, name)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    # 时间戳以ISO字符串保存，重新按写入接口的规则解析
+                    readings = [sensor_ingest.parse_reading(item)[0] for item in json.load(f)]
+            except (ValueError, TypeError) as e:
+                # 文件损坏时改名跳过，不阻塞后面的批次
+                logger.error(f"暂存批次无法读取，已改名为{name}.bad: {e}")
+                os.replace(path, path + '.bad')
+                continue
+            readings = [fields for fields in readings if fields is not None]
+            if not self._write(readings):
+                return False
+            os.remove(path)
+            with self._cond:
+                self._stats['replayed'] += len(readings)
+            logger.info(f"暂存批次补发完成: {name}, {len(readings)}条")
+        return True
+
+    # --------------- 指标 ---------------
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['queue_depth'] = len(self._buffer)
+        flush_total = stats.pop('flush_ms_total')
+        latency_total = stats.pop('latency_ms_total')
+        try:
+            stats['spool_pending'] = len(self._spool_files())
+        except OSError:
+            stats['spool_pending'] = None
+        stats['flush_ms_avg'] = round(flush_total / stats['flushes'], 2) if stats['flushes'] else 0.0
+        stats['latency_ms_avg'] = round(latency_total / stats['written'], 2) if stats['written'] else 0.0
+        stats['flush_ms_max'] = round(stats['flush_ms_max'], 2)
+        stats['latency_ms_max'] = round(stats['latency_ms_max'], 2)
+        return stats
+
+
+class SensorBridge:
+    """消费WebSocket传感器数据并交给写入线程，断开后按指数退避重连"""
+
+    def __init__(self, url, writer, min_backoff=1.0, max_backoff=30.0, stable_after=30.0):
+        self.url = url
+        self.writer = writer
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        # 连接保持超过这么多秒才认为恢复正常，退避时间重置为min_backoff
+        self.stable_after = stable_after
+        self._stopping = None
+        self._connection = None
+        self._stats = {
+            'connects': 0,
+            'connect_failures': 0,
+            'disconnects': 0,
+            'received': 0,
+            'accepted': 0,
+            'ignored': 0,
+            'rejected': 0,
+        }
+
+    def stats(self):
+        return dict(self._stats)
+
+    def stop(self):
+        """请求停止（在事件循环线程中调用）：关闭当前连接，run() 随后返回"""
+        if self._stopping is not None:
+            self._stopping.set()
+        if self._connection is not None:
+            self._connection.writer.close()
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        backoff = self.min_backoff
+        while not self._stopping.is_set():
+            connected_at = None
+            try:
+                self._connection = await ws_codec.connect(self.url)
+            except (OSError, asyncio.TimeoutError, ws_codec.WebSocketError) as e:
+                self._stats['connect_failures'] += 1
+                logger.warning(f"连接WebSocket服务器失败: {self.url}, {e}")
+            else:
+                if self._stopping.is_set():
+                    # 连接过程中收到了停止请求，stop()当时没有可关闭的连接
+                    await self._connection.close()
+                    self._connection = None
+                    break
+                connected_at = loop.time()
+                self._stats['connects'] += 1
+                logger.info(f"已连接WebSocket服务器: {self.url}")
+                try:
+                    await self._consume(self._connection)
+                except (ConnectionError, asyncio.IncompleteReadError, ws_codec.WebSocketError) as e:
+                    logger.warning(f"WebSocket连接异常: {e}")
+                finally:
+                    await self._connection.close()
+                    self._connection = None
+                self._stats['disconnects'] += 1
+
+            if self._stopping.is_set():
+                break
+            if connected_at is not None and loop.time() - connected_at >= self.stable_after:
+                backoff = self.min_backoff
+            # 加入±20%的随机抖动，避免多个实例同时重连
+            delay = backoff * random.uniform(0.8, 1.2)
+            logger.info(f"WebSocket连接已断开，{delay:.1f}秒后尝试重新连接...")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _consume(self, connection):
+        while True:
+            message = await connection.recv()
+            if message is None:
+                return
+            self.handle_message(message)
+
+    def handle_message(self, message, received=None):
+        """解析一条WebSocket消息，合法的传感器数据放入写入队列"""
+        received = received if received is not None else time.perf_counter()
+        self._stats['received'] += 1
+        try:
+            data = json.loads(message)
+        except ValueError:
+            self._stats['rejected'] += 1
+            logger.error(f"解析JSON失败: {message!r}")
+            return
+        # 与websocket_client.py相同，只处理type为emit的传感器数据
+        if not isinstance(data, dict) or data.get('type') != 'emit':
+            self._stats['ignored'] += 1
+            return
+        fields, errors = sensor_ingest.parse_reading(data)
+        if errors:
+            self._stats['rejected'] += 1
+            logger.warning(f"收到的数据格式不符合预期: {data}, {errors}")
+            return
+        self._stats['accepted'] += 1
+        self.writer.submit(fields, received)
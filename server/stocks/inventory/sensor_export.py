@@ -0,0 +1,192 @@
+"""
+传感器历史数据导出（SensorDataViewSet.export）
+
+按时间顺序从数据库逐块读取（values_list + iterator，经 sensor_shards 同时读取月分表），
+边读边写入响应，不经过序列化器，也不把结果整体放进内存：
+
+- csv      每 CSV_BATCH_ROWS 行输出一次
+- parquet  每 ROW_GROUP_ROWS 行写一个行组后输出（需要安装pyarrow）
+
+导出的行数不影响内存占用，只占用一个分块和一个行组的大小。
+ASGI部署时用异步迭代逐块读取（同live_hub），避免Django把同步迭代器一次读完。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.renderers import BaseRenderer
+
+from .sensor_shards import router
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# 可导出的列，timestamp总是包含在内
+EXPORT_FIELDS = ('id', 'timestamp', 'temperature', 'humidity', 'light', 'threshold')
+CSV_BATCH_ROWS = 2000
+ROW_GROUP_ROWS = 65536
+
+
+class _ExportRenderer(BaseRenderer):
+    """导出数据不经过渲染器，只用于内容协商（?format=csv / Accept头）；错误信息由视图改用JSONRenderer返回"""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ParquetRenderer(_ExportRenderer):
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+
+def parquet_available():
+    return pq is not None
+
+
+def parse_time(value):
+    """ISO 8601日期时间或日期 -> 带时区的datetime；不带时区时按本地时区解释。格式错误时抛出ValueError"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_fields(value):
+    """?fields=temperature,humidity -> 导出的列（按EXPORT_FIELDS的顺序）；包含未知的列时抛出ValueError"""
+    if not value:
+        return EXPORT_FIELDS
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(EXPORT_FIELDS)
+    if unknown:
+        raise ValueError(', '.join(sorted(unknown)))
+    requested.add('timestamp')
+    return tuple(name for name in EXPORT_FIELDS if name in requested)
+
+
+def export_rows(fields, start=None, end=None):
+    """[start, end) 内各行的fields值，按时间升序逐块读取"""
+    return router.values_list(fields, start, end)
+
+
+def csv_stream(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    position = fields.index('timestamp')
+    count = 0
+    for row in rows:
+        row = list(row)
+        row[position] = timezone.localtime(row[position]).isoformat()
+        writer.writerow(row)
+        count += 1
+        if count % CSV_BATCH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _Drain:
+    """ParquetWriter的输出目标：写入的数据暂存，每个行组写完后取出发送"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_schema(fields):
+    types = {
+        'id': pa.int64(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([(name, types.get(name, pa.float64())) for name in fields])
+
+
+def parquet_stream(fields, rows):
+    schema = parquet_schema(fields)
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        columns = [[] for _ in fields]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if len(columns[0]) >= ROW_GROUP_ROWS:
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                columns = [[] for _ in fields]
+                yield sink.take()
+        if columns[0]:
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+async def _async_stream(iterator):
+    # 在同一个线程中逐块读取（数据库连接属于该线程），每次只取一块
+    end = object()
+    while True:
+        part = await sync_to_async(next)(iterator, end)
+        if part is end:
+            return
+        yield part
+
+
+def export_response(request, output, fields, start=None, end=None):
+    """返回导出文件的流式响应；output为csv或parquet"""
+    rows = export_rows(fields, start, end)
+    if output == 'parquet':
+        content, content_type = parquet_stream(fields, rows), ParquetRenderer.media_type
+    else:
+        content, content_type = csv_stream(fields, rows), f'{CSVRenderer.media_type}; charset=utf-8'
+
+    django_request = getattr(request, '_request', request)
+    if isinstance(django_request, ASGIRequest):
+        content = _async_stream(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    period = '_'.join(timezone.localtime(value).strftime('%Y%m%d%H%M') for value in (start, end) if value is not None)
+    filename = f"sensor_data{'_' + period if period else ''}.{output}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
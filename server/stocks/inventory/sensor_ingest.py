@@ -0,0 +1,112 @@
+"""
+传感器数据批量写入（SensorDataViewSet.add_data_bulk）
+
+逐条走DRF序列化器时，每条数据都要构造字段、运行验证器，再单独INSERT并触发信号。
+批量接口只做轻量校验：数值字段转换为float，时间戳用parse_datetime解析，
+合法的记录一次 bulk_create 写入，非法的记录按下标返回错误，不影响同批的其他数据。
+
+bulk_create不会触发post_save信号，所以写入后由 save_readings 自己完成信号里的工作：
+累加小时/天汇总、按警报规则判断、追加到最近数据窗口、更新最新值缓存并推送给SSE订阅者。
+"""
+import math
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import rollups
+from .alerts import engine as alert_engine
+from .latest_cache import latest_cache
+from .live_hub import hub
+from .recent_window import recent_window
+from .models import SensorData
+
+# 单次请求允许的最大记录数
+MAX_BATCH_SIZE = 5000
+
+# 字段名 -> 是否必填
+NUMBER_FIELDS = (
+    ('temperature', False),
+    ('humidity', True),
+    ('light', True),
+    ('threshold', False),
+)
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+
+def parse_reading(item):
+    """
+    校验一条数据，返回 (字段字典, 错误字典)，两者有且只有一个不为None。
+    type可以省略，提供时必须为emit；timestamp省略时使用当前时间，不带时区时按本地时区解释。
+    """
+    if not isinstance(item, dict):
+        return None, {'non_field_errors': ['数据格式错误，应为对象']}
+
+    errors = {}
+    if item.get('type', 'emit') != 'emit':
+        errors['type'] = ['不支持的数据类型']
+
+    fields = {}
+    for name, required in NUMBER_FIELDS:
+        value = item.get(name)
+        if value is None or value == '':
+            if required:
+                errors[name] = ['该字段是必填项。']
+            fields[name] = None
+            continue
+        try:
+            fields[name] = _to_float(value)
+        except (TypeError, ValueError):
+            errors[name] = ['请填写合法的数字。']
+
+    timestamp = item.get('timestamp')
+    if timestamp in (None, ''):
+        fields['timestamp'] = timezone.now()
+    else:
+        try:
+            parsed = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            errors['timestamp'] = ['日期时间格式错误。']
+        else:
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            fields['timestamp'] = parsed
+
+    if errors:
+        return None, errors
+    return fields, None
+
+
+def save_readings(readings):
+    """
+    批量写入已校验的数据，返回创建的SensorData列表。
+    汇总和警报事件在同一事务中写入；最新值缓存和SSE推送在事务提交后进行，只推送本批中时间最新的一条。
+    """
+    from .serializers import SensorDataSerializer
+
+    objs = [SensorData(**fields) for fields in readings]
+    if not objs:
+        return objs
+    with transaction.atomic():
+        objs = SensorData.objects.bulk_create(objs)
+        rollups.record('sensor', objs)
+        alert_engine.process('sensor', objs)
+        newest = max(objs, key=lambda obj: obj.timestamp)
+        data = SensorDataSerializer(newest).data
+
+        def commit():
+            recent_window.append(objs)
+            if latest_cache.update('sensor', newest.timestamp, data):
+                hub.publish('sensor', data)
+        transaction.on_commit(commit)
+    return objs
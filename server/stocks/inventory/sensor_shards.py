@@ -0,0 +1,216 @@
+"""
+SensorData按月分表（可选）
+
+单表达到千万行后，可以用 manage.py shard_sensor_data 把较早月份的数据从 inventory_sensordata
+移到按月的分表 inventory_sensordata_YYYYMM，主表只保留最近几个月的数据。
+分表与主表字段、索引相同，月份按本地时区（settings.TIME_ZONE）划分。
+
+SensorShardRouter 按时间范围只查询与范围有重叠的分表和主表，再按时间顺序合并结果；
+没有分表时只查询主表，与直接使用 SensorData.objects 相同。
+
+移动数据不经过ORM、不触发信号，已有的小时/天汇总(SensorRollup)保持不变；
+rollups重算汇总时通过 querysets() 同时读取主表和分表。
+
+经过路由读取分表的只有按时间范围的接口（图表、导出、最近数据窗口、汇总重算）；
+SensorDataViewSet 的 list / retrieve / update / destroy 仍然只操作主表，已移到分表的记录查不到、
+也不能修改或删除，需要时先用 shard_sensor_data --restore 移回主表。
+
+已有分表的列表在进程内缓存 SHARD_TABLES_TTL 秒，本进程建表、删表时立即失效；
+其他进程（manage.py shard_sensor_data）新建或删除的分表最迟在 SHARD_TABLES_TTL 秒后生效。
+"""
+import heapq
+import re
+import threading
+import time
+from datetime import datetime
+
+from django.apps.registry import Apps
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.utils import timezone
+
+from .models import SensorData
+
+MAIN_TABLE = SensorData._meta.db_table
+SHARD_TABLE_RE = re.compile(rf'^{MAIN_TABLE}_(\d{{4}})(\d{{2}})$')
+TIME_FIELD = 'timestamp'
+# 每次从数据库游标读取的行数
+CHUNK_SIZE = 20000
+# 分表列表的缓存时间（秒）
+SHARD_TABLES_TTL = 60
+
+# 分表模型注册在独立的应用注册表中，不会出现在迁移和admin里
+_shard_apps = Apps()
+_shard_models = {}
+
+
+def month_start(value):
+    """value所在月份的第一天零点（本地时区）"""
+    local = timezone.localtime(value) if timezone.is_aware(value) else timezone.make_aware(value)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    year, month = (start.year + 1, 1) if start.month == 12 else (start.year, start.month + 1)
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def shard_table(value):
+    start = month_start(value)
+    return f'{MAIN_TABLE}_{start.year:04d}{start.month:02d}'
+
+
+def shard_month(table):
+    """分表名 -> 该月第一天零点；不是分表时返回None"""
+    match = SHARD_TABLE_RE.match(table)
+    if match is None:
+        return None
+    return timezone.make_aware(datetime(int(match.group(1)), int(match.group(2)), 1))
+
+
+def shard_model(table):
+    """返回分表对应的模型（字段、索引与SensorData相同，managed=False）"""
+    model = _shard_models.get(table)
+    if model is not None:
+        return model
+    suffix = table[len(MAIN_TABLE) + 1:]
+    meta = type('Meta', (), {
+        'apps': _shard_apps,
+        'app_label': SensorData._meta.app_label,
+        'db_table': table,
+        'managed': False,
+        'indexes': [
+            models.Index(fields=index.fields, name=f'sensordata_{suffix}_{i}_idx')
+            for i, index in enumerate(SensorData._meta.indexes)
+        ],
+    })
+    attrs = {'__module__': __name__, 'Meta': meta}
+    for field in SensorData._meta.local_fields:
+        attrs[field.name] = field.clone()
+    model = type(f'SensorDataShard{suffix}', (models.Model,), attrs)
+    _shard_models[table] = model
+    return model
+
+
+def _copy_sql(connection, source, target):
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in SensorData._meta.local_fields)
+    qn = connection.ops.quote_name
+    return f'INSERT INTO {qn(target)} ({columns}) SELECT {columns} FROM {qn(source)}'
+
+
+class SensorShardRouter:
+    """按时间范围把SensorData的查询分配到相关的月分表和主表"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        self._lock = threading.Lock()
+        self._tables = None
+        self._tables_at = 0.0
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def shard_tables(self):
+        """数据库中已有的分表名，按月份排序；缓存SHARD_TABLES_TTL秒，不必每次查询都读取数据库的表列表"""
+        with self._lock:
+            if self._tables is None or time.monotonic() - self._tables_at >= SHARD_TABLES_TTL:
+                tables = self.connection.introspection.table_names()
+                self._tables = sorted(table for table in tables if SHARD_TABLE_RE.match(table))
+                self._tables_at = time.monotonic()
+            return list(self._tables)
+
+    def invalidate_tables(self):
+        """新建或删除分表后调用，下次使用时重新读取分表列表"""
+        with self._lock:
+            self._tables = None
+
+    def tables_for_range(self, start=None, end=None):
+        """与 [start, end) 有重叠的分表名"""
+        tables = []
+        for table in self.shard_tables():
+            first = shard_month(table)
+            if end is not None and first >= end:
+                continue
+            if start is not None and next_month(first) <= start:
+                continue
+            tables.append(table)
+        return tables
+
+    def querysets(self, start=None, end=None):
+        """时间范围 [start, end) 内的数据在各表上的QuerySet：相关分表 + 主表"""
+        lookups = {}
+        if start is not None:
+            lookups[f'{TIME_FIELD}__gte'] = start
+        if end is not None:
+            lookups[f'{TIME_FIELD}__lt'] = end
+        models_ = [shard_model(table) for table in self.tables_for_range(start, end)] + [SensorData]
+        return [model.objects.using(self.using).filter(**lookups) for model in models_]
+
+    def values_list(self, fields, start=None, end=None):
+        """
+        按时间升序返回 [start, end) 内各行的 fields 值（fields必须包含timestamp）。
+        只查询相关的表，每张表一条按timestamp排序的查询，结果逐行合并，不一次读入内存。
+        """
+        position = list(fields).index(TIME_FIELD)
+        streams = [
+            queryset.order_by(TIME_FIELD).values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+            for queryset in self.querysets(start, end)
+        ]
+        if len(streams) == 1:
+            return streams[0]
+        # 分表之后写入主表的旧数据（补传）可能早于分表中的数据，按时间归并保证整体有序
+        return heapq.merge(*streams, key=lambda row: row[position])
+
+    # --------------- 分表维护（manage.py shard_sensor_data） ---------------
+    def create_shard(self, table):
+        model = shard_model(table)
+        with self.connection.schema_editor() as editor:
+            editor.create_model(model)
+        # managed=False的模型create_model不会创建索引，单独添加
+        with self.connection.schema_editor() as editor:
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+        self.invalidate_tables()
+        return model
+
+    def archive_month(self, start):
+        """把start所在月份的数据从主表移到分表，返回移动的行数"""
+        start = month_start(start)
+        end = next_month(start)
+        table = shard_table(start)
+        connection = self.connection
+        # SQLite不能在事务中使用schema_editor，先建表；空表不影响查询。
+        # 分表可能由其他进程创建，不使用缓存的列表
+        self.invalidate_tables()
+        if table not in self.shard_tables():
+            self.create_shard(table)
+        with transaction.atomic(using=self.using):
+            rows = SensorData.objects.using(self.using).filter(**{
+                f'{TIME_FIELD}__gte': start, f'{TIME_FIELD}__lt': end,
+            }).order_by().values_list('pk')
+            select_sql, params = rows.query.sql_with_params()
+            qn = connection.ops.quote_name
+            pk = qn(SensorData._meta.pk.column)
+            with connection.cursor() as cursor:
+                cursor.execute(f'{_copy_sql(connection, MAIN_TABLE, table)} WHERE {pk} IN ({select_sql})', params)
+                moved = cursor.rowcount
+                cursor.execute(f'DELETE FROM {qn(MAIN_TABLE)} WHERE {pk} IN (SELECT {pk} FROM {qn(table)})')
+        return moved
+
+    def restore_shard(self, table):
+        """把分表的数据移回主表并删除分表，返回移动的行数"""
+        connection = self.connection
+        try:
+            with transaction.atomic(using=self.using):
+                with connection.cursor() as cursor:
+                    cursor.execute(_copy_sql(connection, table, MAIN_TABLE))
+                    moved = cursor.rowcount
+                    # 分表上的索引随表一起删除
+                    cursor.execute(f'DROP TABLE {connection.ops.quote_name(table)}')
+        finally:
+            self.invalidate_tables()
+        return moved
+
+
+# 默认数据库的路由
+router = SensorShardRouter()
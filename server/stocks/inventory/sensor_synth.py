@@ -0,0 +1,115 @@
+"""
+模拟传感器数据生成（manage.py generate_sensor_data 使用）
+
+用NumPy按块生成连续多月的传感器时间序列，每块一次向量运算，不逐条调用random：
+
+- 温度：基准值 + 季节变化 + 每天随机的天气偏移（相邻两天之间线性过渡）+ 日变化（下午3点最高）+ 噪声
+- 湿度：与温度负相关，叠加每天的天气偏移和噪声，限制在 20%~95%
+- 光照：白天（6点~18点）按正弦曲线变化，乘以每天随机的云量；夜间接近0
+- 缺失：随机的断线区间内没有数据（平均每天 gaps_per_day 次，持续时间指数分布），
+  另有 null_rate 比例的温度读数为空（与实际传感器读取失败时相同）
+
+天气偏移和断线区间在创建时按整个时间范围一次生成，所以分块生成的结果与块大小无关；
+相同的seed、时间范围和参数生成相同的数据。时间以UTC秒（float64）表示，日变化按本地时区计算。
+"""
+import math
+
+import numpy as np
+from django.utils import timezone
+
+DAY = 86400.0
+
+
+class SensorSeries:
+    """[start, end) 内每 interval 秒一条读数的模拟传感器数据"""
+
+    def __init__(self, start, end, interval=60.0, seed=0, gaps_per_day=0.5, gap_minutes=30.0,
+                 null_rate=0.01):
+        if interval <= 0:
+            raise ValueError('interval必须大于0')
+        self.start = start.timestamp()
+        self.end = end.timestamp()
+        self.interval = float(interval)
+        self.seed = seed
+        self.null_rate = null_rate
+        # 日变化按本地时区（与图表、汇总相同），不考虑夏令时切换
+        self.utc_offset = timezone.localtime(start).utcoffset().total_seconds()
+        self.total = max(0, math.ceil((self.end - self.start) / self.interval))
+
+        rng = np.random.default_rng([seed, 0])
+        days = int((self.end - self.start) // DAY) + 2
+        # 每天的天气：温度偏移、湿度偏移、云量
+        self._weather_temp = rng.normal(0.0, 2.0, days)
+        self._weather_humidity = rng.normal(0.0, 6.0, days)
+        self._cloud = rng.uniform(0.3, 1.0, days)
+        # 断线区间
+        gaps = rng.poisson(gaps_per_day * (self.end - self.start) / DAY)
+        gap_starts = np.sort(rng.uniform(self.start, self.end, gaps))
+        self._gap_starts = gap_starts
+        # 区间可能重叠：某时刻已开始的区间数大于已结束的区间数，说明处于断线中
+        self._gap_ends = np.sort(gap_starts + rng.exponential(gap_minutes * 60.0, gaps))
+
+    def chunks(self, size=100000):
+        """按时间顺序逐块返回字典：timestamp、temperature（空值为NaN）、humidity、light（numpy数组）"""
+        for index, first in enumerate(range(0, self.total, size)):
+            chunk = self._generate(index, first, min(size, self.total - first))
+            if len(chunk['timestamp']):
+                yield chunk
+
+    def _generate(self, index, first, count):
+        rng = np.random.default_rng([self.seed, 1, index])
+        # 采样时间有少量抖动，不超过间隔的20%，仍按时间顺序排列
+        ts = self.start + (first + np.arange(count)) * self.interval
+        ts += rng.uniform(-0.2, 0.2, count) * self.interval
+        np.clip(ts, self.start, np.nextafter(self.end, -np.inf), out=ts)
+
+        # 去掉落在断线区间内的读数
+        if len(self._gap_starts):
+            opened = np.searchsorted(self._gap_starts, ts, side='right')
+            closed = np.searchsorted(self._gap_ends, ts, side='right')
+            ts = ts[opened == closed]
+            count = len(ts)
+
+        days = (ts - self.start) / DAY
+        day = days.astype(np.int64)
+        frac = days - day
+        weather_temp = self._weather_temp[day] * (1 - frac) + self._weather_temp[day + 1] * frac
+        weather_humidity = self._weather_humidity[day] * (1 - frac) + self._weather_humidity[day + 1] * frac
+        hour = ((ts + self.utc_offset) % DAY) / 3600.0
+        day_of_year = ((ts + self.utc_offset) % (365.25 * DAY)) / DAY
+
+        daily = np.sin(2 * np.pi * (hour - 9.0) / 24.0)
+        seasonal = -6.0 * np.cos(2 * np.pi * (day_of_year - 15.0) / 365.25)
+        temperature = 22.0 + seasonal + weather_temp + 4.0 * daily + rng.normal(0.0, 0.3, count)
+        humidity = 60.0 - 2.5 * (temperature - 22.0 - seasonal) + weather_humidity + rng.normal(0.0, 1.5, count)
+        daylight = np.clip(np.sin(np.pi * (hour - 6.0) / 12.0), 0.0, None)
+        light = 900.0 * daylight * self._cloud[day] + np.abs(rng.normal(0.0, 5.0, count))
+
+        temperature = np.round(temperature, 2)
+        temperature[rng.random(count) < self.null_rate] = np.nan
+        return {
+            'timestamp': ts,
+            'temperature': temperature,
+            'humidity': np.round(np.clip(humidity, 20.0, 95.0), 2),
+            'light': np.round(light, 2),
+        }
+
+
+def to_datetime_strings(ts):
+    """UTC秒 -> 'YYYY-MM-DD HH:MM:SS.ffffff'（SQLite中DateTimeField的存储格式，UTC）"""
+    values = np.datetime_as_string((ts * 1e6).astype('datetime64[us]'), unit='us')
+    return np.char.replace(values, 'T', ' ')
+
+
+def to_iso_strings(ts):
+    """UTC秒 -> 带时区的ISO 8601字符串（批量写入接口的timestamp格式）"""
+    values = np.datetime_as_string((ts * 1e6).astype('datetime64[us]'), unit='us')
+    return np.char.add(values, '+00:00')
+
+
+def nullable(values):
+    """NaN转换为None的Python列表"""
+    result = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        result[i] = None
+    return result
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Ingredient, InventoryOperation, Task, Feedback, EnvironmentData, InventoryEvent, InventoryReport, SensorData, Comment, MaterialRequest, MaterialRequestItem, Category
+from .models import Ingredient, InventoryOperation, Task, Feedback, EnvironmentData, InventoryEvent, InventoryReport, SensorData, SensorAlertRule, Comment, MaterialRequest, MaterialRequestItem, Category
 from users.models import User
 from users.serializers import UserSerializer
 import logging
@@ -240,6 +240,39 @@ class SensorDataSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
+class SensorAlertRuleSerializer(serializers.ModelSerializer):
+    """
+    传感器警报规则序列化器
+    """
+    source_display = serializers.ReadOnlyField(source='get_source_display')
+    metric_display = serializers.ReadOnlyField(source='get_metric_display')
+    kind_display = serializers.ReadOnlyField(source='get_kind_display')
+    operator_display = serializers.ReadOnlyField(source='get_operator_display')
+
+    class Meta:
+        model = SensorAlertRule
+        fields = [
+            'id', 'name', 'source', 'source_display', 'metric', 'metric_display',
+            'kind', 'kind_display', 'operator', 'operator_display', 'value',
+            'window_minutes', 'cooldown_minutes', 'enabled', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+    def validate(self, attrs):
+        source = attrs.get('source', getattr(self.instance, 'source', 'sensor'))
+        metric = attrs.get('metric', getattr(self.instance, 'metric', None))
+        kind = attrs.get('kind', getattr(self.instance, 'kind', 'threshold'))
+        value = attrs.get('value', getattr(self.instance, 'value', None))
+        window_minutes = attrs.get('window_minutes', getattr(self.instance, 'window_minutes', 5))
+        if source == 'environment' and metric == 'light':
+            raise serializers.ValidationError({'metric': '环境数据没有光照指标'})
+        if kind == 'rate' and value is not None and value <= 0:
+            raise serializers.ValidationError({'value': '变化过快规则的阈值必须大于0'})
+        if kind != 'threshold' and not window_minutes:
+            raise serializers.ValidationError({'window_minutes': '变化过快和持续超限规则需要设置时间窗口'})
+        return attrs
+
+
 class MaterialRequestItemSerializer(serializers.ModelSerializer):
     """出库申请项目的序列化器"""
     ingredient_name = serializers.SerializerMethodField()
@@ -1,8 +1,14 @@
-from django.db.models.signals import pre_save, post_save
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from .models import Ingredient
+from . import rollups
+from .alerts import engine as alert_engine
+from .latest_cache import latest_cache
+from .live_hub import hub
+from .recent_window import recent_window
+from .models import EnvironmentData, Ingredient, SensorAlertRule, SensorData
 
 @receiver(pre_save, sender=Ingredient)
 def update_ingredient_status(sender, instance, **kwargs):
@@ -35,4 +41,105 @@ def log_ingredient_update(sender, instance, created, **kwargs):
     if created:
         print(f"[LOG] 新食材已添加: {instance.name}, 状态: {instance.status}")
     else:
-        print(f"[LOG] 食材已更新: {instance.name}, 状态: {instance.status}, 数量: {instance.quantity}{instance.unit}") 
\ No newline at end of file
+        print(f"[LOG] 食材已更新: {instance.name}, 状态: {instance.status}, 数量: {instance.quantity}{instance.unit}")
+
+
+def _on_commit_latest(key, timestamp, data, push):
+    def commit():
+        # 最新值缓存只接受时间更新的记录；修改旧记录时不推送
+        if latest_cache.update(key, timestamp, data) and push:
+            hub.publish(key, data)
+    transaction.on_commit(commit)
+
+
+@receiver(post_save, sender=SensorData)
+def push_sensor_data(sender, instance, created, **kwargs):
+    """新的传感器数据提交后更新最新值缓存并推送给SSE订阅者"""
+    from .serializers import SensorDataSerializer
+    data = SensorDataSerializer(instance).data
+    _on_commit_latest('sensor', instance.timestamp, data, push=created)
+
+
+@receiver(post_save, sender=EnvironmentData)
+def push_environment_data(sender, instance, created, **kwargs):
+    """新的环境数据提交后更新最新值缓存并推送给SSE订阅者"""
+    from .serializers import EnvironmentDataSerializer
+    data = EnvironmentDataSerializer(instance).data
+    _on_commit_latest('environment', instance.recorded_at, data, push=created)
+
+
+@receiver(post_delete, sender=SensorData)
+def invalidate_latest_sensor_data(sender, instance, **kwargs):
+    transaction.on_commit(lambda: latest_cache.invalidate('sensor'))
+
+
+@receiver(post_save, sender=SensorData)
+def update_recent_window(sender, instance, created, **kwargs):
+    """新数据提交后追加到内存中的最近数据窗口；修改旧记录时窗口重新加载"""
+    if created:
+        transaction.on_commit(lambda: recent_window.append([instance]))
+    else:
+        transaction.on_commit(recent_window.invalidate)
+
+
+@receiver(post_delete, sender=SensorData)
+def invalidate_recent_window(sender, instance, **kwargs):
+    transaction.on_commit(recent_window.invalidate)
+
+
+@receiver(post_delete, sender=EnvironmentData)
+def invalidate_latest_environment_data(sender, instance, **kwargs):
+    transaction.on_commit(lambda: latest_cache.invalidate('environment'))
+
+
+# --------------- 小时/天汇总 ---------------
+def _rollup_source(sender):
+    return 'sensor' if sender is SensorData else 'environment'
+
+
+@receiver(pre_save, sender=SensorData)
+@receiver(pre_save, sender=EnvironmentData)
+def remember_rollup_timestamp(sender, instance, **kwargs):
+    """修改已有记录前记下原来的时间，保存后原区间和新区间都要重算"""
+    if instance.pk is None:
+        return
+    _, time_field, _ = rollups.SOURCES[_rollup_source(sender)]
+    instance._rollup_previous_timestamp = (
+        sender.objects.filter(pk=instance.pk).values_list(time_field, flat=True).first()
+    )
+
+
+@receiver(post_save, sender=SensorData)
+@receiver(post_save, sender=EnvironmentData)
+def update_rollups(sender, instance, created, **kwargs):
+    """新记录累加到汇总；修改记录时按原始数据重算受影响的区间"""
+    source = _rollup_source(sender)
+    if created:
+        rollups.record(source, [instance])
+        return
+    _, time_field, _ = rollups.SOURCES[source]
+    previous = getattr(instance, '_rollup_previous_timestamp', None)
+    rollups.refresh(source, [previous, getattr(instance, time_field)])
+
+
+@receiver(post_delete, sender=SensorData)
+@receiver(post_delete, sender=EnvironmentData)
+def refresh_rollups_after_delete(sender, instance, **kwargs):
+    source = _rollup_source(sender)
+    _, time_field, _ = rollups.SOURCES[source]
+    rollups.refresh(source, [getattr(instance, time_field)])
+
+
+# --------------- 传感器警报 ---------------
+@receiver(post_save, sender=SensorData)
+@receiver(post_save, sender=EnvironmentData)
+def evaluate_alert_rules(sender, instance, created, **kwargs):
+    """新记录按警报规则判断；修改旧记录不触发警报"""
+    if created:
+        alert_engine.process(_rollup_source(sender), [instance])
+
+
+@receiver(post_save, sender=SensorAlertRule)
+@receiver(post_delete, sender=SensorAlertRule)
+def reload_alert_rules(sender, instance, **kwargs):
+    transaction.on_commit(alert_engine.invalidate)
@@ -1,3 +1,427 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from . import rollups, sensor_export, sensor_ingest
+from .charts import to_microseconds
+from .alerts import engine as alert_engine
+from .models import InventoryEvent, SensorAlertRule, SensorData, SensorRollup
+from .recent_window import RecentWindow
+from .sensor_shards import month_start, router, shard_table
+
+ROLLUP_EXACT_FIELDS = (
+    'count', 'temperature_count', 'temperature_min', 'temperature_max',
+    'humidity_min', 'humidity_max', 'light_min', 'light_max',
+)
+ROLLUP_SUM_FIELDS = ('temperature_sum', 'humidity_sum', 'light_sum')
+
+
+class RecentWindowTests(TestCase):
+    """内存窗口（环形缓冲区）与数据库中的数据保持一致"""
+
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+
+    def window(self, capacity=100):
+        # sync_interval=0：每次读取前都从数据库补读新增的行
+        return RecentWindow(capacity=capacity, hours=2, sync_interval=0)
+
+    def create(self, minutes_ago, temperature=20.0):
+        return SensorData.objects.create(
+            temperature=temperature, humidity=50.0 + minutes_ago, light=100.0 + minutes_ago,
+            timestamp=self.now - timedelta(minutes=minutes_ago),
+        )
+
+    def assertMatchesDatabase(self, window, start):
+        arrays = window.chart_arrays(start)
+        self.assertIsNotNone(arrays)
+        rows = list(SensorData.objects.filter(timestamp__gte=start).order_by('timestamp', 'id')
+                    .values_list('timestamp', 'temperature', 'humidity', 'light'))
+        np.testing.assert_array_equal(arrays[0], [to_microseconds(row[0]) for row in rows])
+        for i, column in enumerate(arrays[1:], 1):
+            expected = [np.nan if row[i] is None else row[i] for row in rows]
+            np.testing.assert_array_equal(column, np.array(expected, dtype=np.float64))
+
+        latest = window.latest()
+        expected = SensorData.objects.order_by('-timestamp', '-id').first()
+        self.assertEqual((latest.id, latest.timestamp, latest.temperature),
+                         (expected.id, expected.timestamp, expected.temperature))
+
+    def test_load_and_sync(self):
+        for minutes_ago in (50, 40, 30):
+            self.create(minutes_ago)
+        window = self.window()
+        start = self.now - timedelta(minutes=90)
+        self.assertMatchesDatabase(window, start)
+
+        self.create(20, temperature=None)
+        self.create(10)
+        self.assertMatchesDatabase(window, start)
+        stats = window.stats()
+        self.assertEqual(stats['loads'], 1)
+        self.assertEqual(stats['size'], 5)
+
+    def test_late_rows_merged_in_order(self):
+        for minutes_ago in (50, 40, 30):
+            self.create(minutes_ago)
+        window = self.window()
+        start = self.now - timedelta(minutes=90)
+        self.assertMatchesDatabase(window, start)
+
+        # 补传的数据早于窗口中最新的数据，合并到对应位置，不重新加载
+        self.create(45, temperature=21.0)
+        self.create(35, temperature=22.0)
+        self.create(20)
+        self.assertMatchesDatabase(window, start)
+        stats = window.stats()
+        self.assertEqual((stats['loads'], stats['merges'], stats['invalidations']), (1, 1, 0))
+
+        # 早于窗口起点的数据不影响窗口
+        self.create(150)
+        self.assertMatchesDatabase(window, start)
+        self.assertEqual(window.stats()['size'], 6)
+
+    def test_capacity_wrap(self):
+        rows = {minutes_ago: self.create(minutes_ago) for minutes_ago in (60, 50, 40, 30, 20, 10)}
+        window = self.window(capacity=4)
+        # 加载时超过容量，只保留最新的4条，窗口从保留的第一条之后开始
+        self.assertIsNone(window.chart_arrays(self.now - timedelta(minutes=90)))
+        self.assertMatchesDatabase(window, rows[30].timestamp)
+
+        # 追加时覆盖最旧的数据
+        self.create(5)
+        self.create(1)
+        self.assertIsNone(window.chart_arrays(rows[30].timestamp))
+        self.assertMatchesDatabase(window, rows[10].timestamp)
+
+        # 窗口已满时合并补传的数据
+        self.create(15, temperature=25.0)
+        self.assertMatchesDatabase(window, rows[10].timestamp)
+        self.assertEqual(window.stats()['size'], 4)
+        self.assertEqual(window.stats()['loads'], 1)
+
+    def test_invalidate_on_update(self):
+        row = self.create(30)
+        window = self.window()
+        start = self.now - timedelta(minutes=90)
+        self.assertMatchesDatabase(window, start)
+
+        row.temperature = 30.0
+        row.save()
+        window.invalidate()
+        self.assertMatchesDatabase(window, start)
+        self.assertEqual(window.stats()['loads'], 2)
+
+
+class SensorRollupTests(TestCase):
+    """增量维护的汇总与按原始数据重建的汇总相同"""
+
+    def snapshot(self):
+        return {
+            (row['resolution'], row['bucket_start']): row
+            for row in SensorRollup.objects.filter(source='sensor').values(
+                'resolution', 'bucket_start', *ROLLUP_EXACT_FIELDS, *ROLLUP_SUM_FIELDS)
+        }
+
+    def assertRollupsEqual(self, actual, expected):
+        self.assertEqual(actual.keys(), expected.keys())
+        for key, row in expected.items():
+            for name in ROLLUP_EXACT_FIELDS:
+                self.assertEqual(actual[key][name], row[name], (key, name))
+            for name in ROLLUP_SUM_FIELDS:
+                # 累加顺序不同，浮点合计允许舍入误差
+                self.assertAlmostEqual(actual[key][name], row[name], places=6, msg=(key, name))
+
+    def test_incremental_matches_rebuild(self):
+        base = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=3)
+        rng = np.random.default_rng(0)
+        offsets = rng.uniform(0, 3 * 86400, 60)
+
+        # 单条写入（SensorData.save）和批量写入（sensor_ingest.save_readings），时间乱序，部分温度为空
+        single = [
+            SensorData.objects.create(
+                temperature=None if i % 7 == 0 else round(20 + rng.normal(), 2),
+                humidity=round(50 + rng.normal(), 2), light=round(300 + rng.normal(), 2),
+                timestamp=base + timedelta(seconds=float(offset)),
+            )
+            for i, offset in enumerate(offsets[:20])
+        ]
+        sensor_ingest.save_readings([
+            {
+                'temperature': None if i % 5 == 0 else round(20 + rng.normal(), 2),
+                'humidity': round(50 + rng.normal(), 2), 'light': round(300 + rng.normal(), 2),
+                'threshold': None, 'timestamp': base + timedelta(seconds=float(offset)),
+            }
+            for i, offset in enumerate(offsets[20:])
+        ])
+        # 修改和删除后按原始数据重算受影响的区间
+        single[0].temperature = 35.0
+        single[0].save()
+        single[1].delete()
+
+        incremental = self.snapshot()
+        self.assertTrue(incremental)
+        rollups.rebuild('sensor')
+        self.assertRollupsEqual(incremental, self.snapshot())
+
+
+class AlertEngineTests(TestCase):
+    """警报规则的增量判断；每条读数单独提交（执行on_commit回调）"""
+
+    def setUp(self):
+        alert_engine.reset()
+        self.base = timezone.now().replace(second=0, microsecond=0) - timedelta(hours=1)
+
+    def tearDown(self):
+        alert_engine.reset()
+
+    def rule(self, **fields):
+        rule = SensorAlertRule.objects.create(name=f"{fields['kind']}-{fields['metric']}", **fields)
+        alert_engine.invalidate()
+        return rule
+
+    def reading(self, minutes, temperature=20.0, humidity=50.0, light=100.0, threshold=None):
+        return {
+            'temperature': temperature, 'humidity': humidity, 'light': light, 'threshold': threshold,
+            'timestamp': self.base + timedelta(minutes=minutes),
+        }
+
+    def save(self, minutes, **values):
+        """写入一条读数并提交，返回新生成的警报数"""
+        before = self.alert_count()
+        with self.captureOnCommitCallbacks(execute=True):
+            SensorData.objects.create(**self.reading(minutes, **values))
+        return self.alert_count() - before
+
+    def alert_count(self):
+        return InventoryEvent.objects.filter(event_type='sensor_alert').count()
+
+    def test_builtin_threshold_and_cooldown(self):
+        self.assertEqual(self.save(0, temperature=31.0, threshold=30.0), 1)
+        # 恢复正常之前不重复触发
+        self.assertEqual(self.save(1, temperature=32.0, threshold=30.0), 0)
+        self.assertEqual(self.save(2, temperature=29.0, threshold=30.0), 0)
+        # 冷却时间（10分钟）内再次超限不触发
+        self.assertEqual(self.save(3, temperature=33.0, threshold=30.0), 0)
+        self.assertEqual(self.save(4, temperature=29.0, threshold=30.0), 0)
+        self.assertEqual(self.save(15, temperature=33.0, threshold=30.0), 1)
+        # 读数没有阈值时不判断
+        self.assertEqual(self.save(16, temperature=99.0), 0)
+
+    def test_threshold_rule(self):
+        self.rule(metric='humidity', kind='threshold', operator='gt', value=80.0, cooldown_minutes=0)
+        self.rule(metric='light', kind='threshold', operator='lt', value=10.0, cooldown_minutes=0)
+        self.assertEqual(self.save(0, humidity=85.0), 1)
+        self.assertEqual(self.save(1, humidity=86.0), 0)
+        self.assertEqual(self.save(2, humidity=70.0), 0)
+        self.assertEqual(self.save(3, humidity=90.0, light=5.0), 2)
+
+    def test_rate_rule(self):
+        self.rule(metric='temperature', kind='rate', operator='gt', value=3.0, window_minutes=5, cooldown_minutes=0)
+        self.assertEqual(self.save(0, temperature=20.0), 0)
+        self.assertEqual(self.save(2, temperature=22.0), 0)
+        # 与窗口内最早的读数（20.0）相比上升4.5
+        self.assertEqual(self.save(4, temperature=24.5), 1)
+        self.assertEqual(self.save(5, temperature=25.0), 0)
+        # 窗口内只剩这一条，变化为0，恢复正常
+        self.assertEqual(self.save(20, temperature=25.0), 0)
+        self.assertEqual(self.save(21, temperature=29.0), 1)
+
+    def test_sustained_rule(self):
+        self.rule(metric='light', kind='sustained', operator='lt', value=10.0, window_minutes=5, cooldown_minutes=0)
+        for minute in range(5):
+            self.assertEqual(self.save(minute, light=5.0), 0)
+        self.assertEqual(self.save(5, light=5.0), 1)
+        self.assertEqual(self.save(6, light=5.0), 0)
+        # 中断后重新计时
+        self.assertEqual(self.save(7, light=50.0), 0)
+        self.assertEqual(self.save(8, light=5.0), 0)
+        self.assertEqual(self.save(12, light=5.0), 0)
+        self.assertEqual(self.save(13, light=5.0), 1)
+
+    def test_late_readings_skipped(self):
+        skipped = alert_engine.stats()['skipped']
+        self.assertEqual(self.save(10, temperature=20.0, threshold=30.0), 0)
+        self.assertEqual(self.save(5, temperature=35.0, threshold=30.0), 0)
+        self.assertEqual(alert_engine.stats()['skipped'], skipped + 1)
+
+    def test_rollback_keeps_state(self):
+        readings = [self.reading(0, temperature=25.0, threshold=30.0), self.reading(1, temperature=35.0, threshold=30.0)]
+        skipped = alert_engine.stats()['skipped']
+        # 写入失败回滚：警报事件和规则状态都不保留
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            sensor_ingest.save_readings(readings)
+            self.assertEqual(self.alert_count(), 1)
+            raise RuntimeError
+        self.assertEqual(self.alert_count(), 0)
+
+        # 重试同一批数据（例如补发暂存的批次）重新判断并触发
+        with self.captureOnCommitCallbacks(execute=True):
+            sensor_ingest.save_readings(readings)
+        self.assertEqual(self.alert_count(), 1)
+        self.assertEqual(alert_engine.stats()['skipped'], skipped)
+        # 提交后状态生效：仍然超限时不重复触发
+        self.assertEqual(self.save(2, temperature=36.0, threshold=30.0), 0)
+
+    def test_uncommitted_calls_in_one_transaction(self):
+        # 同一事务中的多次写入依次使用前面尚未提交的状态，不重复触发
+        with self.captureOnCommitCallbacks(execute=True):
+            SensorData.objects.create(**self.reading(0, temperature=35.0, threshold=30.0))
+            SensorData.objects.create(**self.reading(1, temperature=36.0, threshold=30.0))
+        self.assertEqual(self.alert_count(), 1)
+        self.assertEqual(self.save(2, temperature=37.0, threshold=30.0), 0)
+
+
+class SensorExportTests(TestCase):
+    """导出接口的错误信息以JSON返回"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(username='export', password='export-pw')
+        self.client.force_login(user)
+
+    def assertJSONError(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('detail', response.json())
+
+    def test_invalid_parameters(self):
+        for params in ({'days': 'x'}, {'days': '10000000000'}, {'hours': '10' * 20}, {'fields': 'unknown'}):
+            with self.subTest(params=params):
+                self.assertJSONError(self.client.get('/api/sensor-data/export/', params))
+
+    def test_parquet_unavailable(self):
+        if sensor_export.parquet_available():
+            self.skipTest('已安装pyarrow')
+        self.assertJSONError(self.client.get('/api/sensor-data/export/', {'format': 'parquet'}))
+
+    def test_csv(self):
+        SensorData.objects.create(temperature=20.0, humidity=50.0, light=100.0, timestamp=timezone.now())
+        response = self.client.get('/api/sensor-data/export/', {'days': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ','.join(sensor_export.EXPORT_FIELDS))
+        self.assertEqual(len(lines), 2)
+
+
+class SensorShardTests(TransactionTestCase):
+    """按月分表后分表列表的缓存立即更新，按时间范围的查询包含分表中的数据"""
+
+    def test_archive_and_restore(self):
+        old = month_start(timezone.now()) - timedelta(days=40)
+        rows = [
+            SensorData.objects.create(temperature=20.0, humidity=50.0, light=100.0, timestamp=old + timedelta(hours=i))
+            for i in range(3)
+        ]
+        recent = SensorData.objects.create(temperature=21.0, humidity=50.0, light=100.0, timestamp=timezone.now())
+        table = shard_table(old)
+        self.assertNotIn(table, router.shard_tables())
+
+        try:
+            self.assertEqual(router.archive_month(old), 3)
+            self.assertEqual(router.shard_tables(), [table])
+            self.assertEqual(list(SensorData.objects.values_list('id', flat=True)), [recent.id])
+            self.assertEqual([row[0] for row in router.values_list(('id', 'timestamp'))],
+                             [row.id for row in rows] + [recent.id])
+        finally:
+            for name in router.shard_tables():
+                router.restore_shard(name)
+        self.assertEqual(router.shard_tables(), [])
+        self.assertEqual(SensorData.objects.count(), 4)
+
+
+class SensorBulkIngestTests(TestCase):
+    """add_data_bulk：合法的记录一次写入，非法的记录按下标返回错误"""
+
+    url = '/api/sensor-data/add_data_bulk/'
+
+    def post(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+
+    def item(self, **fields):
+        return dict({'temperature': 25.0, 'humidity': 50.0, 'light': 300.0, 'timestamp': '2026-10-01T12:00:00+00:00'},
+                    **fields)
+
+    def test_partial_errors_by_index(self):
+        response = self.post([
+            self.item(),
+            self.item(humidity=None),
+            self.item(type='emit', threshold=30.0),
+            self.item(light='abc'),
+            self.item(type='ping'),
+            self.item(timestamp='yesterday'),
+        ])
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['created'], 2)
+        self.assertEqual([error['index'] for error in body['errors']], [1, 3, 4, 5])
+        self.assertIn('humidity', body['errors'][0]['errors'])
+        self.assertIn('light', body['errors'][1]['errors'])
+        self.assertIn('type', body['errors'][2]['errors'])
+        self.assertIn('timestamp', body['errors'][3]['errors'])
+        self.assertEqual(SensorData.objects.count(), 2)
+
+    def test_all_invalid(self):
+        response = self.post([self.item(humidity=None), 'not an object'])
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertEqual(body['created'], 0)
+        self.assertEqual([error['index'] for error in body['errors']], [0, 1])
+        self.assertFalse(SensorData.objects.exists())
+
+    def test_items_wrapper_and_non_array(self):
+        response = self.post({'items': [self.item(), self.item()]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2, 'errors': []})
+        for data in ({'foo': 1}, {'items': 'x'}, 'x', 5):
+            with self.subTest(data=data):
+                response = self.post(data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('detail', response.json())
+
+    def test_max_batch_size(self):
+        with mock.patch.object(sensor_ingest, 'MAX_BATCH_SIZE', 3):
+            response = self.post([self.item()] * 4)
+            self.assertEqual(response.status_code, 400)
+            self.assertFalse(SensorData.objects.exists())
+            response = self.post([self.item()] * 3)
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(SensorData.objects.count(), 3)
+
+    def test_bool_and_non_finite_rejected(self):
+        response = self.post([
+            self.item(humidity=True),
+            self.item(temperature=False),
+            self.item(light='NaN'),
+            self.item(temperature='Infinity'),
+            self.item(humidity='-inf'),
+            self.item(temperature='25.5', humidity=40),
+        ])
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual(body['created'], 1)
+        self.assertEqual([error['index'] for error in body['errors']], [0, 1, 2, 3, 4])
+        reading = SensorData.objects.get()
+        self.assertEqual((reading.temperature, reading.humidity), (25.5, 40.0))
+
+    def test_timestamps(self):
+        before = timezone.now()
+        response = self.post([
+            self.item(timestamp='2026-10-01T12:00:00'),
+            self.item(timestamp='2026-10-01T12:00:00Z'),
+            self.item(timestamp=None),
+        ])
+        self.assertEqual(response.status_code, 201)
+        naive, utc, missing = SensorData.objects.order_by('id').values_list('timestamp', flat=True)
+        # 不带时区时按本地时区（Asia/Shanghai）解释
+        self.assertEqual(naive, timezone.make_aware(datetime(2026, 10, 1, 12, 0)))
+        self.assertEqual(naive, datetime(2026, 10, 1, 4, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(utc, datetime(2026, 10, 1, 12, 0, tzinfo=dt_timezone.utc))
+        # 省略时使用当前时间
+        self.assertGreaterEqual(missing, before)
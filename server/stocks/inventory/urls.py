@@ -9,6 +9,7 @@ from .views import (
     InventoryEventViewSet,
     InventoryReportViewSet,
     SensorDataViewSet,
+    SensorAlertRuleViewSet,
     MaterialRequestViewSet,
     MaterialRequestItemViewSet,
     InventoryViewSet
@@ -24,6 +25,7 @@ router.register(r'environment', EnvironmentDataViewSet)
 router.register(r'events', InventoryEventViewSet)
 router.register(r'reports', InventoryReportViewSet)
 router.register(r'sensor-data', SensorDataViewSet)
+router.register(r'sensor-alert-rules', SensorAlertRuleViewSet)
 router.register(r'material-requests', MaterialRequestViewSet)
 router.register(r'material-request-items', MaterialRequestItemViewSet)
 router.register(r'inventory', InventoryViewSet, basename='inventory')
@@ -5,7 +5,8 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Ingredient, InventoryOperation, Task, Feedback, EnvironmentData, InventoryEvent, InventoryReport, SensorData, Comment, Category, MaterialRequest, MaterialRequestItem
+from rest_framework.renderers import JSONRenderer
+from .models import Ingredient, InventoryOperation, Task, Feedback, EnvironmentData, InventoryEvent, InventoryReport, SensorData, SensorRollup, SensorAlertRule, Comment, Category, MaterialRequest, MaterialRequestItem
 from .serializers import (
     IngredientSerializer, 
     InventoryOperationSerializer, 
@@ -16,6 +17,7 @@ from .serializers import (
     InventoryEventSerializer,
     InventoryReportSerializer,
     SensorDataSerializer,
+    SensorAlertRuleSerializer,
     FeedbackStatusSerializer,
     CommentSerializer,
     CategorySerializer,
@@ -28,6 +30,13 @@ import json
 import re
 from datetime import datetime, timedelta
 import logging
+from .live_hub import EventStreamRenderer, hub, sse_response
+from .latest_cache import latest_cache
+from .recent_window import recent_window
+from .charts import SENSOR_CHART_FIELDS, aggregate_rollups, aggregate_sensor_arrays, aggregate_sensor_rows, rollup_records
+from . import rollups, sensor_export, sensor_ingest, sensor_shards
+from .alerts import engine as alert_engine
+from .downsample import lttb_indices, parse_max_points, take
 
 logger = logging.getLogger(__name__)
 
@@ -511,22 +520,40 @@ class EnvironmentDataViewSet(viewsets.ModelViewSet):
         """
         获取最新环境数据
         """
-        latest_record = EnvironmentData.objects.order_by('-recorded_at').first()
-        if not latest_record:
+        def load():
+            latest_record = EnvironmentData.objects.order_by('-recorded_at').first()
+            if not latest_record:
+                return None
+            return latest_record.recorded_at, self.get_serializer(latest_record).data
+        
+        # 读最新值缓存，未命中（冷启动）时才查询数据库
+        latest = latest_cache.get('environment', load)
+        if latest is None:
             return Response(
                 {'detail': '暂无环境数据记录', 'temperature': 0, 'humidity': 0},
                 status=status.HTTP_200_OK
             )
-        
-        serializer = self.get_serializer(latest_record)
-        return Response(serializer.data)
+        return Response(latest)
     
     @action(detail=False, methods=['get'])
     def chart_data(self, request):
         """
         获取图表数据，支持天、周、月的数据聚合
+        
+        URL参数：
+        - range: day / week / month
+        - max_points: 最多返回的记录数，默认500，超过时按LTTB降采样
+        - resolution: auto（默认，周、月视图读取小时汇总）/ raw（读取原始记录）
         """
         time_range = request.query_params.get('range', 'day')
+        resolution = request.query_params.get('resolution', 'auto')
+        try:
+            max_points = parse_max_points(request.query_params.get('max_points'))
+        except ValueError:
+            return Response(
+                {'detail': '参数格式错误'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         # 根据时间范围获取数据
         if time_range == 'day':
@@ -553,6 +580,26 @@ class EnvironmentDataViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # 周、月视图读取小时汇总（月视图约720行），每条记录为一小时的平均值
+        if resolution == 'auto' and time_range != 'day':
+            records = rollup_records(SensorRollup.objects.filter(
+                source='environment', resolution='hour', bucket_start__gte=rollups.bucket_start(start_time, 'hour')
+            ))
+            if len(records) > max_points:
+                x = [datetime.fromisoformat(r['recorded_at']).timestamp() for r in records]
+                y = [[r['temperature'] for r in records], [r['humidity'] for r in records]]
+                records = take(records, lttb_indices(x, y, max_points))
+            return Response(records)
+        
+        # 先只读取用于选点的列，超过max_points时按LTTB选出记录，只序列化选中的记录
+        rows = list(data.values_list('id', 'recorded_at', 'temperature', 'humidity'))
+        if len(rows) > max_points:
+            ids, recorded_at, temperatures, humidities = zip(*rows)
+            x = [t.timestamp() for t in recorded_at]
+            selected = take(ids, lttb_indices(x, [temperatures, humidities], max_points))
+            records = EnvironmentData.objects.in_bulk(selected)
+            data = [records[pk] for pk in selected]
+        
         serializer = self.get_serializer(data, many=True)
         return Response(serializer.data)
 
@@ -574,6 +621,19 @@ class InventoryEventViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def get_queryset(self):
+        """
+        可按 ?event_type=sensor_alert、?status=pending 过滤
+        """
+        queryset = InventoryEvent.objects.all()
+        event_type = self.request.query_params.get('event_type')
+        if event_type:
+            queryset = queryset.filter(event_type=event_type)
+        status_filter = self.request.query_params.get('status')
+        if status_filter:
+            queryset = queryset.filter(status=status_filter)
+        return queryset
+    
     def perform_create(self, serializer):
         serializer.save(reported_by=self.request.user)
     
@@ -634,6 +694,38 @@ class InventoryEventViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
+class SensorAlertRuleViewSet(viewsets.ModelViewSet):
+    """
+    传感器警报规则API，规则在传感器/环境数据写入时判断，触发时生成传感器警报事件（event_type=sensor_alert）
+    """
+    queryset = SensorAlertRule.objects.all()
+    serializer_class = SensorAlertRuleSerializer
+
+    def get_permissions(self):
+        """
+        处理权限：库存管理员可以修改规则，所有已认证用户可以查看
+        """
+        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+            permission_classes = [IsInventoryManager]
+        else:
+            permission_classes = [permissions.IsAuthenticated]
+        return [permission() for permission in permission_classes]
+
+    def get_queryset(self):
+        queryset = SensorAlertRule.objects.all()
+        source = self.request.query_params.get('source')
+        if source:
+            queryset = queryset.filter(source=source)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        警报引擎的处理统计：已判断的读数、跳过的补传数据、触发的警报数和加载的规则数
+        """
+        return Response(alert_engine.stats())
+
+
 class InventoryReportViewSet(viewsets.ModelViewSet):
     """
     库存报告API，提供库存报告的生成和查询
@@ -711,20 +803,32 @@ class InventoryReportViewSet(viewsets.ModelViewSet):
 class SensorDataViewSet(viewsets.ModelViewSet):
     """
     传感器数据API，提供传感器数据的记录和查询
+    
+    list / retrieve / update / destroy 只操作主表；按月分表（manage.py shard_sensor_data）后，
+    已移到分表的记录不会出现在列表中，也不能按id读取、修改或删除。图表、导出等按时间范围的接口会读取分表。
     """
     queryset = SensorData.objects.all()
     serializer_class = SensorDataSerializer
     
     def get_permissions(self):
         """
-        add_data接口不需要认证，其他接口需要认证
+        add_data、add_data_bulk接口不需要认证，其他接口需要认证
         """
-        if self.action == 'add_data':
+        if self.action in ('add_data', 'add_data_bulk'):
             permission_classes = []  # 不需要任何权限
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def finalize_response(self, request, response, *args, **kwargs):
+        """
+        export接口的错误信息（参数错误、未认证等）用JSONRenderer返回，不使用协商出的csv/parquet内容类型
+        """
+        if self.action == 'export' and isinstance(response, Response) and response.status_code >= 400:
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+    
     @action(detail=False, methods=['post'])
     def add_data(self, request):
         """
@@ -761,20 +865,131 @@ class SensorDataViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'])
+    def add_data_bulk(self, request):
+        """
+        批量添加传感器数据的API
+        
+        WebSocket转发客户端按批次提交，数据格式为add_data数据的数组，
+        或 {"items": [...]}；每条的type可以省略。
+        合法的记录一次写入，非法的记录不写入并按下标返回错误：
+        {
+            "created": 98,
+            "errors": [{"index": 3, "errors": {"humidity": ["该字段是必填项。"]}}]
+        }
+        全部记录都非法时返回400
+        """
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response(
+                {'detail': '数据格式错误，应为数组'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > sensor_ingest.MAX_BATCH_SIZE:
+            return Response(
+                {'detail': f'单次最多提交{sensor_ingest.MAX_BATCH_SIZE}条数据'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        readings, errors = [], []
+        for index, item in enumerate(items):
+            fields, item_errors = sensor_ingest.parse_reading(item)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+            else:
+                readings.append(fields)
+        
+        created = sensor_ingest.save_readings(readings)
+        result = {'created': len(created), 'errors': errors}
+        if errors and not created:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['get'])
     def latest(self, request):
         """
         获取最新的传感器数据
         """
-        latest_data = SensorData.objects.order_by('-timestamp').first()
-        if not latest_data:
+        def load():
+            # 缓存未命中时先读内存中的最近数据窗口，窗口为空才查询数据库
+            latest_data = recent_window.latest() or SensorData.objects.order_by('-timestamp').first()
+            if not latest_data:
+                return None
+            return latest_data.timestamp, self.get_serializer(latest_data).data
+        
+        # 读最新值缓存，未命中（冷启动）时才查询数据库
+        latest = latest_cache.get('sensor', load)
+        if latest is None:
             return Response(
                 {'detail': '没有传感器数据'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return Response(latest)
+    
+    @action(detail=False, methods=['get'])
+    def metrics(self, request):
+        """
+        最新值缓存、最近数据窗口的命中率和实时推送的订阅情况
+        """
+        return Response({
+            'latest_cache': latest_cache.stats(),
+            'recent_window': recent_window.stats(),
+            'live': hub.stats(),
+        })
+    
+    @action(detail=False, methods=['get'], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def stream(self, request):
+        """
+        SSE实时推送传感器数据，替代轮询latest接口
         
-        serializer = self.get_serializer(latest_data)
-        return Response(serializer.data)
+        事件类型：
+        - sensor: 最新的传感器数据（格式同latest接口）
+        - environment: 最新的环境数据（格式同environment/latest接口）
+        - alert: 新的传感器警报事件（格式同events接口），完整记录可在events接口按event_type=sensor_alert查询
+        可用 ?channels=sensor 只订阅部分事件；慢客户端只会收到每种事件的最新值
+        """
+        channels = request.query_params.get('channels')
+        return sse_response(request, hub, channels.split(',') if channels else None)
+
+    @action(detail=False, methods=['get'],
+            renderer_classes=[sensor_export.CSVRenderer, sensor_export.ParquetRenderer, JSONRenderer])
+    def export(self, request):
+        """
+        流式导出传感器历史数据，逐块读取数据库，导出任意行数时内存占用不变
+        
+        URL参数：
+        - format: csv（默认）/ parquet（需要服务器安装pyarrow），也可以用Accept头指定
+        - start / end: 时间范围 [start, end)，ISO 8601日期时间或日期，不带时区时按本地时区
+        - days / hours: 导出最近多少天/小时的数据（没有start时使用）
+        - fields: 导出的列，逗号分隔，默认全部（id,timestamp,temperature,humidity,light,threshold）
+        """
+        output = request.accepted_renderer.format
+        if output not in ('csv', 'parquet'):
+            return Response({'detail': '只支持csv或parquet格式'}, status=status.HTTP_400_BAD_REQUEST)
+        if output == 'parquet' and not sensor_export.parquet_available():
+            return Response({'detail': '服务器未安装pyarrow，无法导出parquet'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            fields = sensor_export.parse_fields(request.query_params.get('fields'))
+        except ValueError as e:
+            return Response({'detail': f'未知的字段: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = end = None
+            if request.query_params.get('start'):
+                start = sensor_export.parse_time(request.query_params['start'])
+            elif 'hours' in request.query_params:
+                start = timezone.now() - timezone.timedelta(hours=int(request.query_params['hours']))
+            elif 'days' in request.query_params:
+                start = timezone.now() - timezone.timedelta(days=int(request.query_params['days']))
+            if request.query_params.get('end'):
+                end = sensor_export.parse_time(request.query_params['end'])
+        except (ValueError, OverflowError):
+            return Response(
+                {'detail': '参数格式错误'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return sensor_export.export_response(request, output, fields, start, end)
     
     @action(detail=False, methods=['get'])
     def chart_data(self, request):
@@ -785,10 +1000,13 @@ class SensorDataViewSet(viewsets.ModelViewSet):
         - days: 天数，获取最近多少天的数据，默认为7天
         - hours: 小时数，获取最近多少小时的数据
         - dense: 如果设置为true，则返回所有数据点而不进行聚合
+        - max_points: 最多返回的数据点数，默认500，超过时按LTTB降采样
+        - resolution: auto（默认，间隔为整小时/整天时读取汇总）/ raw（读取原始数据）
         """
         try:
             # 获取请求参数
             dense = request.query_params.get('dense', 'false').lower() == 'true'
+            max_points = parse_max_points(request.query_params.get('max_points'))
             
             if 'hours' in request.query_params:
                 hours = int(request.query_params.get('hours', 24))
@@ -803,69 +1021,46 @@ class SensorDataViewSet(viewsets.ModelViewSet):
                 # 周视图和月视图的聚合间隔
                 if days <= 7:
                     interval_minutes = 30  # 周视图：每30分钟一个数据点
-                else:
+                elif days <= 90:
                     interval_minutes = 60  # 月视图：每1小时一个数据点
+                else:
+                    interval_minutes = 1440  # 更长时间范围：每天一个数据点
         except ValueError:
             return Response(
                 {'detail': '参数格式错误'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 获取时间范围内的数据，按时间戳排序
-        sensor_data = SensorData.objects.filter(
-            timestamp__gte=start_time
-        ).order_by('timestamp')
-        
-        # 确保有足够的数据进行聚合
-        if not sensor_data:
-            return Response({
-                'timestamps': [],
-                'temperature': [],
-                'humidity': [],
-                'light': []
-            })
-        
-        # 对数据进行时间间隔聚合
-        timestamps = []
-        temperature_values = []
-        humidity_values = []
-        light_values = []
-        
-        # 设置起始时间为第一个数据点的时间
-        current_time = sensor_data.first().timestamp
-        end_time = timezone.now()
-        
-        # 对数据按时间间隔聚合
-        while current_time <= end_time:
-            interval_end = current_time + timezone.timedelta(minutes=interval_minutes)
-            interval_data = sensor_data.filter(
-                timestamp__gte=current_time,
-                timestamp__lt=interval_end
-            )
-            
-            # 只在有数据的情况下添加数据点
-            if interval_data.exists():
-                # 计算平均值
-                avg_temp_values = [d.temperature for d in interval_data if d.temperature is not None]
-                avg_temp = sum(avg_temp_values) / len(avg_temp_values) if avg_temp_values else 25.0
-                
-                avg_humidity = sum(d.humidity for d in interval_data) / interval_data.count()
-                avg_light = sum(d.light for d in interval_data) / interval_data.count()
-                
-                timestamps.append(current_time.isoformat())
-                temperature_values.append(round(avg_temp, 1))
-                humidity_values.append(round(avg_humidity, 1))
-                light_values.append(round(avg_light, 1))
-            
-            current_time = interval_end
+        # 间隔为整小时/整天时读取最粗的可用汇总，否则一次查询聚合原始数据（见charts）
+        rollup_resolution = rollups.coarsest_resolution(interval_minutes)
+        if rollup_resolution and request.query_params.get('resolution', 'auto') != 'raw':
+            chart = aggregate_rollups(SensorRollup.objects.filter(
+                source='sensor',
+                resolution=rollup_resolution,
+                bucket_start__gte=rollups.bucket_start(start_time, rollup_resolution),
+            ), interval_minutes)
+        else:
+            # 最近的数据（默认25小时内）直接用内存中的数组聚合，更早的范围读取数据库
+            arrays = recent_window.chart_arrays(start_time)
+            if arrays is not None:
+                chart = aggregate_sensor_arrays(*arrays, interval_minutes)
+            else:
+                # 按月分表后只查询start_time之后的分表和主表（见sensor_shards）
+                rows = sensor_shards.router.values_list(SENSOR_CHART_FIELDS, start=start_time)
+                chart = aggregate_sensor_rows(rows, interval_minutes)
+        timestamps = chart['timestamps']
+        temperature_values = chart['temperature']
+        humidity_values = chart['humidity']
+        light_values = chart['light']
         
-        # 确保返回的数据点不超过最大限制，同时保留足够的数据点
-        if len(timestamps) > 500:
-            step = len(timestamps) // 500 + 1
-            timestamps = timestamps[::step]
-            temperature_values = temperature_values[::step]
-            humidity_values = humidity_values[::step]
-            light_values = light_values[::step]
+        # 数据点超过max_points时用LTTB降采样，三条曲线共用一组时间戳，保留峰谷
+        if len(timestamps) > max_points:
+            x = [datetime.fromisoformat(t).timestamp() for t in timestamps]
+            indices = lttb_indices(x, [temperature_values, humidity_values, light_values], max_points)
+            timestamps = take(timestamps, indices)
+            temperature_values = take(temperature_values, indices)
+            humidity_values = take(humidity_values, indices)
+            light_values = take(light_values, indices)
         
         return Response({
             'timestamps': timestamps,
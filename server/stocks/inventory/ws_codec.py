@@ -0,0 +1,227 @@
+"""
+WebSocket (RFC 6455) 最小实现
+
+只依赖标准库，基于asyncio的StreamReader/StreamWriter，供传感器数据直连入库(sensor_bridge.py)
+连接WebSocket服务器，以及基准命令(bench_sensor_bridge)模拟WebSocket服务器使用。
+
+支持文本/二进制消息、分片、ping/pong和关闭握手，不支持扩展（如permessage-deflate）。
+客户端发送的帧按协议要求加掩码，服务器发送的帧不加掩码。
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# 握手响应中Sec-WebSocket-Accept的计算用常量
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# 单条消息的最大长度
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+# 握手响应头的最大长度
+MAX_HEADER_SIZE = 64 * 1024
+
+
+class WebSocketError(Exception):
+    """握手失败或帧格式错误"""
+
+
+def accept_key(key):
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+def encode_frame(opcode, payload=b'', mask=False):
+    """编码一个完整（FIN=1）的帧"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if not mask:
+        return bytes(header) + payload
+    key = os.urandom(4)
+    return bytes(header) + key + _apply_mask(payload, key)
+
+
+def _apply_mask(payload, key):
+    # 整段按大整数异或，比逐字节循环快得多
+    if not payload:
+        return b''
+    repeated = (key * (len(payload) // 4 + 1))[:len(payload)]
+    masked = int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')
+    return masked.to_bytes(len(payload), 'big')
+
+
+async def read_frame(reader, max_size=MAX_MESSAGE_SIZE):
+    """读取一个帧，返回 (fin, opcode, payload)；连接在帧边界关闭时返回None"""
+    try:
+        first, second = await reader.readexactly(2)
+    except asyncio.IncompleteReadError:
+        return None
+    fin = bool(first & 0x80)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > max_size:
+        raise WebSocketError(f'帧长度超过限制: {length}')
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if key is not None:
+        payload = _apply_mask(payload, key)
+    return fin, opcode, payload
+
+
+async def _read_headers(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise WebSocketError('握手头过长')
+    except asyncio.IncompleteReadError:
+        raise WebSocketError('握手期间连接关闭')
+    if len(head) > MAX_HEADER_SIZE:
+        raise WebSocketError('握手头过长')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+class WebSocketConnection:
+    """一条已完成握手的WebSocket连接"""
+
+    def __init__(self, reader, writer, is_client=True):
+        self.reader = reader
+        self.writer = writer
+        self.is_client = is_client
+        self.closed = False
+
+    async def recv(self):
+        """接收一条完整消息（文本返回str，二进制返回bytes）；连接关闭时返回None"""
+        fragments = []
+        message_opcode = None
+        while True:
+            frame = await read_frame(self.reader)
+            if frame is None:
+                self.closed = True
+                return None
+            fin, opcode, payload = frame
+            if opcode == OP_PING:
+                await self._send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                if not self.closed:
+                    self.closed = True
+                    await self._send(OP_CLOSE, payload[:2])
+                return None
+            if opcode != OP_CONTINUATION:
+                message_opcode = opcode
+            elif message_opcode is None:
+                raise WebSocketError('收到未开始的分片')
+            fragments.append(payload)
+            if sum(len(fragment) for fragment in fragments) > MAX_MESSAGE_SIZE:
+                raise WebSocketError('消息长度超过限制')
+            if fin:
+                data = b''.join(fragments)
+                return data.decode('utf-8') if message_opcode == OP_TEXT else data
+
+    async def send(self, message):
+        opcode = OP_TEXT if isinstance(message, str) else OP_BINARY
+        await self._send(opcode, message)
+
+    async def _send(self, opcode, payload):
+        self.writer.write(encode_frame(opcode, payload, mask=self.is_client))
+        await self.writer.drain()
+
+    async def close(self, code=1000):
+        if not self.closed:
+            self.closed = True
+            try:
+                await self._send(OP_CLOSE, struct.pack('!H', code))
+            except (ConnectionError, RuntimeError):
+                pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+async def connect(url, timeout=10):
+    """连接ws://或wss://地址并完成握手，返回WebSocketConnection"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('ws', 'wss'):
+        raise WebSocketError(f'不支持的地址: {url}')
+    secure = parts.scheme == 'wss'
+    host = parts.hostname
+    port = parts.port or (443 if secure else 80)
+    path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=ssl.create_default_context() if secure else None),
+        timeout,
+    )
+    try:
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        writer.write((
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {parts.netloc}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n\r\n'
+        ).encode('latin-1'))
+        await writer.drain()
+        status, headers = await asyncio.wait_for(_read_headers(reader), timeout)
+        if ' 101 ' not in f'{status} ':
+            raise WebSocketError(f'握手失败: {status}')
+        if headers.get('sec-websocket-accept') != accept_key(key):
+            raise WebSocketError('握手失败: Sec-WebSocket-Accept不匹配')
+    except BaseException:
+        writer.close()
+        raise
+    return WebSocketConnection(reader, writer, is_client=True)
+
+
+async def accept(reader, writer):
+    """服务器端：读取客户端握手请求并响应，返回 (请求路径, WebSocketConnection)"""
+    request_line, headers = await _read_headers(reader)
+    key = headers.get('sec-websocket-key')
+    if headers.get('upgrade', '').lower() != 'websocket' or not key:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        await writer.drain()
+        writer.close()
+        raise WebSocketError(f'不是WebSocket握手请求: {request_line}')
+    writer.write((
+        'HTTP/1.1 101 Switching Protocols\r\n'
+        'Upgrade: websocket\r\n'
+        'Connection: Upgrade\r\n'
+        f'Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n'
+    ).encode('latin-1'))
+    await writer.drain()
+    path = request_line.split(' ')[1] if request_line.count(' ') >= 2 else '/'
+    return path, WebSocketConnection(reader, writer, is_client=False)
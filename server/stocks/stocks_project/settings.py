@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 from datetime import timedelta
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -127,6 +128,24 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# 缓存配置：默认使用进程内缓存；多个worker需要共享传感器最新值时设置REDIS_URL使用Redis
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+SENSOR_LATEST_CACHE = 'default'  # 传感器最新值缓存使用的缓存别名
+# 缓存过期时间（秒），None为不过期。传感器数据由独立进程写入（manage.py sensor_bridge）且没有Redis时，
+# web进程的进程内缓存收不到写入进程的更新，需要设置较短的过期时间，例如 SENSOR_LATEST_CACHE_TIMEOUT=1
+SENSOR_LATEST_CACHE_TIMEOUT = int(os.environ['SENSOR_LATEST_CACHE_TIMEOUT']) if os.environ.get('SENSOR_LATEST_CACHE_TIMEOUT') else None
+# 进程内的传感器最近数据窗口（inventory.recent_window）：保留最近多少小时、最多多少条，
+# 起点在窗口内的图表不查询数据库。其他进程写入的数据每隔 SENSOR_RECENT_SYNC_INTERVAL 秒按主键补读一次
+SENSOR_RECENT_WINDOW_HOURS = 25
+SENSOR_RECENT_CAPACITY = 200000
+SENSOR_RECENT_SYNC_INTERVAL = 1.0
+
 # REST Framework配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -1,9 +1,17 @@
+"""
+少量测试数据：逐条发送到add_data接口，模拟传感器实时上报
+
+需要批量生成多月的模拟数据（填充数据库、压测图表接口）时使用：
+    python manage.py generate_sensor_data --help
+"""
+import os
 import requests
 import random
 import time
 from datetime import datetime
 import logging
-import sqlite3
+
+import django
 
 # 配置日志
 logging.basicConfig(
@@ -18,44 +26,41 @@ logger = logging.getLogger("TestData")
 
 # API地址
 API_URL = "http://localhost:8000/api/sensor-data/add_data/"
-DB_PATH = "db.sqlite3"
 
 def update_temperature_values():
     """
     更新数据库中的空温度值
+    
+    bulk_update不触发信号，更新后与generate_sensor_data相同，重算受影响的小时/天汇总并清空最新值缓存；
+    正在运行的服务的最近数据窗口在下一次重新加载（recent_window.RELOAD_INTERVAL）后生效。
     """
-    logger.info("开始更新现有数据的温度值")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "stocks_project.settings")
+    django.setup()
+    from django.db import transaction
+    from inventory import rollups
+    from inventory.latest_cache import latest_cache
+    from inventory.models import SensorData
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    logger.info("开始更新现有数据的温度值")
     
     # 获取所有温度为NULL的记录
-    cursor.execute("SELECT id FROM inventory_sensordata WHERE temperature IS NULL")
-    null_temp_ids = cursor.fetchall()
+    records = list(SensorData.objects.filter(temperature__isnull=True).only("id", "timestamp"))
     
-    if not null_temp_ids:
+    if not records:
         logger.info("没有找到温度为NULL的记录")
-        conn.close()
         return
     
-    logger.info(f"找到{len(null_temp_ids)}条温度为NULL的记录")
-    
-    for (id,) in null_temp_ids:
-        # 生成合理的温度值
-        temp = round(random.uniform(20.0, 28.0), 2)
-        
-        # 更新记录
-        cursor.execute(
-            "UPDATE inventory_sensordata SET temperature = ? WHERE id = ?",
-            (temp, id)
-        )
-        logger.info(f"已更新ID={id}的记录，温度值={temp}")
+    logger.info(f"找到{len(records)}条温度为NULL的记录")
     
-    # 提交更改
-    conn.commit()
-    logger.info(f"成功更新了{len(null_temp_ids)}条记录")
+    for record in records:
+        record.temperature = round(random.uniform(20.0, 28.0), 2)
+    # 批量更新，汇总在同一事务中重算
+    with transaction.atomic():
+        SensorData.objects.bulk_update(records, ["temperature"], batch_size=1000)
+        rollups.refresh("sensor", [record.timestamp for record in records])
+    latest_cache.invalidate("sensor")
     
-    conn.close()
+    logger.info(f"成功更新了{len(records)}条记录")
 
 def generate_random_data():
     """
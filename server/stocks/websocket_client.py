@@ -1,5 +1,7 @@
 import websocket
 import json
+import os
+import threading
 import time
 import requests
 import logging
@@ -18,7 +20,159 @@ logger = logging.getLogger("WebSocketClient")
 
 # 配置
 WEBSOCKET_URL = "ws://localhost:8080"  # WebSocket服务器地址
-API_URL = "http://localhost:8000/api/sensor-data/add_data/"  # Django API地址
+API_URL = "http://localhost:8000/api/sensor-data/add_data_bulk/"  # Django批量写入API地址
+BATCH_SIZE = 200  # 缓冲区达到该条数时立即提交
+FLUSH_INTERVAL = 1.0  # 最长缓冲时间（秒）
+REQUEST_TIMEOUT = 10  # 单次提交的超时时间（秒）
+SPOOL_DIR = "sensor_spool"  # Django不可用时数据暂存的目录
+MAX_SPOOL_FILES = 10000  # 暂存批次上限，超过时丢弃最旧的批次
+RETRY_INTERVAL = 5  # Django不可用后首次重试的间隔（秒），之后逐次加倍
+MAX_RETRY_INTERVAL = 60
+
+
+class SensorForwarder:
+    """
+    把WebSocket收到的传感器数据批量转发到Django
+
+    - 使用同一个requests.Session，复用keep-alive连接
+    - 数据先进入内存缓冲区，达到BATCH_SIZE条或等待FLUSH_INTERVAL秒后由后台线程一次提交
+    - Django不可用（连接失败、超时、5xx）时，批次按顺序写入SPOOL_DIR下的文件；
+      之后按退避间隔重试，恢复后先按顺序补发暂存的批次，再提交新数据
+    - 4xx表示数据本身有问题，重试也不会成功，记录日志后丢弃
+    """
+
+    def __init__(self, api_url=API_URL, spool_dir=SPOOL_DIR, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.api_url = api_url
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.session = requests.Session()
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._retry_at = 0.0
+        self._retry_interval = RETRY_INTERVAL
+        self._spool_seq = 0
+        self._thread = threading.Thread(target=self._run, name="sensor-forwarder", daemon=True)
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+    def start(self):
+        pending = len(self._spool_files())
+        if pending:
+            logger.info(f"发现{pending}个暂存批次，Django可用后补发")
+        self._thread.start()
+
+    def add(self, reading):
+        with self._cond:
+            self._buffer.append(reading)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def wake(self):
+        """立即重试暂存数据（例如重新连接后），不等待退避间隔"""
+        with self._cond:
+            self._retry_at = 0.0
+            self._cond.notify()
+
+    def close(self):
+        """停止后台线程，缓冲区中剩余的数据提交或写入暂存"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self.session.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._buffer) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                # 每批最多BATCH_SIZE条；提交较慢时缓冲区会积压，剩余的数据不等待，下一轮立即提交
+                batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+                stopping = self._stopping and not self._buffer
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                logger.error(f"转发数据时发生未知错误: {str(e)}")
+                if batch:
+                    self._spool(batch)
+            if stopping:
+                return
+
+    def _deliver(self, batch):
+        # 有暂存数据时先补发，保证数据按接收顺序写入；补发未完成时新批次也进入暂存
+        if self._spool_files() and not self._replay():
+            if batch:
+                self._spool(batch)
+            return
+        if batch and not self._post(batch):
+            self._spool(batch)
+
+    def _post(self, batch):
+        """提交一个批次；返回False表示Django不可用，需要暂存后重试"""
+        try:
+            response = self.session.post(self.api_url, json=batch, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            self._backoff(f"API请求失败: {str(e)}")
+            return False
+        if response.status_code >= 500:
+            self._backoff(f"API服务器错误, 状态码: {response.status_code}")
+            return False
+
+        self._retry_interval = RETRY_INTERVAL
+        if response.status_code == 201:
+            result = response.json()
+            logger.info(f"数据成功保存: {result['created']}条")
+            for error in result['errors']:
+                logger.error(f"数据未保存: {batch[error['index']]}, 原因: {error['errors']}")
+        else:
+            logger.error(f"保存数据失败: {response.text}, 状态码: {response.status_code}, 丢弃{len(batch)}条数据")
+        return True
+
+    def _backoff(self, reason):
+        logger.error(f"{reason}，{self._retry_interval}秒后重试")
+        self._retry_at = time.monotonic() + self._retry_interval
+        self._retry_interval = min(self._retry_interval * 2, MAX_RETRY_INTERVAL)
+
+    # --------------- 本地暂存 ---------------
+    def _spool_files(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+
+    def _spool(self, batch):
+        files = self._spool_files()
+        for name in files[:max(0, len(files) - MAX_SPOOL_FILES + 1)]:
+            logger.warning(f"暂存批次超过{MAX_SPOOL_FILES}个，丢弃最旧的批次: {name}")
+            os.remove(os.path.join(self.spool_dir, name))
+        # 文件名按写入顺序排序；先写临时文件再改名，进程中断时不会留下不完整的批次
+        self._spool_seq += 1
+        name = f"{time.time_ns():020d}-{self._spool_seq:06d}.json"
+        path = os.path.join(self.spool_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(batch, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        logger.warning(f"Django不可用，{len(batch)}条数据已暂存: {name}")
+
+    def _replay(self):
+        """按顺序补发暂存的批次，全部补发成功时返回True"""
+        if time.monotonic() < self._retry_at:
+            return False
+        for name in self._spool_files():
+            path = os.path.join(self.spool_dir, name)
+            with open(path, encoding="utf-8") as f:
+                batch = json.load(f)
+            if not self._post(batch):
+                return False
+            os.remove(path)
+            logger.info(f"暂存批次补发完成: {name}, {len(batch)}条")
+        return True
+
+
+forwarder = None
+
 
 def on_message(ws, message):
     """
@@ -27,27 +181,20 @@ def on_message(ws, message):
     try:
         # 解析JSON消息
         data = json.loads(message)
-        logger.info(f"接收到数据: {data}")
-        
+        logger.debug(f"接收到数据: {data}")
+
         # 检查数据格式是否符合预期
         if data.get("type") == "emit" and "humidity" in data and "light" in data:
-            # 确保时间戳存在，如果不存在则添加当前时间
+            # 确保时间戳存在，如果不存在则添加当前时间（接收时间，暂存后补发也不会改变）
             if "timestamp" not in data:
                 data["timestamp"] = datetime.now().isoformat()
-            
-            # 发送数据到Django API
-            response = requests.post(API_URL, json=data)
-            
-            if response.status_code == 201:
-                logger.info(f"数据成功保存: {response.json()}")
-            else:
-                logger.error(f"保存数据失败: {response.text}, 状态码: {response.status_code}")
+
+            # 加入缓冲区，由后台线程批量发送到Django API
+            forwarder.add(data)
         else:
             logger.warning(f"收到的数据格式不符合预期: {data}")
     except json.JSONDecodeError:
         logger.error(f"解析JSON失败: {message}")
-    except requests.RequestException as e:
-        logger.error(f"API请求失败: {str(e)}")
     except Exception as e:
         logger.error(f"处理消息时发生未知错误: {str(e)}")
 
@@ -68,13 +215,18 @@ def on_open(ws):
     处理WebSocket连接打开
     """
     logger.info("WebSocket连接已打开")
+    # 重新连接后立即尝试补发暂存的数据
+    forwarder.wake()
 
 def run_websocket_client():
     """
     运行WebSocket客户端
     """
+    global forwarder
+    forwarder = SensorForwarder()
+    forwarder.start()
     logger.info(f"尝试连接到WebSocket服务器: {WEBSOCKET_URL}")
-    
+
     # 创建WebSocket连接
     ws = websocket.WebSocketApp(
         WEBSOCKET_URL,
@@ -83,17 +235,21 @@ def run_websocket_client():
         on_error=on_error,
         on_close=on_close
     )
-    
+
     # 设置永久运行，断开后自动重连
-    while True:
-        try:
-            ws.run_forever()
-            logger.info("WebSocket连接已断开，5秒后尝试重新连接...")
-            time.sleep(5)
-        except Exception as e:
-            logger.error(f"WebSocket客户端运行错误: {str(e)}")
-            logger.info("5秒后尝试重新连接...")
-            time.sleep(5)
+    try:
+        while True:
+            try:
+                ws.run_forever()
+                logger.info("WebSocket连接已断开，5秒后尝试重新连接...")
+                time.sleep(5)
+            except Exception as e:
+                logger.error(f"WebSocket客户端运行错误: {str(e)}")
+                logger.info("5秒后尝试重新连接...")
+                time.sleep(5)
+    finally:
+        # 退出前提交缓冲区中的数据，Django不可用时写入暂存
+        forwarder.close()
 
 if __name__ == "__main__":
-    run_websocket_client() 
\ No newline at end of file
+    run_websocket_client()